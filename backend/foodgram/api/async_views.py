@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.urls import URLPattern
+
+from .db import check_connections
+
+# Самые нагруженные эндпоинты чтения (имена маршрутов DefaultRouter).
+ASYNC_VIEW_NAMES = frozenset((
+    'recipes-list',
+    'recipes-detail',
+    'tags-list',
+    'tags-detail',
+    'ingredients-list',
+    'ingredients-detail',
+    'users-subscriptions',
+))
+
+executor = None
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_VIEW_THREADS,
+            thread_name_prefix='async-view'
+        )
+    return executor
+
+
+def run_view(view, request, *args, **kwargs):
+    """Выполняет синхронное представление в потоке пула.
+
+    Повторяет то, что Django делает для синхронного представления:
+    транзакция ATOMIC_REQUESTS и рендеринг ответа. Соединения с БД
+    у каждого потока пула свои, поэтому устаревшие закрываются
+    и проверяются до запроса и закрываются после него (как по сигналам
+    request_started/finished).
+    """
+    close_old_connections()
+    check_connections()
+    try:
+        non_atomic = getattr(view, '_non_atomic_requests', set())
+        with ExitStack() as stack:
+            for db in connections.all():
+                if (db.settings_dict['ATOMIC_REQUESTS']
+                        and db.alias not in non_atomic):
+                    stack.enter_context(transaction.atomic(using=db.alias))
+            response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response = response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Асинхронная обертка синхронного представления DRF.
+
+    В Django 3.2 под ASGI синхронные представления выполняются
+    в одном общем потоке (thread_sensitive), то есть по одному
+    запросу на процесс. Обертка выполняет представление в пуле
+    из ASYNC_VIEW_THREADS потоков, а цикл событий тем временем
+    обслуживает медленных клиентов и другие запросы.
+    """
+    run = sync_to_async(
+        run_view, thread_sensitive=False, executor=get_executor()
+    )
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run(view, request, *args, **kwargs)
+
+    # Транзакцию открывает run_view: Django не разрешает
+    # ATOMIC_REQUESTS для асинхронных представлений.
+    wrapper._non_atomic_requests = set(settings.DATABASES)
+    return wrapper
+
+
+def async_urlpatterns(patterns, names=ASYNC_VIEW_NAMES):
+    """Заменяет представления маршрутов names асинхронными обертками."""
+    return [
+        URLPattern(
+            pattern.pattern, async_view(pattern.callback),
+            pattern.default_args, pattern.name
+        )
+        if isinstance(pattern, URLPattern) and pattern.name in names
+        else pattern
+        for pattern in patterns
+    ]
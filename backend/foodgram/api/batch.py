@@ -0,0 +1,205 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.counters import (RECIPE_COUNTERS, USER_COUNTERS, recount,
+                              update_counters)
+from recipes.models import Recipe
+from recipes.shopping_list import change_cart, lock_owners
+from users.models import User
+from .validators import id_error, to_id
+from .viewer_state import KINDS, ViewerState
+
+# Пакетная операция над связью пользователя с объектами: вид состояния
+# ViewerState (модель связи и ее поля - из KINDS), модель объектов,
+# поле счетчика объекта, все счетчики модели объектов (для пересчета)
+# и функция переноса изменений (owner_id, added, removed) в производные
+# данные.
+BatchRelation = namedtuple(
+    'BatchRelation', ('kind', 'target', 'counter', 'counters', 'on_change')
+)
+
+FAVORITES = BatchRelation(
+    'favorites', Recipe, 'favorites_count', RECIPE_COUNTERS, None
+)
+CART = BatchRelation(
+    'cart', Recipe, 'in_carts_count', RECIPE_COUNTERS, change_cart
+)
+FOLLOWING = BatchRelation(
+    'following', User, 'followers_count', USER_COUNTERS, None
+)
+
+# Результаты для элементов "add" и "remove".
+ADDED, EXISTS = 'added', 'exists'
+REMOVED, ABSENT = 'removed', 'absent'
+INVALID, NOT_FOUND = 'invalid', 'not_found'
+DUPLICATE, CONFLICT, SELF = 'duplicate', 'conflict', 'self'
+
+
+def parse_batch(data):
+    """Списки id "add" и "remove" тела запроса или ответ с ошибкой."""
+    if not isinstance(data, dict):
+        return None, [id_error('invalid', 'Ожидается объект {add, remove}')]
+    lists, errors = {}, []
+    for field in ('add', 'remove'):
+        values = data.get(field, [])
+        if not isinstance(values, list):
+            errors.append(id_error('invalid', f'{field}: ожидается список id'))
+        lists[field] = values
+    if errors:
+        return None, errors
+    size = len(lists['add']) + len(lists['remove'])
+    if size > settings.BATCH_MAX_SIZE:
+        return None, [id_error(
+            'too_many',
+            f'Не больше {settings.BATCH_MAX_SIZE} id в одном запросе'
+        )]
+    return lists, []
+
+
+def classify(values, other):
+    """Проверка списка id: результаты по позициям и id к обработке.
+
+    Позиции неверных и повторяющихся id, а также id, которые есть
+    и в другом списке (other), сразу получают результат; у остальных
+    результат None до обработки.
+    """
+    results, ids, seen = [], [], set()
+    for value in values:
+        pk = to_id(value)
+        if pk is None:
+            results.append(INVALID)
+        elif pk in other:
+            results.append(CONFLICT)
+        elif pk in seen:
+            results.append(DUPLICATE)
+        else:
+            results.append(None)
+            seen.add(pk)
+            ids.append(pk)
+    return results, ids
+
+
+def insert_links(model, user_field, object_field, user, object_ids):
+    """Вставляет связи пользователя с объектами одним bulk_create.
+
+    Возвращает id объектов, связи с которыми действительно вставлены.
+    Вставка выполняется без ignore_conflicts: связь, которую успели
+    вставить в обход блокировки пользователя (например, в админке),
+    не должна считаться добавленной. При конфликте вставка
+    повторяется без уже существующих связей.
+    """
+    while object_ids:
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([
+                    model(**{user_field: user, object_field: pk})
+                    for pk in object_ids
+                ])
+            return object_ids
+        except IntegrityError:
+            existing = set(model.objects.filter(**{
+                user_field: user, f'{object_field}__in': object_ids
+            }).values_list(object_field, flat=True))
+            if not existing:
+                raise
+            object_ids = [pk for pk in object_ids if pk not in existing]
+    return object_ids
+
+
+def apply_batch(request, relation):
+    """Добавляет и удаляет связи пользователя с объектами пакетом.
+
+    Тело запроса: {"add": [id, ...], "remove": [id, ...]}. Ответ
+    содержит результат для каждого элемента в порядке запроса.
+    Число запросов к БД не зависит от размера пакета: связи
+    вставляются одним bulk_create (см. "insert_links") и удаляются
+    одним delete() по списку id. bulk_create не отправляет сигналов,
+    поэтому кеш ViewerState для добавленных связей обновляется здесь;
+    для удаленных его обновляют сигналы post_delete. Счетчики и списки
+    покупок обновляются здесь же.
+
+    Строка пользователя блокируется (SELECT FOR UPDATE), как и в
+    эндпоинтах отдельных объектов: изменения связей одного
+    пользователя выполняются по очереди, и проверка существующих
+    связей не устаревает до записи.
+    """
+    lists, errors = parse_batch(request.data)
+    if errors:
+        return Response(
+            {'errors': errors}, status=status.HTTP_400_BAD_REQUEST
+        )
+    model, user_field, object_field = KINDS[relation.kind]
+    user = request.user
+    add_values = {to_id(value) for value in lists['add']} - {None}
+    remove_values = {to_id(value) for value in lists['remove']} - {None}
+    add_results, add_ids = classify(lists['add'], remove_values)
+    remove_results, remove_ids = classify(lists['remove'], add_values)
+
+    lock_owners([user.pk])
+    found = set(
+        relation.target.objects.filter(
+            pk__in=add_ids + remove_ids
+        ).values_list('pk', flat=True)
+    )
+    existing = dict(
+        model.objects.filter(**{
+            user_field: user, f'{object_field}__in': found
+        }).values_list(object_field, 'pk')
+    )
+    outcomes, added, removed = {'add': {}, 'remove': {}}, [], []
+    for pk in add_ids:
+        if pk not in found:
+            outcomes['add'][pk] = NOT_FOUND
+        elif relation.target is User and pk == user.pk:
+            outcomes['add'][pk] = SELF
+        elif pk in existing:
+            outcomes['add'][pk] = EXISTS
+        else:
+            outcomes['add'][pk] = ADDED
+            added.append(pk)
+    for pk in remove_ids:
+        if pk not in found:
+            outcomes['remove'][pk] = NOT_FOUND
+        elif pk in existing:
+            outcomes['remove'][pk] = REMOVED
+            removed.append(pk)
+        else:
+            outcomes['remove'][pk] = ABSENT
+
+    if added:
+        inserted = insert_links(model, user_field, object_field, user, added)
+        for pk in set(added) - set(inserted):
+            outcomes['add'][pk] = EXISTS
+        added = inserted
+        update_counters(
+            relation.target.objects.filter(pk__in=added),
+            **{relation.counter: 1}
+        )
+    if removed:
+        deleted, _ = model.objects.filter(
+            pk__in=[existing[pk] for pk in removed]
+        ).delete()
+        targets = relation.target.objects.filter(pk__in=removed)
+        if deleted == len(removed):
+            update_counters(targets, **{relation.counter: -1})
+        else:
+            # Часть связей удалена в обход блокировки (например,
+            # в админке): счетчики этих объектов пересчитываются.
+            recount(targets, relation.counters)
+    if relation.on_change is not None:
+        relation.on_change(user.pk, added, removed)
+    if added:
+        ViewerState.write_through(user.pk, relation.kind, added, True)
+    return Response({
+        field: [
+            {'id': value, 'result': result or outcomes[field][to_id(value)]}
+            for value, result in zip(lists[field], results)
+        ]
+        for field, results in (
+            ('add', add_results), ('remove', remove_results)
+        )
+    })
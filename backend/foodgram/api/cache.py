@@ -0,0 +1,237 @@
+import hashlib
+import json
+import time
+import uuid
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.http import parse_etags, urlencode
+from rest_framework import status
+from rest_framework.response import Response
+
+from foodgram.routers import use_primary
+
+TAGS_CACHE_KEY = 'tags:list'
+INGREDIENTS_CACHE_KEY = 'ingredients:list'
+
+# Версии кеша ответов анонимным пользователям: списков рецептов,
+# отдельного рецепта и общая (теги, ингредиенты, авторы).
+RECIPE_LIST_VERSION_KEY = 'responses:version:recipes'
+RECIPE_VERSION_KEY = 'responses:version:recipe:{pk}'
+SHARED_VERSION_KEY = 'responses:version:shared'
+RESPONSE_CACHE_KEY = 'responses:{scope}:{versions}:{digest}'
+RESPONSE_LOCK_KEY = 'responses:lock:{key}'
+RESPONSE_STATS_KEY = 'responses:stats:{event}'
+RESPONSE_STATS_EVENTS = ('hit', 'miss', 'coalesced')
+# Параметры, не влияющие на ответ анонимному пользователю.
+IGNORED_PARAMS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def make_etag(data):
+    """Сильный ETag - хеш канонического JSON-представления данных."""
+    content = json.dumps(
+        data, cls=DjangoJSONEncoder, ensure_ascii=False, sort_keys=True
+    )
+    return '"{}"'.format(hashlib.sha1(content.encode()).hexdigest())
+
+
+def etag_response(request, etag, data):
+    """Ответ с заголовком ETag либо 304, если ETag совпал с If-None-Match."""
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        return Response(
+            status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag}
+        )
+    return Response(data, headers={'ETag': etag})
+
+
+class CachedListMixin:
+    """Кеширует сериализованный список объектов вместе с его ETag.
+
+    Повторный запрос не обращается к БД и не сериализует данные,
+    а при совпадении If-None-Match получает пустой ответ 304.
+    Кеш сбрасывается сигналами (см. api.signals).
+    """
+
+    list_cache_key = None
+
+    def get_list_data(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        return list(self.get_serializer(queryset, many=True).data)
+
+    def list(self, request, *args, **kwargs):
+        cached = cache.get(self.list_cache_key)
+        if cached is None:
+            with use_primary():
+                data = self.get_list_data()
+            cached = (make_etag(data), data)
+            cache.set(
+                self.list_cache_key, cached,
+                settings.REFERENCE_CACHE_TIMEOUT
+            )
+        return etag_response(request, *cached)
+
+
+def invalidate_list(key):
+    """Сбрасывает кеш списка (см. CachedListMixin) после коммита.
+
+    Запрос, прочитавший БД до коммита, иначе снова сохранил бы
+    в кеше старый список на REFERENCE_CACHE_TIMEOUT.
+    """
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def bump_versions(*keys):
+    """Меняет версии кеша ответов; старые ответы больше не читаются.
+
+    Версия - случайное значение, а не счетчик: после вытеснения
+    ключа версии из кеша она не может совпасть с прежней.
+    """
+    cache.set_many(
+        {key: uuid.uuid4().hex for key in keys}, None
+    )
+
+
+def get_versions(keys):
+    """Текущие версии кеша ответов.
+
+    Отсутствующая версия (ключ вытеснен или еще не создан) создается
+    случайной: ответы, сохраненные до вытеснения, больше не читаются.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = uuid.uuid4().hex
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return versions
+
+
+def invalidate_recipe_responses(recipe_id):
+    transaction.on_commit(lambda: bump_versions(
+        RECIPE_LIST_VERSION_KEY, RECIPE_VERSION_KEY.format(pk=recipe_id)
+    ))
+
+
+def invalidate_shared_responses():
+    transaction.on_commit(lambda: bump_versions(SHARED_VERSION_KEY))
+
+
+def count_event(event):
+    key = RESPONSE_STATS_KEY.format(event=event)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_response_stats():
+    """Счетчики кеша ответов: {"hit": ..., "miss": ..., "coalesced": ...}."""
+    keys = {
+        RESPONSE_STATS_KEY.format(event=event): event
+        for event in RESPONSE_STATS_EVENTS
+    }
+    values = cache.get_many(keys)
+    return {event: values.get(key, 0) for key, event in keys.items()}
+
+
+def normalize_query(request):
+    """Параметры запроса в каноническом порядке, без игнорируемых."""
+    return urlencode(sorted(
+        (name, value)
+        for name in request.query_params
+        if name not in IGNORED_PARAMS
+        for value in request.query_params.getlist(name)
+        if value != ''
+    ))
+
+
+class AnonymousResponseCacheMixin:
+    """Кеш ответов list и retrieve для анонимных пользователей.
+
+    Ключ ответа строится из нормализованных параметров запроса,
+    хоста (в ответе абсолютные ссылки) и версий данных. Изменение
+    рецепта меняет версию списков и этого рецепта, изменение тегов,
+    ингредиентов или авторов - общую версию (см. api.signals),
+    поэтому сброс кеша - это запись одного-двух ключей.
+
+    Одновременные промахи по одному ключу объединяются: ответ
+    вычисляет запрос, получивший блокировку, остальные ждут его
+    результата до RESPONSE_CACHE_WAIT секунд. Попадания, промахи
+    и объединенные запросы подсчитываются (см. get_response_stats),
+    статус виден в заголовке X-Cache.
+    """
+
+    def get_response_cache_key(self, request, scope, version_keys):
+        versions = get_versions(version_keys)
+        digest = hashlib.sha1('|'.join((
+            request.scheme, request.get_host(),
+            request.accepted_renderer.format, normalize_query(request),
+        )).encode()).hexdigest()
+        return RESPONSE_CACHE_KEY.format(
+            scope=scope,
+            versions='.'.join(versions[key] for key in version_keys),
+            digest=digest
+        )
+
+    def cached_response(self, request, scope, version_keys, compute):
+        if not request.user.is_anonymous or request.method != 'GET':
+            return compute()
+        key = self.get_response_cache_key(request, scope, version_keys)
+        cached = cache.get(key)
+        if cached is not None:
+            count_event('hit')
+            return self.cache_status(etag_response(request, *cached), 'HIT')
+        lock = RESPONSE_LOCK_KEY.format(key=key)
+        locked = cache.add(lock, 1, settings.RESPONSE_CACHE_LOCK_TIMEOUT)
+        if not locked:
+            deadline = time.monotonic() + settings.RESPONSE_CACHE_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(settings.RESPONSE_CACHE_POLL_INTERVAL)
+                cached = cache.get(key)
+                if cached is not None:
+                    count_event('coalesced')
+                    return self.cache_status(
+                        etag_response(request, *cached), 'HIT'
+                    )
+        try:
+            with use_primary():
+                response = compute()
+            if response.status_code == status.HTTP_200_OK:
+                data = response.data
+                cached = (make_etag(data), data)
+                cache.set(key, cached, settings.RESPONSE_CACHE_TIMEOUT)
+                response['ETag'] = cached[0]
+        finally:
+            if locked:
+                cache.delete(lock)
+        count_event('miss')
+        return self.cache_status(response, 'MISS')
+
+    @staticmethod
+    def cache_status(response, value):
+        response['X-Cache'] = value
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, 'list', [RECIPE_LIST_VERSION_KEY, SHARED_VERSION_KEY],
+            partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        compute = partial(super().retrieve, request, *args, **kwargs)
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if not str(pk).isdigit():
+            return compute()
+        pk = int(pk)
+        return self.cached_response(
+            request, f'recipe:{pk}',
+            [RECIPE_VERSION_KEY.format(pk=pk), SHARED_VERSION_KEY],
+            compute
+        )
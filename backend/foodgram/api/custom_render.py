@@ -1,10 +1,135 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
 from rest_framework.renderers import BaseRenderer
 
 
-class PlainTextRenderer(BaseRenderer):
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Помимо "render" реализует "render_bytes" - генератор фрагментов
+    ответа для потоковой выдачи строк вида (name, amount, unit).
+    Текстовые рендереры определяют "render_rows" - те же фрагменты
+    в виде строк.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        if isinstance(data, dict):
+            # Ошибки (например, 401 для анонимного пользователя)
+            # приходят словарем, а не списком строк.
+            return json.dumps(data, ensure_ascii=False).encode('utf-8')
+        return b''.join(self.render_bytes(data))
+
+    def render_bytes(self, rows):
+        for chunk in self.render_rows(rows):
+            yield chunk.encode(self.charset)
+
+    def render_rows(self, rows):
+        raise NotImplementedError(
+            'Метод render_rows должен быть переопределен.'
+        )
+
+    @property
+    def content_type(self):
+        if self.charset is None:
+            return self.media_type
+        return f'{self.media_type}; charset={self.charset}'
+
+
+class PlainTextRenderer(ShoppingListRenderer):
     media_type = 'text/plain'
     format = 'txt'
-    charset = 'iso-8859-1'
 
-    def render(self, data, media_type=None, renderer_context=None):
-        return data.encode(self.charset)
+    def render_rows(self, rows):
+        for name, amount, unit in rows:
+            yield f'{name}: {amount}, {unit}\n'
+
+
+class CSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('name', 'amount', 'measurement_unit')
+
+    def render_rows(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.header)
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def render_rows(self, rows):
+        yield '['
+        separator = ''
+        for name, amount, unit in rows:
+            item = json.dumps(
+                {'name': name, 'amount': amount, 'measurement_unit': unit},
+                ensure_ascii=False
+            )
+            yield f'{separator}{item}'
+            separator = ','
+        yield ']'
+
+
+class PDFRenderer(ShoppingListRenderer):
+    """Список покупок в PDF.
+
+    Кириллица выводится шрифтом TrueType из SHOPPING_LIST_PDF_FONT.
+    Документ целиком собирается в памяти: таблица ссылок PDF
+    пишется в конце файла, поэтому ответ отдается одним фрагментом.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    line_height = 18
+    margin = 50
+    title = 'Список покупок'
+
+    def register_font(self):
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_LIST_PDF_FONT)
+            )
+
+    def render_bytes(self, rows):
+        self.register_font()
+        buffer = io.BytesIO()
+        canvas = Canvas(buffer, pagesize=A4)
+        canvas.setTitle(self.title)
+        width, height = A4
+        canvas.setFont(self.font_name, self.font_size + 4)
+        canvas.drawString(self.margin, height - self.margin, self.title)
+        y = height - self.margin - self.line_height * 2
+        canvas.setFont(self.font_name, self.font_size)
+        for name, amount, unit in rows:
+            if y < self.margin:
+                canvas.showPage()
+                canvas.setFont(self.font_name, self.font_size)
+                y = height - self.margin
+            canvas.drawString(self.margin, y, f'{name}: {amount}, {unit}')
+            y -= self.line_height
+        canvas.save()
+        yield buffer.getvalue()
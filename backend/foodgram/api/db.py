@@ -0,0 +1,57 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections, transaction
+from rest_framework.permissions import SAFE_METHODS
+
+
+def check_connections(**kwargs):
+    """Проверка постоянных соединений с БД перед запросом.
+
+    При CONN_MAX_AGE соединение переживает запрос и может быть
+    закрыто сервером или PgBouncer, пока воркер простаивает. Django 3.2
+    проверяет соединение только после ошибки, поэтому открытое
+    соединение проверяется (SELECT 1) не чаще раза в
+    DB_HEALTH_CHECK_INTERVAL секунд и закрывается, если неисправно:
+    следующий запрос откроет новое.
+    """
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        checked_at = getattr(connection, 'health_checked_at', None)
+        if (checked_at is not None
+                and now - checked_at < settings.DB_HEALTH_CHECK_INTERVAL):
+            continue
+        connection.health_checked_at = now
+        if not connection.is_usable():
+            connection.close()
+
+
+class NonAtomicSafeMethodsMixin:
+    """Транзакция ATOMIC_REQUESTS только для изменяющих запросов.
+
+    Django оборачивает в транзакцию все запросы к представлению,
+    в том числе GET. Представление помечается non_atomic_requests,
+    а транзакция открывается в dispatch только для небезопасных
+    методов (POST, PUT, PATCH, DELETE).
+    """
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        view = super().as_view(*args, **kwargs)
+        for alias in settings.DATABASES:
+            view = transaction.non_atomic_requests(using=alias)(view)
+        return view
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                if connection.settings_dict['ATOMIC_REQUESTS']:
+                    stack.enter_context(
+                        transaction.atomic(using=connection.alias)
+                    )
+            return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,90 @@
+import base64
+import binascii
+import hashlib
+import posixpath
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+# Размер порции base64-строки; кратен 4, чтобы порции декодировались
+# независимо друг от друга.
+BASE64_CHUNK_SIZE: int = 64 * 1024
+# Длина префикса sha256 в имени файла изображения.
+NAME_HASH_LENGTH: int = 32
+EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+
+
+class Base64ImageField(serializers.ImageField):
+    """Изображение в виде base64-строки (data URL).
+
+    Строка декодируется порциями во временный файл на диске, так что
+    декодированное изображение не держится в памяти целиком.
+    Файлу дается имя по sha256 содержимого: одинаковые изображения
+    получают одинаковые имена, и их можно кешировать бессрочно.
+    """
+
+    default_error_messages = {
+        'invalid_base64': 'Изображение должно быть передано '
+                          'строкой в формате base64.',
+        'too_large': 'Размер изображения превышает {max_size} байт.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data:
+            self.fail('invalid_base64')
+        _, _, payload = data.rpartition(';base64,')
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if len(payload) * 3 // 4 > max_size:
+            self.fail('too_large', max_size=max_size)
+        digest = hashlib.sha256()
+        upload = TemporaryUploadedFile(
+            'upload', 'application/octet-stream', 0, None
+        )
+        try:
+            for start in range(0, len(payload), BASE64_CHUNK_SIZE):
+                chunk = base64.b64decode(
+                    payload[start:start + BASE64_CHUNK_SIZE], validate=True
+                )
+                digest.update(chunk)
+                upload.write(chunk)
+        except (binascii.Error, ValueError):
+            upload.close()
+            self.fail('invalid_base64')
+        upload.size = upload.tell()
+        upload.seek(0)
+        try:
+            with Image.open(upload) as image:
+                extension = EXTENSIONS.get(image.format)
+        except (OSError, ValueError):
+            extension = None
+        if extension is None:
+            upload.close()
+            self.fail('invalid_image')
+        upload.seek(0)
+        upload.name = f'{digest.hexdigest()[:NAME_HASH_LENGTH]}.{extension}'
+        upload.content_hash = digest.hexdigest()
+        return super().to_internal_value(upload)
+
+
+def name_hash(name):
+    """Хеш содержимого из имени сохраненного изображения.
+
+    Если файл с таким именем уже есть, хранилище добавляет к имени
+    случайный суффикс "_<символы>"; он отбрасывается.
+    """
+    stem, _ = posixpath.splitext(posixpath.basename(name))
+    return stem.split('_', 1)[0]
+
+
+def same_image(name, upload):
+    """Сохраненное изображение name совпадает по содержимому с upload."""
+    return bool(name) and (
+        name_hash(name) == upload.content_hash[:NAME_HASH_LENGTH]
+    )
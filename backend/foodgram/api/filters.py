@@ -0,0 +1,23 @@
+from rest_framework.filters import BaseFilterBackend
+
+from recipes.search import search_recipes
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """Полнотекстовый поиск рецептов по параметру "search".
+
+    Ищет по названию, описанию и названиям ингредиентов
+    (см. recipes.search) и сортирует результаты по рангу.
+    Применяется к уже отфильтрованному queryset, поэтому
+    сочетается с фильтрами по тегам, автору, избранному и корзине.
+    """
+
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        return search_recipes(queryset, text).order_by(
+            '-search_rank', '-pub_date', '-id'
+        )
@@ -0,0 +1,105 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
+
+from foodgram.routers import use_primary
+from recipes.models import Ingredient
+from recipes.versions import get_version, next_version
+
+VERSION_CACHE_KEY = 'ingredient_index:version'
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Ингредиенты хранятся в массиве, отсортированном по имени
+    в нижнем регистре: поиск по префиксу выполняется бинарным
+    поиском, по подстроке - линейным проходом по тому же массиву.
+    Индекс загружается из БД при первом обращении и перестраивается,
+    когда меняется версия в кеше (см. "invalidate").
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._items = []
+
+    def _load(self):
+        items = sorted(
+            (
+                (name.casefold(), {
+                    'id': pk, 'name': name, 'measurement_unit': unit
+                })
+                for pk, name, unit in Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'
+                ).order_by()
+            ),
+            key=lambda item: (item[0], item[1]['id'])
+        )
+        self._keys = [key for key, _ in items]
+        self._items = [item for _, item in items]
+
+    def _ensure_loaded(self):
+        version = get_version(VERSION_CACHE_KEY)
+        if self._version == version:
+            return
+        with self._lock:
+            if self._version != version:
+                with use_primary():
+                    self._load()
+                self._version = version
+
+    def all(self):
+        self._ensure_loaded()
+        return self._items
+
+    def search(self, name, limit=None):
+        """Ингредиенты, начинающиеся с name, затем содержащие name."""
+        self._ensure_loaded()
+        query = name.casefold()
+        keys, items = self._keys, self._items
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        result = items[start:end]
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        for index, key in enumerate(keys):
+            if start <= index < end or query not in key:
+                continue
+            result.append(items[index])
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    def invalidate(self):
+        next_version(VERSION_CACHE_KEY)
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_ingredients_db(name, limit=None):
+    """Тот же поиск средствами БД (для INGREDIENT_SEARCH_BACKEND='db')."""
+    queryset = Ingredient.objects.filter(
+        name__icontains=name
+    ).annotate(
+        rank=Case(
+            When(name__istartswith=name, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField()
+        )
+    ).order_by('rank', 'name').values('id', 'name', 'measurement_unit')
+    if limit is not None:
+        queryset = queryset[:limit]
+    return list(queryset)
+
+
+def search_ingredients(name, limit=None):
+    if settings.INGREDIENT_SEARCH_BACKEND == 'db':
+        return search_ingredients_db(name, limit)
+    return ingredient_index.search(name, limit)
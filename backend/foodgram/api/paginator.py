@@ -1,7 +1,26 @@
-from rest_framework.pagination import PageNumberPagination, _positive_int
+import json
+from collections import OrderedDict
 
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, PageNumberPagination,
+                                       _positive_int)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
-class CustomPagination(PageNumberPagination):
+
+class LimitPageSizeMixin:
+    """Размер страницы из параметра запроса "limit"."""
+
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = None
 
     def get_page_size(self, request):
         page_size_query_param = request.query_params.get('limit')
@@ -12,3 +31,153 @@ class CustomPagination(PageNumberPagination):
                                      cutoff=self.max_page_size)
             except (KeyError, ValueError):
                 return self.page_size
+        return self.page_size
+
+
+class KeysetPagination(LimitPageSizeMixin, BasePagination):
+    """Пагинация по ключу (pub_date, id) вместо OFFSET.
+
+    Курсор - подписанная пара значений последней записи страницы,
+    следующая страница выбирается условием
+    (pub_date, id) < (курсор) по индексу, поэтому стоимость
+    любой страницы одинакова. Записи упорядочены по убыванию ключа.
+    """
+
+    cursor_query_param = 'cursor'
+    cursor_salt = 'api.paginator.KeysetPagination'
+    invalid_cursor_message = 'Неверный курсор'
+    ordering = ('-pub_date', '-id')
+
+    def encode_cursor(self, obj):
+        return signing.dumps(
+            (obj.pub_date.isoformat(), obj.pk), salt=self.cursor_salt
+        )
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            pub_date, pk = signing.loads(cursor, salt=self.cursor_salt)
+            pub_date = parse_datetime(pub_date)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            pub_date, pk = position
+            # Избыточное условие pub_date <= курсора позволяет
+            # планировщику выполнить поиск по индексу диапазоном.
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk),
+                pub_date__lte=pub_date
+            )
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('first', self.get_first_link()),
+            ('results', data),
+        ]))
+
+
+def estimate_count(queryset):
+    """Оценка числа строк queryset по статистике планировщика Postgres.
+
+    Для запроса без условий берется pg_class.reltuples, иначе -
+    оценка "Plan Rows" из EXPLAIN. Для других СУБД возвращает None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] >= 0 else None
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(DjangoPaginator):
+    """Paginator, заменяющий COUNT(*) оценкой на больших выборках.
+
+    Точный COUNT выполняется, только если оценка меньше
+    PAGINATION_COUNT_ESTIMATE_THRESHOLD (или порог не задан).
+    """
+
+    @cached_property
+    def count(self):
+        threshold = settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD
+        if threshold is not None and isinstance(self.object_list, QuerySet):
+            estimate = estimate_count(self.object_list)
+            if estimate is not None and estimate >= threshold:
+                return estimate
+        return super().count
+
+
+class CustomPagination(LimitPageSizeMixin, PageNumberPagination):
+    """Постраничная пагинация с опциональным режимом курсора.
+
+    Режим курсора (KeysetPagination) включается параметром
+    "pagination=cursor" или атрибутом вьюсета pagination_mode = 'cursor',
+    если вьюсет разрешает его атрибутом allow_cursor_pagination.
+    Списки, уже упорядоченные не по (pub_date, id) (популярные
+    рецепты, подбор по продуктам), всегда разбиваются на страницы.
+    """
+
+    django_paginator_class = EstimatedCountPaginator
+    mode_query_param = 'pagination'
+
+    def get_mode(self, queryset, request, view):
+        if (not getattr(view, 'allow_cursor_pagination', False)
+                or not isinstance(queryset, QuerySet)):
+            return 'page'
+        mode = request.query_params.get(self.mode_query_param)
+        if mode in ('page', 'cursor'):
+            return mode
+        if request.query_params.get(KeysetPagination.cursor_query_param):
+            return 'cursor'
+        return getattr(view, 'pagination_mode', 'page')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.get_mode(queryset, request, view) == 'cursor':
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
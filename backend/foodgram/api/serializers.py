@@ -1,12 +1,21 @@
+from django.core.files.storage import default_storage
 from django.core.validators import MinValueValidator
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.pagination import _positive_int
 
+from recipes.images import schedule_variants
 from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.pantry import pantry_index
+from recipes.search import reindex_recipes
+from recipes.shopping_list import change_recipe
 from users.models import Follow, User
+from .cache import invalidate_recipe_responses
+from .fields import Base64ImageField, same_image
+from .validators import (StructuredValidationError, id_error, resolve_ids,
+                         resolve_ingredients)
+from .viewer_state import get_viewer_state
 
 
 class SignUpSerializer(UserCreateSerializer):
@@ -27,7 +36,7 @@ class RegisteredUserSerializer(UserSerializer):
 
     Метод "get_is_subscribed" добавлен ввиду необходимостью генерировать
     статус: "подписан ли пользователь, инициирующий запрос,
-    на другого пользователя".
+    на другого пользователя". Статус берется из ViewerState запроса.
     """
 
     is_subscribed = serializers.SerializerMethodField()
@@ -40,12 +49,10 @@ class RegisteredUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        if self.context.get('request').user.is_anonymous:
+        request = self.context.get('request')
+        if request is None:
             return False
-        user = self.context.get('request').user
-        return obj.authors.filter(
-            user=user
-        ).exists()
+        return get_viewer_state(request).is_subscribed(obj.pk)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -113,6 +120,12 @@ class RecipesSerializer(serializers.ModelSerializer):
     При регистрации нового рецепта необходимо дополнительно сохранить
     информацию для связанных полей по указанному в запросе
     списку id тегов, ингредиентов с уточнением количества.
+
+    Теги и ингредиенты проверяются одним запросом на модель
+    (см. resolve_ids), найденные объекты передаются в create/update.
+
+    Флаги "is_favorited" и "is_in_shopping_cart" берутся из ViewerState
+    запроса (см. api.viewer_state).
     """
 
     tags = TagSerializer(
@@ -124,6 +137,7 @@ class RecipesSerializer(serializers.ModelSerializer):
         read_only=True
     )
     image = Base64ImageField()
+    image_srcset = serializers.SerializerMethodField()
     text = serializers.CharField(trim_whitespace=False,)
     cooking_time = serializers.IntegerField(
         validators=[MinValueValidator(1)]
@@ -136,62 +150,74 @@ class RecipesSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'tags', 'is_favorited', 'is_in_shopping_cart', 'author', 'name',
-            'image', 'text', 'cooking_time', 'id', 'ingredients'
+            'image', 'image_srcset', 'text', 'cooking_time', 'id',
+            'ingredients'
         )
 
     def validate(self, data):
-        tag_data = self.initial_data.get('tags')
-        if not tag_data:
-            raise serializers.ValidationError(
-                "Необходимо указать теги"
-            )
-        elif len(tag_data) != len(set(tag_data)):
-            raise serializers.ValidationError(
-                "Теги не должны повторяться"
-            )
-        tags_set = [
-            get_object_or_404(Tag, id=id) for id in tag_data
-        ]
-        data['tags'] = tags_set
-
-        ingredient_data = self.initial_data['ingredients']
-        ingredient_list = [
-            item.get('id') for item in ingredient_data
-        ]
-        amount_list = [
-            item.get('amount') for item in ingredient_data
-        ]
-
+        errors = {}
+        tag_ids = self.initial_data.get('tags')
+        if not tag_ids:
+            errors['tags'] = [id_error('required', 'Необходимо указать теги')]
+        else:
+            tags, errors['tags'] = resolve_ids(Tag, tag_ids, 'Теги')
+        ingredient_data = self.initial_data.get('ingredients')
         if not ingredient_data:
-            raise serializers.ValidationError(
-                "Необходимо указать ингредиенты"
-            )
-        if len(ingredient_list) != len(set(ingredient_list)):
-            raise serializers.ValidationError(
-                "Ингредиенты не должны повторяться"
+            errors['ingredients'] = [
+                id_error('required', 'Необходимо указать ингредиенты')
+            ]
+        else:
+            ingredients, errors['ingredients'] = resolve_ingredients(
+                ingredient_data
             )
-
-        ingredients = [
-            get_object_or_404(
-                Ingredient, id=id
-            ) for id in ingredient_list
-        ]
-        amount_ingredients_set = dict(zip(ingredients, amount_list))
-        data['ingredients'] = amount_ingredients_set
-
+        errors = {field: value for field, value in errors.items() if value}
+        if errors:
+            raise StructuredValidationError(errors)
+        data['tags'] = tags
+        data['ingredients'] = ingredients
         return data
 
     def get_is_favorited(self, obj):
-        if self.context.get('request').user.is_anonymous:
-            return False
-        user = self.context.get('request').user
-        return obj.favorite_recipes.filter(owner=user).exists()
+        return get_viewer_state(
+            self.context.get('request')
+        ).is_favorited(obj.pk)
 
     def get_is_in_shopping_cart(self, obj):
-        if self.context.get('request').user.is_anonymous:
-            return False
-        user = self.context.get('request').user
-        return obj.shoppingcart_recipes.filter(owner=user).exists()
+        return get_viewer_state(
+            self.context.get('request')
+        ).is_in_shopping_cart(obj.pk)
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Временный файл загрузки (см. Base64ImageField) к этому
+            # моменту перемещен в хранилище или больше не нужен.
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
+    def get_image_srcset(self, obj):
+        """Значения srcset по форматам: {"webp": "url 320w, ...", ...}.
+
+        Пока изображение обрабатывается в фоне, словарь пуст.
+        """
+        request = self.context.get('request')
+        srcset = {}
+        for image_format, widths in obj.image_variants.items():
+            urls = []
+            for width, name in sorted(
+                    widths.items(), key=lambda item: int(item[0])):
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls.append(f'{url} {width}w')
+            srcset[image_format] = ', '.join(urls)
+        return srcset
+
+    def reload(self, recipe):
+        """Рецепт со связанными объектами для ответа."""
+        return Recipe.objects.with_related().get(pk=recipe.pk)
 
     def create(self, validated_data):
         user = self.context.get('request').user
@@ -215,33 +241,129 @@ class RecipesSerializer(serializers.ModelSerializer):
             ]
         )
 
-        recipe.save()
-        return recipe
-
+        schedule_variants(recipe)
+        reindex_recipes(Recipe.objects.filter(pk=recipe.pk))
+        pantry_index.record_change(recipe.pk)
+        return self.reload(recipe)
+
+    def update_tags(self, instance, tags):
+        """Добавляет и удаляет только изменившиеся теги рецепта."""
+        current = {tag.pk for tag in instance.tags.all()}
+        new = {tag.pk for tag in tags}
+        if current - new:
+            instance.tags.remove(*(current - new))
+        if new - current:
+            instance.tags.add(*(new - current))
+
+    def update_ingredients(self, instance, ingredients):
+        """Приводит ингредиенты рецепта к новому состоянию по разнице.
+
+        Новые строки вставляются, у существующих меняется только
+        количество, лишние удаляются. Возвращает изменения количества
+        {id ингредиента: разница}, пустые, если ничего не изменилось.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in instance.ingredients_recipes.all()
+        }
+        amounts = {
+            ingredient.pk: amount
+            for ingredient, amount in ingredients.items()
+        }
+        removed = current.keys() - amounts.keys()
+        created = [
+            RecipeIngredient(
+                recipe=instance, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        deltas = {
+            ingredient_id: -current[ingredient_id].amount
+            for ingredient_id in removed
+        }
+        deltas.update((item.ingredient_id, item.amount) for item in created)
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and item.amount != amount:
+                deltas[ingredient_id] = amount - item.amount
+                item.amount = amount
+                changed.append(item)
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=instance, ingredient_id__in=removed
+            ).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if created:
+            RecipeIngredient.objects.bulk_create(created)
+        return deltas
+
+    @transaction.atomic
     def update(self, instance, validated_data):
+        """Обновляет рецепт, записывая только изменившиеся данные.
+
+        Рецепт сохраняется с update_fields, чтобы не затирать
+        денормализованные счетчики. Картинка с тем же содержимым
+        (тот же хеш в имени файла) не перезаписывается и не
+        обрабатывается повторно.
+        """
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        self.update_tags(instance, tags)
+        deltas = self.update_ingredients(instance, ingredients)
+        ingredients_changed = bool(deltas)
+
+        image = validated_data.get('image')
+        if image is not None and same_image(instance.image.name, image):
+            del validated_data['image']
+        elif image is not None:
+            validated_data['image_variants'] = {}
+        update_fields = [
+            field for field, value in validated_data.items()
+            if field == 'image' or getattr(instance, field) != value
+        ]
+        for field in update_fields:
+            setattr(instance, field, validated_data[field])
+        if update_fields:
+            instance.save(update_fields=update_fields)
+        if ingredients_changed:
+            change_recipe(instance.pk, deltas)
+        if 'image' in update_fields:
+            schedule_variants(instance)
+        if ingredients_changed or {'name', 'text'} & set(update_fields):
+            reindex_recipes(Recipe.objects.filter(pk=instance.pk))
+        if ingredients_changed:
+            pantry_index.record_change(instance.pk)
+            invalidate_recipe_responses(instance.pk)
+        return self.reload(instance)
+
+
+class PantryRecipeSerializer(RecipesSerializer):
+    """Рецепт с долей ингредиентов, которые есть у пользователя.
+
+    Значения "coverage" и "missing_count" вычисляются индексом
+    recipes.pantry и присваиваются рецептам во вьюсете.
+    """
 
-        instance.tags.clear()
-        instance.tags.set(tags)
+    coverage = serializers.ReadOnlyField()
+    missing_count = serializers.ReadOnlyField()
 
-        instance.ingredients.clear()
-        RecipeIngredient.objects.bulk_create(
-            [
-                RecipeIngredient(
-                    ingredient=ingredient,
-                    recipe=instance,
-                    amount=amount
-                )
-                for ingredient, amount in ingredients.items()
-            ]
+    class Meta(RecipesSerializer.Meta):
+        fields = RecipesSerializer.Meta.fields + (
+            'coverage', 'missing_count'
         )
 
-        return super().update(instance, validated_data)
-
 
 class SubscribeSerializer(serializers.ModelSerializer):
-    """Сериализатор подписки."""
+    """Сериализатор подписки.
+
+    Для списка подписок ограниченный список рецептов "limited_recipes"
+    подготавливается во вьюсете через Prefetch, "is_subscribed" берется
+    из ViewerState запроса. Число рецептов хранится в денормализованном
+    поле User.recipes_count.
+    """
 
     is_subscribed = serializers.SerializerMethodField()
     email = serializers.ReadOnlyField()
@@ -250,7 +372,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
     first_name = serializers.ReadOnlyField()
     last_name = serializers.ReadOnlyField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField(default=0)
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = Follow
@@ -259,14 +381,16 @@ class SubscribeSerializer(serializers.ModelSerializer):
             'is_subscribed', 'recipes', 'recipes_count'
         )
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return obj.authors.filter(user=user).exists()
+        return get_viewer_state(
+            self.context.get('request')
+        ).is_subscribed(obj.pk)
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'limited_recipes'):
+            return ShortRecipeSerializer(
+                obj.limited_recipes, many=True
+            ).data
         recipes_queryset = obj.recipes.all()
         recipes_limit = self.context.get('request').query_params.get(
             'recipes_limit')
@@ -0,0 +1,31 @@
+from itertools import groupby
+
+from recipes.models import ShoppingListItem
+
+CHUNK_SIZE: int = 500
+
+
+def get_shopping_list_queryset(user):
+    """Строки списка покупок пользователя (name, unit, amount)."""
+    return ShoppingListItem.objects.filter(
+        owner=user
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by(
+        'ingredient__name', 'ingredient__measurement_unit'
+    )
+
+
+def iter_shopping_list(user):
+    """Генератор строк списка покупок (name, amount, unit).
+
+    Суммы ингредиентов хранятся в ShoppingListItem и поддерживаются
+    при изменении корзины и рецептов (см. recipes.shopping_list),
+    поэтому выгрузка - одно чтение по индексу владельца. Строки
+    читаются курсором (на Postgres - серверным) порциями по CHUNK_SIZE.
+    Разные ингредиенты с одинаковыми названием и единицей измерения
+    объединяются в одну строку.
+    """
+    rows = get_shopping_list_queryset(user).iterator(chunk_size=CHUNK_SIZE)
+    for (name, unit), group in groupby(rows, key=lambda row: row[:2]):
+        yield name, sum(amount for _, _, amount in group), unit
@@ -0,0 +1,101 @@
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from recipes.images import variants_built
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.pantry import pantry_index
+from recipes.search import recipe_index, reindex_recipes
+from recipes.shopping_list import remove_recipe
+from users.models import User
+from .cache import (INGREDIENTS_CACHE_KEY, TAGS_CACHE_KEY, invalidate_list,
+                    invalidate_recipe_responses, invalidate_shared_responses)
+from .db import check_connections
+from .ingredient_search import ingredient_index
+from .viewer_state import KINDS, ViewerState
+
+request_started.connect(check_connections, dispatch_uid='check_connections')
+
+
+def viewer_state_changed(sender, instance, signal, created=True, **kwargs):
+    if not created:
+        return
+    for kind, (model, user_field, object_field) in KINDS.items():
+        if model is sender:
+            ViewerState.write_through(
+                getattr(instance, f'{user_field}_id'), kind,
+                [getattr(instance, object_field)], signal is post_save
+            )
+
+
+for model, _, _ in KINDS.values():
+    post_save.connect(viewer_state_changed, sender=model)
+    post_delete.connect(viewer_state_changed, sender=model)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    # До удаления: корзины и ингредиенты рецепта удаляются каскадно.
+    remove_recipe(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    transaction.on_commit(recipe_index.invalidate)
+    pantry_index.record_change(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    # После коммита, как и индекс рецептов: иначе процесс, прочитавший
+    # БД до коммита, сохранит старый индекс с новой версией.
+    transaction.on_commit(ingredient_index.invalidate)
+    invalidate_list(INGREDIENTS_CACHE_KEY)
+    reindex_recipes(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    invalidate_list(TAGS_CACHE_KEY)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_response_changed(sender, instance, **kwargs):
+    invalidate_recipe_responses(instance.pk)
+
+
+@receiver(variants_built, sender=Recipe)
+def recipe_variants_built(sender, recipe_id, **kwargs):
+    # Кешированные ответы без уменьшенных копий (image_srcset).
+    invalidate_recipe_responses(recipe_id)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    invalidate_recipe_responses(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        invalidate_shared_responses()
+    else:
+        invalidate_recipe_responses(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def shared_response_changed(sender, **kwargs):
+    invalidate_shared_responses()
+
+
+@receiver((post_save, post_delete), sender=User)
+def author_changed(sender, created=False, update_fields=None, **kwargs):
+    # Новый пользователь еще не автор; вход обновляет только last_login.
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    invalidate_shared_responses()
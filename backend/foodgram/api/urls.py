@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
+from .async_views import async_urlpatterns
 from .views import (IngredientViewSet, RecipesViewSet, SpecialUserViewSet,
                     TagViewSet)
 
@@ -14,7 +16,11 @@ router_v1.register(r'tags', TagViewSet, basename='tags')
 router_v1.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router_v1.register(r'recipes', RecipesViewSet, basename='recipes')
 
+router_urls = router_v1.urls
+if settings.ASYNC_VIEWS:
+    router_urls = async_urlpatterns(router_urls)
+
 urlpatterns = [
-    path('', include(router_v1.urls)),
+    path('', include(router_urls)),
     path(r'', include(auth_urls)),
 ]
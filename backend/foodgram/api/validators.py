@@ -0,0 +1,109 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from recipes.models import Ingredient
+
+# Наибольшее количество ингредиента (PositiveSmallIntegerField).
+MAX_AMOUNT: int = 32767
+
+
+class StructuredValidationError(APIException):
+    """Ошибка 400 из структурированных элементов (см. "id_error").
+
+    ValidationError приводит все значения к строкам, и id вернулись бы
+    клиенту строками; здесь detail отдается как есть. Сериализатор
+    не перехватывает это исключение, поэтому в validate() оно
+    вызывается сразу со всеми ошибками.
+    """
+
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_code = 'invalid'
+
+    def __init__(self, detail):
+        self.detail = detail
+
+
+def id_error(code, message, ids=None):
+    """Элемент структурированной ошибки: {"code", "message", ["ids"]}."""
+    detail = {'code': code, 'message': message}
+    if ids is not None:
+        detail['ids'] = ids
+    return detail
+
+
+def to_id(value):
+    """Целое значение id или None, если value не является id.
+
+    Дробные числа (2.7, "1.5") не округляются, а считаются неверными.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def resolve_ids(model, values, label):
+    """Находит объекты model по списку id одним запросом id__in.
+
+    Возвращает пару (объекты в порядке values, список ошибок).
+    Ошибки перечисляют сразу все неверные, повторяющиеся
+    и отсутствующие id.
+    """
+    if not isinstance(values, list):
+        return [], [id_error('invalid', f'{label}: ожидается список id')]
+    errors = []
+    invalid = [value for value in values if to_id(value) is None]
+    if invalid:
+        errors.append(id_error('invalid', f'{label}: неверные id', invalid))
+    ids = [to_id(value) for value in values if to_id(value) is not None]
+    unique = list(dict.fromkeys(ids))
+    seen, duplicates = set(), {}
+    for pk in ids:
+        if pk in seen:
+            duplicates[pk] = None
+        seen.add(pk)
+    duplicates = list(duplicates)
+    if duplicates:
+        errors.append(id_error(
+            'duplicates', f'{label} не должны повторяться', duplicates
+        ))
+    objects = model.objects.in_bulk(unique)
+    missing = [pk for pk in unique if pk not in objects]
+    if missing:
+        errors.append(id_error('missing', f'{label} не найдены', missing))
+    return [objects[pk] for pk in unique if pk in objects], errors
+
+
+def resolve_ingredients(items):
+    """Разбирает список {"id", "amount"} в словарь {Ingredient: amount}.
+
+    Возвращает пару (словарь, список ошибок) как resolve_ids.
+    """
+    if not isinstance(items, list) or not all(
+            isinstance(item, dict) for item in items):
+        return {}, [id_error(
+            'invalid', 'Ингредиенты: ожидается список объектов {id, amount}'
+        )]
+    ingredients, errors = resolve_ids(
+        Ingredient, [item.get('id') for item in items], 'Ингредиенты'
+    )
+    amounts, invalid_amount = {}, []
+    for item in items:
+        amount = to_id(item.get('amount'))
+        if amount is None or not 1 <= amount <= MAX_AMOUNT:
+            invalid_amount.append(item.get('id'))
+        amounts.setdefault(to_id(item.get('id')), amount)
+    if invalid_amount:
+        errors.append(id_error(
+            'invalid_amount',
+            'Количество ингредиента должно быть целым числом '
+            f'от 1 до {MAX_AMOUNT}',
+            invalid_amount
+        ))
+    return {
+        ingredient: amounts[ingredient.pk] for ingredient in ingredients
+    }, errors
@@ -0,0 +1,180 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from foodgram.routers import use_primary
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+CACHE_KEY = 'viewer_state:{user_id}:{kind}'
+VERSION_CACHE_KEY = 'viewer_state:{user_id}:{kind}:version'
+LOCK_CACHE_KEY = 'viewer_state:{user_id}:{kind}:lock'
+LOCK_TIMEOUT: int = 5
+LOCK_ATTEMPTS: int = 20
+LOCK_DELAY: float = 0.01
+# {вид состояния: (модель, поле пользователя, поле id объекта)}
+KINDS = {
+    'favorites': (Favorite, 'owner', 'recipe_id'),
+    'cart': (ShoppingCart, 'owner', 'recipe_id'),
+    'following': (Follow, 'user', 'author_id'),
+}
+
+
+def get_cache_key(user_id, kind):
+    return CACHE_KEY.format(user_id=user_id, kind=kind)
+
+
+def get_version_key(user_id, kind):
+    return VERSION_CACHE_KEY.format(user_id=user_id, kind=kind)
+
+
+def new_version():
+    return uuid.uuid4().hex
+
+
+class ViewerState:
+    """Избранное, корзина и подписки пользователя, выполняющего запрос.
+
+    Множества id загружаются один раз за запрос (из кеша, а при
+    промахе - тремя запросами к основной БД), после чего проверки
+    is_favorited / is_in_shopping_cart / is_subscribed выполняются
+    в памяти. Кеш обновляется сквозной записью (см. "write_through")
+    при каждом изменении Favorite, ShoppingCart и Follow.
+    """
+
+    def __init__(self, user):
+        self.user_id = None if user.is_anonymous else user.pk
+        self._ids = None
+        self._changes = []
+
+    def _load(self):
+        if self.user_id is None:
+            return {kind: frozenset() for kind in KINDS}
+        keys = {get_cache_key(self.user_id, kind): kind for kind in KINDS}
+        version_keys = {
+            get_version_key(self.user_id, kind): kind for kind in KINDS
+        }
+        cached = cache.get_many([*keys, *version_keys])
+        versions = {}
+        for key, kind in version_keys.items():
+            versions[kind] = cached.get(key)
+            if versions[kind] is None:
+                cache.add(
+                    key, new_version(), settings.VIEWER_STATE_CACHE_TIMEOUT
+                )
+                versions[kind] = cache.get(key)
+        ids = {}
+        for key, kind in keys.items():
+            version, object_ids = cached.get(key, (None, None))
+            if version is not None and version == versions[kind]:
+                ids[kind] = object_ids
+        for kind in KINDS.keys() - ids.keys():
+            model, user_field, object_field = KINDS[kind]
+            # С основной БД: множество с отстающей реплики осталось бы
+            # в кеше на VIEWER_STATE_CACHE_TIMEOUT.
+            with use_primary():
+                ids[kind] = set(
+                    model.objects.filter(
+                        **{user_field: self.user_id}
+                    ).values_list(object_field, flat=True)
+                )
+            # Множество помечается версией, прочитанной до запроса к БД.
+            # Если изменение зафиксировано, пока читалась БД, сквозная
+            # запись уже сменила версию, и устаревшее множество
+            # не будет использовано.
+            cache.set(
+                get_cache_key(self.user_id, kind), (versions[kind], ids[kind]),
+                settings.VIEWER_STATE_CACHE_TIMEOUT
+            )
+        return ids
+
+    def ids(self, kind):
+        if self._ids is None:
+            self._ids = self._load()
+            for change in self._changes:
+                self._apply(*change)
+        return self._ids[kind]
+
+    def _apply(self, kind, object_id, present):
+        ids = set(self._ids[kind])
+        if present:
+            ids.add(object_id)
+        else:
+            ids.discard(object_id)
+        self._ids[kind] = ids
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self.ids('favorites')
+
+    def is_in_shopping_cart(self, recipe_id):
+        return recipe_id in self.ids('cart')
+
+    def is_subscribed(self, author_id):
+        return author_id in self.ids('following')
+
+    def update(self, kind, object_id, present):
+        """Изменяет состояние в рамках текущего запроса.
+
+        Нужен, когда ответ формируется до коммита, и сквозная запись
+        в кеш еще не выполнена (например, ответ на подписку).
+        """
+        self._changes.append((kind, object_id, present))
+        if self._ids is not None:
+            self._apply(kind, object_id, present)
+
+    @staticmethod
+    def write_through(user_id, kind, object_ids, present):
+        """Добавляет (present) или удаляет object_ids в кеше после коммита.
+
+        Каждое изменение меняет версию множества, поэтому множество,
+        загруженное из БД до коммита, после него уже не используется
+        (см. "_load"). Если множество в кеше актуально, оно обновляется
+        и помечается новой версией. Изменения одного множества
+        выполняются по очереди под блокировкой в кеше; если дождаться
+        ее не удалось, меняется только версия, и множество будет
+        загружено заново.
+        """
+        def apply():
+            key = get_cache_key(user_id, kind)
+            version_key = get_version_key(user_id, kind)
+            version = new_version()
+            lock = LOCK_CACHE_KEY.format(user_id=user_id, kind=kind)
+            for _ in range(LOCK_ATTEMPTS):
+                if cache.add(lock, 1, LOCK_TIMEOUT):
+                    break
+                time.sleep(LOCK_DELAY)
+            else:
+                cache.set(
+                    version_key, version, settings.VIEWER_STATE_CACHE_TIMEOUT
+                )
+                return
+            try:
+                cached = cache.get_many([key, version_key])
+                cache.set(
+                    version_key, version, settings.VIEWER_STATE_CACHE_TIMEOUT
+                )
+                current, ids = cached.get(key, (None, None))
+                if current is None or current != cached.get(version_key):
+                    return
+                if present:
+                    ids.update(object_ids)
+                else:
+                    ids.difference_update(object_ids)
+                cache.set(
+                    key, (version, ids), settings.VIEWER_STATE_CACHE_TIMEOUT
+                )
+            finally:
+                cache.delete(lock)
+
+        transaction.on_commit(apply)
+
+
+def get_viewer_state(request):
+    """ViewerState текущего запроса (создается при первом обращении)."""
+    state = getattr(request, 'viewer_state', None)
+    if state is None:
+        state = request.viewer_state = ViewerState(request.user)
+    return state
@@ -1,26 +1,44 @@
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
 from django.db import IntegrityError
-from django.db.models import Sum
-from django.http import HttpResponse, JsonResponse
+from django.db.models import Prefetch
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
+from rest_framework.pagination import _positive_int
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from foodgram.instrumentation import TimedViewMixin
+from recipes.counters import update_counters
 from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart, Tag)
+from recipes.pantry import pantry_index
+from recipes.ranking import get_popular_ids
+from recipes.shopping_list import change_cart, lock_owners
 from users.models import Follow, User
-from .custom_render import PlainTextRenderer
-from .paginator import CustomPagination
+from .batch import CART, FAVORITES, FOLLOWING, apply_batch
+from .cache import (INGREDIENTS_CACHE_KEY, TAGS_CACHE_KEY,
+                    AnonymousResponseCacheMixin, CachedListMixin,
+                    etag_response, make_etag)
+from .custom_render import (CSVRenderer, PDFRenderer, PlainTextRenderer,
+                            ShoppingListJSONRenderer)
+from .db import NonAtomicSafeMethodsMixin
+from .filters import RecipeSearchFilter
+from .ingredient_search import ingredient_index, search_ingredients
+from .paginator import CustomPagination, KeysetPagination
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (IngredientSerializer, RecipesSerializer,
-                          ShortRecipeSerializer, RegisteredUserSerializer,
-                          SubscribeSerializer, TagSerializer)
+from .serializers import (IngredientSerializer, PantryRecipeSerializer,
+                          RecipesSerializer, ShortRecipeSerializer,
+                          RegisteredUserSerializer, SubscribeSerializer,
+                          TagSerializer)
+from .shopping_list import iter_shopping_list
+from .validators import StructuredValidationError, id_error, to_id
+from .viewer_state import get_viewer_state
 
 
-class SpecialUserViewSet(UserViewSet):
+class SpecialUserViewSet(TimedViewMixin, NonAtomicSafeMethodsMixin,
+                         UserViewSet):
     """Вьюсет обработки эндпоинтов к данным пользователей."""
 
     serializer_class = RegisteredUserSerializer
@@ -31,11 +49,20 @@ class SpecialUserViewSet(UserViewSet):
     @action(methods=('get',), detail=False,
             permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
-        authors_queryset = list(
-            User.objects.filter(
-                authors__user=request.user
+        recipes_limit = request.query_params.get('recipes_limit')
+        try:
+            recipes_limit = _positive_int(recipes_limit)
+        except (TypeError, ValueError):
+            recipes_limit = None
+        authors_queryset = User.objects.filter(
+            authors__user=request.user
+        ).prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=Recipe.objects.limited_per_author(recipes_limit),
+                to_attr='limited_recipes'
             )
-        )
+        ).order_by('id')
         page = self.paginate_queryset(authors_queryset)
         serializer = SubscribeSerializer(
             page, many=True, context={'request': request}
@@ -44,6 +71,11 @@ class SpecialUserViewSet(UserViewSet):
             serializer.data
         )
 
+    @action(methods=('post',), detail=False, url_path='subscribe/batch',
+            permission_classes=(IsAuthenticated,))
+    def subscribe_batch(self, request):
+        return apply_batch(request, FOLLOWING)
+
     @action(methods=('post', 'delete'),
             detail=True,
             permission_classes=(IsAuthenticated,))
@@ -51,6 +83,7 @@ class SpecialUserViewSet(UserViewSet):
         author = get_object_or_404(
             User, id=id
         )
+        lock_owners([request.user.pk])
         if request.method == 'POST':
             serializer = SubscribeSerializer(
                 author, context={'request': request}
@@ -64,6 +97,12 @@ class SpecialUserViewSet(UserViewSet):
                 Follow.objects.create(
                     user=request.user, author=author
                 )
+                update_counters(
+                    User.objects.filter(pk=author.pk), followers_count=1
+                )
+                get_viewer_state(request).update(
+                    'following', author.pk, True
+                )
             except IntegrityError:
                 return JsonResponse(
                     {'errors': "Пользователь уже подписан на автора."},
@@ -74,52 +113,84 @@ class SpecialUserViewSet(UserViewSet):
             )
 
         elif request.method == 'DELETE':
-            try:
-                follow = Follow.objects.get(
-                    user=request.user, author=author
-                )
-            except ObjectDoesNotExist:
+            deleted, _ = Follow.objects.filter(
+                user=request.user, author=author
+            ).delete()
+            if not deleted:
                 return JsonResponse(
                     {'errors': "Невозможно отписать от автора, "
                      "на которого не подписан."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            follow.delete()
+            update_counters(
+                User.objects.filter(pk=author.pk), followers_count=-deleted
+            )
             return Response(
                 status=status.HTTP_204_NO_CONTENT
             )
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(TimedViewMixin, NonAtomicSafeMethodsMixin, CachedListMixin,
+                 viewsets.ReadOnlyModelViewSet):
     """Вьюсет обработки эндпоинтов к данным тегов."""
 
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     pagination_class = None
+    list_cache_key = TAGS_CACHE_KEY
+
 
+class IngredientViewSet(TimedViewMixin, NonAtomicSafeMethodsMixin,
+                        CachedListMixin, viewsets.ReadOnlyModelViewSet):
+    """Вьюсет обработки эндпоинтов к данным ингридиентов.
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    """Вьюсет обработки эндпоинтов к данным ингридиентов."""
+    Список и поиск по параметру "name" обслуживаются индексом
+    в памяти процесса (см. api.ingredient_search) без обращения к БД:
+    сначала ингредиенты, начинающиеся с "name", затем содержащие его.
+    Размер выдачи при поиске ограничивается параметром "limit".
+    """
 
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     pagination_class = None
-    filter_backends = (SearchFilter,)
-    search_fields = ('^name',)
+    list_cache_key = INGREDIENTS_CACHE_KEY
+
+    def get_list_data(self):
+        if settings.INGREDIENT_SEARCH_BACKEND == 'db':
+            return super().get_list_data()
+        return ingredient_index.all()
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = _positive_int(
+                request.query_params.get('limit'),
+                strict=True,
+                cutoff=settings.INGREDIENT_SEARCH_LIMIT
+            )
+        except (TypeError, ValueError):
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        data = search_ingredients(name, limit)
+        return etag_response(request, make_etag(data), data)
 
 
-class RecipesViewSet(viewsets.ModelViewSet):
+class RecipesViewSet(TimedViewMixin, NonAtomicSafeMethodsMixin,
+                     AnonymousResponseCacheMixin, viewsets.ModelViewSet):
     """Вьюсет обработки эндпоинтов, связанных с рецептами."""
 
     serializer_class = RecipesSerializer
     http_method_names = ('get', 'post', 'patch', 'delete')
     pagination_class = CustomPagination
-    filter_backends = (filters.OrderingFilter,)
+    allow_cursor_pagination = True
+    filter_backends = (filters.OrderingFilter, RecipeSearchFilter)
     ordering = ('-pub_date',)
     permission_classes = (IsAuthorOrReadOnly,)
 
     def get_queryset(self):
-        queryset = Recipe.objects.all()
+        user = self.request.user
+        queryset = Recipe.objects.with_related()
 
         if self.request.user.is_anonymous:
             is_favorited, is_in_shopping_cart = False, False
@@ -130,17 +201,18 @@ class RecipesViewSet(viewsets.ModelViewSet):
 
         tags = self.request.query_params.getlist('tags')
         if tags:
-            queryset = queryset.filter(
-                tags__slug__in=tags
-            ).distinct()
+            queryset = queryset.with_tags(
+                tags,
+                match_all=self.request.query_params.get('tags_match') == 'all'
+            )
         if is_favorited:
             queryset = queryset.filter(
-                favorite_recipes__owner=self.request.user
-            ).all()
+                favorite_recipes__owner=user
+            )
         if is_in_shopping_cart:
             queryset = queryset.filter(
-                shoppingcart_recipes__owner=self.request.user
-            ).all()
+                shoppingcart_recipes__owner=user
+            )
         author = self.request.query_params.get('author')
         if author:
             queryset = queryset.filter(
@@ -149,42 +221,123 @@ class RecipesViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        update_counters(
+            User.objects.filter(pk=self.request.user.pk), recipes_count=1
+        )
+
+    def perform_destroy(self, instance):
+        author_id = instance.author_id
+        super().perform_destroy(instance)
+        update_counters(
+            User.objects.filter(pk=author_id), recipes_count=-1
+        )
+
+    @action(methods=('get',), detail=False,
+            permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """Лента свежих рецептов авторов, на которых подписан пользователь.
+
+        Рецепты выбираются полусоединением с Follow и постранично
+        по ключу (pub_date, id), см. KeysetPagination.
+        """
+        queryset = self.get_queryset().filter(
+            author__in=Follow.objects.filter(
+                user=request.user
+            ).values('author_id')
+        )
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(methods=('get',), detail=False)
+    def popular(self, request):
+        """Лента популярных рецептов.
+
+        Порядок берется из предрассчитанной таблицы RecipeRanking
+        (команда rank_recipes) через кеш, сами рецепты - по id страницы.
+        """
+        page = self.paginate_queryset(get_popular_ids())
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in page if pk in recipes], many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=('get',), detail=False,
+            serializer_class=PantryRecipeSerializer)
+    def what_to_cook(self, request):
+        """Рецепты из имеющихся продуктов.
+
+        Параметр "ingredients" - id ингредиентов (повтором параметра
+        или через запятую). Рецепты упорядочены по доле своих
+        ингредиентов, которые есть в списке; при "match=all"
+        остаются только рецепты, содержащие все указанные ингредиенты.
+        Подбор выполняется индексом в памяти (см. recipes.pantry).
+        """
+        values = [
+            value
+            for param in request.query_params.getlist('ingredients')
+            for value in param.split(',') if value
+        ]
+        invalid = [value for value in values if to_id(value) is None]
+        if not values or invalid:
+            raise StructuredValidationError({'ingredients': [id_error(
+                'invalid', 'Необходимо указать id ингредиентов',
+                invalid or None
+            )]})
+        ingredient_ids = {to_id(value) for value in values}
+        if len(ingredient_ids) > settings.PANTRY_MAX_INGREDIENTS:
+            raise StructuredValidationError({'ingredients': [id_error(
+                'too_many', 'Можно указать не больше '
+                f'{settings.PANTRY_MAX_INGREDIENTS} ингредиентов'
+            )]})
+        matches = pantry_index.match(
+            ingredient_ids,
+            match_all=request.query_params.get('match') == 'all'
+        )
+        page = self.paginate_queryset(matches)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        result = []
+        for recipe_id, matched, total in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.coverage = round(matched / total, 3)
+            recipe.missing_count = total - matched
+            result.append(recipe)
+        serializer = self.get_serializer(result, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(methods=('get',),
             detail=False,
             permission_classes=(IsAuthenticated,),
-            renderer_classes=(PlainTextRenderer,))
+            renderer_classes=(PlainTextRenderer, CSVRenderer,
+                              ShoppingListJSONRenderer, PDFRenderer))
     def download_shopping_cart(self, request):
         if request.user.is_anonymous:
             return Response(
                 status=status.HTTP_401_UNAUTHORIZED
             )
-        recipes_query = Recipe.objects.filter(
-            shoppingcart_recipes__owner=self.request.user
-        ).all()
-
-        ingredients_query = recipes_query.values(
-            'ingredients_recipes__ingredient__name',
-            'ingredients_recipes__ingredient__measurement_unit'
-        ).annotate(
-            amount=Sum('ingredients_recipes__amount')
-        ).order_by()
-
-        text = '\n'.join(
-            [
-                f"{item['ingredients_recipes__ingredient__name']}: "
-                f"{item['amount']}, "
-                f"{item['ingredients_recipes__ingredient__measurement_unit']}"
-                for item in ingredients_query
-            ]
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.render_bytes(iter_shopping_list(request.user)),
+            content_type=renderer.content_type
         )
-        filename = 'shopping_card.txt'
-        response = HttpResponse(
-            text, content_type='text/plain'
-        )
-        response['Content-Disposition'] = f"attachment'; filename={filename}"
+        filename = f'shopping_cart.{renderer.format}'
+        response['Content-Disposition'] = f'attachment; filename={filename}'
 
         return response
 
+    @action(methods=('post',), detail=False, url_path='favorite/batch',
+            permission_classes=(IsAuthenticated,))
+    def favorite_batch(self, request):
+        return apply_batch(request, FAVORITES)
+
     @action(methods=('post', 'delete'),
             detail=True)
     def favorite(self, request, pk):
@@ -194,11 +347,16 @@ class RecipesViewSet(viewsets.ModelViewSet):
         serializer = ShortRecipeSerializer(
             recipe
         )
+        # Очередность с пакетными запросами пользователя (см. api.batch).
+        lock_owners([request.user.pk])
         if request.method == 'POST':
             try:
                 Favorite.objects.create(
                     owner=request.user, recipe=recipe
                 )
+                update_counters(
+                    Recipe.objects.filter(pk=recipe.pk), favorites_count=1
+                )
             except IntegrityError:
                 return JsonResponse(
                     {'errors': "Рецепт уже добавлен в избранное."},
@@ -208,21 +366,27 @@ class RecipesViewSet(viewsets.ModelViewSet):
                 serializer.data, status=status.HTTP_201_CREATED
             )
         elif request.method == 'DELETE':
-            try:
-                favorite = Favorite.objects.get(
-                    owner=request.user, recipe=recipe
-                )
-            except ObjectDoesNotExist:
+            deleted, _ = Favorite.objects.filter(
+                owner=request.user, recipe=recipe
+            ).delete()
+            if not deleted:
                 return JsonResponse(
                     {'errors': "Невозможно удалить рецепт не добавленный "
                                "в избранное."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            favorite.delete()
+            update_counters(
+                Recipe.objects.filter(pk=recipe.pk), favorites_count=-deleted
+            )
             return Response(
                 status=status.HTTP_204_NO_CONTENT
             )
 
+    @action(methods=('post',), detail=False, url_path='shopping_cart/batch',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        return apply_batch(request, CART)
+
     @action(methods=('post', 'delete'),
             detail=True)
     def shopping_cart(self, request, pk):
@@ -232,11 +396,16 @@ class RecipesViewSet(viewsets.ModelViewSet):
         serializer = ShortRecipeSerializer(
             recipe
         )
+        lock_owners([request.user.pk])
         if request.method == 'POST':
             try:
                 ShoppingCart.objects.create(
                     owner=request.user, recipe=recipe
                 )
+                update_counters(
+                    Recipe.objects.filter(pk=recipe.pk), in_carts_count=1
+                )
+                change_cart(request.user.pk, [recipe.pk])
             except IntegrityError:
                 return JsonResponse(
                     {'errors': "Рецепт уже добавлен в избранное."},
@@ -246,17 +415,19 @@ class RecipesViewSet(viewsets.ModelViewSet):
                 serializer.data, status=status.HTTP_201_CREATED
             )
         elif request.method == 'DELETE':
-            try:
-                cart = ShoppingCart.objects.get(
-                    owner=request.user, recipe=recipe
-                )
-            except ObjectDoesNotExist:
+            deleted, _ = ShoppingCart.objects.filter(
+                owner=request.user, recipe=recipe
+            ).delete()
+            if not deleted:
                 return JsonResponse(
                     {'errors': "Невозможно удалить рецепт не добавленный "
                                "в избранное."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            cart.delete()
+            update_counters(
+                Recipe.objects.filter(pk=recipe.pk), in_carts_count=-deleted
+            )
+            change_cart(request.user.pk, removed=[recipe.pk])
             return Response(
                 status=status.HTTP_204_NO_CONTENT
             )
@@ -0,0 +1,335 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+profile_logger = logging.getLogger(f'{__name__}.profile')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+PROFILE_LINES: int = 60
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Замеры текущего запроса; None вне запроса.
+current = ContextVar('instrumentation_request', default=None)
+
+
+class RequestMetrics:
+    """Замеры одного запроса: SQL, представление, рендеринг, формы SQL."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.view_time = 0.0
+        self.render_time = 0.0
+        self.shapes = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            # Параметры передаются отдельно, поэтому запросы одной
+            # формы (например, N+1) совпадают по тексту SQL.
+            self.shapes[sql] += 1
+
+
+class Registry:
+    """Метрики процесса по представлениям в формате Prometheus.
+
+    Метрики накапливаются в памяти каждого процесса, поэтому
+    у каждого воркера свой набор значений (метка pid).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = Counter()
+        self._sums = defaultdict(float)
+        self._buckets = Counter()
+
+    def observe(self, view, method, status, duration, metrics, size):
+        with self._lock:
+            self._requests[(view, method, status)] += 1
+            for name, value in (
+                    ('duration_seconds', duration),
+                    ('sql_seconds', metrics.sql_time),
+                    ('sql_queries', metrics.queries),
+                    ('view_seconds', metrics.view_time),
+                    ('render_seconds', metrics.render_time),
+                    ('response_bytes', size)):
+                self._sums[(name, view)] += value
+            for bound in DURATION_BUCKETS:
+                if duration <= bound:
+                    self._buckets[(view, bound)] += 1
+            self._buckets[(view, '+Inf')] += 1
+
+    def render(self):
+        pid = os.getpid()
+        lines = [
+            '# TYPE foodgram_requests_total counter',
+        ]
+        with self._lock:
+            requests = dict(self._requests)
+            sums = dict(self._sums)
+            buckets = dict(self._buckets)
+        counts = Counter()
+        for (view, method, status), value in sorted(requests.items()):
+            counts[view] += value
+            lines.append(
+                f'foodgram_requests_total{{pid="{pid}",view="{view}",'
+                f'method="{method}",status="{status}"}} {value}'
+            )
+        for name in ('duration_seconds', 'sql_seconds', 'sql_queries',
+                     'view_seconds', 'render_seconds', 'response_bytes'):
+            lines.append(f'# TYPE foodgram_request_{name} summary')
+            for view in sorted(counts):
+                labels = f'pid="{pid}",view="{view}"'
+                lines.append(
+                    f'foodgram_request_{name}_sum{{{labels}}} '
+                    f'{sums.get((name, view), 0)}'
+                )
+                lines.append(
+                    f'foodgram_request_{name}_count{{{labels}}} '
+                    f'{counts[view]}'
+                )
+        lines.append('# TYPE foodgram_request_duration_histogram histogram')
+        for view in sorted(counts):
+            labels = f'pid="{pid}",view="{view}"'
+            for bound in (*DURATION_BUCKETS, '+Inf'):
+                lines.append(
+                    'foodgram_request_duration_histogram_bucket'
+                    f'{{{labels},le="{bound}"}} '
+                    f'{buckets.get((view, bound), 0)}'
+                )
+            lines.append(
+                f'foodgram_request_duration_histogram_sum{{{labels}}} '
+                f'{sums.get(("duration_seconds", view), 0)}'
+            )
+            lines.append(
+                f'foodgram_request_duration_histogram_count{{{labels}}} '
+                f'{counts[view]}'
+            )
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def record_query(execute, sql, params, many, context):
+    """Обертка выполнения SQL: замер, если запрос инструментирован."""
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.execute(execute, sql, params, many, context)
+
+
+def add_query_recorder(sender=None, connection=None, **kwargs):
+    """Подключает record_query к соединению с БД (один раз).
+
+    Обертка постоянная, а не на время запроса: соединения свои
+    у каждого потока, и в режиме ASGI запросы к БД выполняются
+    в других потоках, чем middleware. Замеры передаются через
+    contextvar, который asgiref копирует в эти потоки.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedViewMixin:
+    """Замер времени представления DRF без учета SQL.
+
+    Время dispatch (аутентификация, проверка прав, подготовка
+    queryset, сериализация) за вычетом SQL, выполненного внутри,
+    добавляется к замерам запроса как view_time.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        metrics = current.get()
+        if metrics is None:
+            return super().dispatch(request, *args, **kwargs)
+        started, sql_time = time.perf_counter(), metrics.sql_time
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            metrics.view_time += (
+                time.perf_counter() - started
+                - (metrics.sql_time - sql_time)
+            )
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer с замером времени рендеринга ответа."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        metrics = current.get()
+        if metrics is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            metrics.render_time += time.perf_counter() - started
+
+
+def is_staff_request(request):
+    """Запрос сотрудника: по сессии или по токену DRF."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    try:
+        result = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return result is not None and result[0].is_staff
+
+
+class InstrumentationMiddleware:
+    """Замеры запросов: число и время SQL, время представления
+    и рендеринга (см. TimedViewMixin и TimedJSONRenderer), размер.
+
+    Для каждого запроса добавляет заголовок Server-Timing и метрики
+    в registry (см. metrics_view). Повторяющиеся формы SQL
+    (не меньше N_PLUS_ONE_THRESHOLD раз) пишутся в лог как N+1.
+
+    Профилирование cProfile: по заголовку PROFILE_HEADER от сотрудника
+    вместо ответа возвращается отчет; с вероятностью
+    PROFILE_SAMPLE_RATE отчет о запросе пишется в лог. В режиме ASGI
+    профилирование не выполняется: обработка запроса идет в разных
+    потоках.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Признак корутины для Django (как в MiddlewareMixin).
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        connection_created.connect(
+            add_query_recorder, dispatch_uid='instrumentation'
+        )
+        for connection in connections.all():
+            add_query_recorder(connection=connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.acall(request)
+        if not settings.INSTRUMENTATION_ENABLED:
+            return self.get_response(request)
+        profile = request.headers.get(settings.PROFILE_HEADER)
+        if profile and is_staff_request(request):
+            return self.profile(request)
+        if random.random() < settings.PROFILE_SAMPLE_RATE:
+            return self.profile(request, sampled=True)
+        return self.measure(request)
+
+    async def acall(self, request):
+        if not settings.INSTRUMENTATION_ENABLED:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(
+            request, response, metrics, time.perf_counter() - started
+        )
+
+    def measure(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(
+            request, response, metrics, time.perf_counter() - started
+        )
+
+    def finish(self, request, response, metrics, duration):
+        view = self.get_view_name(request)
+        size = 0 if response.streaming else len(response.content)
+        registry.observe(
+            view, request.method, response.status_code, duration,
+            metrics, size
+        )
+        response['Server-Timing'] = (
+            f'db;dur={metrics.sql_time * 1000:.1f};'
+            f'desc="{metrics.queries} queries", '
+            f'view;dur={metrics.view_time * 1000:.1f}, '
+            f'render;dur={metrics.render_time * 1000:.1f}, '
+            f'total;dur={duration * 1000:.1f}'
+        )
+        self.check_n_plus_one(request, view, metrics)
+        return response
+
+    def profile(self, request, sampled=False):
+        profiler = cProfile.Profile()
+        response = profiler.runcall(self.measure, request)
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(PROFILE_LINES)
+        if sampled:
+            profile_logger.info(
+                'Профиль %s %s:\n%s',
+                request.method, request.get_full_path(), output.getvalue()
+            )
+            return response
+        report = HttpResponse(
+            output.getvalue(), content_type='text/plain; charset=utf-8'
+        )
+        report['Server-Timing'] = response.get('Server-Timing', '')
+        return report
+
+    @staticmethod
+    def get_view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match else 'unresolved'
+
+    @staticmethod
+    def check_n_plus_one(request, view, metrics):
+        for sql, count in metrics.shapes.most_common():
+            if count < settings.N_PLUS_ONE_THRESHOLD:
+                break
+            logger.warning(
+                'Возможный N+1 в %s (%s %s): %d одинаковых запросов: %s',
+                view, request.method, request.get_full_path(), count,
+                WHITESPACE_RE.sub(' ', sql)[:500]
+            )
+
+
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus.
+
+    Доступны только с адресов METRICS_ALLOWED_IPS; nginx путь
+    /metrics/ не проксирует.
+    """
+    allowed = settings.METRICS_ALLOWED_IPS
+    if allowed and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4'
+    )
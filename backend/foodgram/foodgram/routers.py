@@ -0,0 +1,171 @@
+import asyncio
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework.permissions import SAFE_METHODS
+
+# Модели, которые всегда читаются с основной БД: токен и сессия
+# нужны сразу после входа, когда реплика может еще отставать.
+PRIMARY_MODELS = frozenset(('authtoken.token', 'sessions.session'))
+STICKY_CACHE_KEY = 'db_router:primary:{user_id}'
+
+# Маршрутизация текущего запроса; None вне запроса.
+current = ContextVar('db_routing', default=None)
+# Чтение только с основной БД (см. "use_primary").
+primary_only = ContextVar('db_primary_only', default=False)
+
+
+def get_replicas():
+    """Псевдонимы реплик: все БД, кроме основной."""
+    return [alias for alias in connections if alias != DEFAULT_DB_ALIAS]
+
+
+@contextmanager
+def use_primary():
+    """Чтение с основной БД внутри блока.
+
+    Для данных, которые кешируются для всех пользователей (кеш ответов,
+    индексы в памяти): прочитанное с отстающей реплики осталось бы
+    в кеше и после сброса.
+    """
+    token = primary_only.set(True)
+    try:
+        yield
+    finally:
+        primary_only.reset(token)
+
+
+def get_resolved_user(request):
+    """Пользователь запроса, если он уже определен.
+
+    Пользователь сессии вычисляется лениво, а пользователь токена
+    известен только после аутентификации DRF, которая записывает
+    его в request.user. Ленивый объект не вычисляется: это запросы
+    к БД, которые снова попали бы в маршрутизатор (а под ASGI
+    выполнялись бы в цикле событий).
+    """
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    return user
+
+
+def stick_to_primary(user_id):
+    """Чтение с основной БД для пользователя после его изменений."""
+    cache.set(
+        STICKY_CACHE_KEY.format(user_id=user_id), True,
+        settings.READ_YOUR_WRITES_WINDOW
+    )
+
+
+class RequestRouting:
+    """Выбор БД для чтения в рамках одного запроса.
+
+    Изменяющие запросы читают с основной БД. Безопасные - с одной
+    случайной реплики, кроме запросов пользователя, который недавно
+    сам что-то изменил (READ_YOUR_WRITES_WINDOW секунд): они читают
+    с основной БД и видят свои изменения.
+    """
+
+    def __init__(self, request, replicas):
+        self.request = request
+        self.replica = random.choice(replicas)
+        self.sticky = None
+
+    def db_for_read(self):
+        if self.request.method not in SAFE_METHODS:
+            return DEFAULT_DB_ALIAS
+        if self.sticky is None:
+            user = get_resolved_user(self.request)
+            if user is None:
+                return self.replica
+            self.sticky = user.is_authenticated and bool(cache.get(
+                STICKY_CACHE_KEY.format(user_id=user.pk)
+            ))
+        return DEFAULT_DB_ALIAS if self.sticky else self.replica
+
+
+class ReplicaRouter:
+    """Маршрутизатор БД: запись в основную, чтение запросов с реплик.
+
+    Реплики - все БД из DATABASES, кроме default (см. DB_REPLICAS
+    в настройках). С реплик читают только запросы, обработанные
+    ReplicaMiddleware; команды, сигналы вне запроса и блоки
+    "use_primary" читают с основной БД.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = current.get()
+        if (routing is None or primary_only.get()
+                or model._meta.label_lower in PRIMARY_MODELS):
+            return DEFAULT_DB_ALIAS
+        return routing.db_for_read()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Маршрутизация чтения запроса (см. ReplicaRouter).
+
+    После изменяющего запроса аутентифицированного пользователя
+    (избранное, список покупок, подписка, рецепт) его чтение
+    закрепляется за основной БД на READ_YOUR_WRITES_WINDOW секунд.
+    Метка хранится в общем кеше, поэтому действует во всех воркерах.
+    Должен стоять после AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.replicas = get_replicas()
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Признак корутины для Django (как в MiddlewareMixin).
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.acall(request)
+        if not self.replicas:
+            return self.get_response(request)
+        token = current.set(RequestRouting(request, self.replicas))
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.stick(request)
+        return response
+
+    async def acall(self, request):
+        if not self.replicas:
+            return await self.get_response(request)
+        token = current.set(RequestRouting(request, self.replicas))
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.stick(request)
+        return response
+
+    @staticmethod
+    def stick(request):
+        if request.method in SAFE_METHODS:
+            return
+        user = get_resolved_user(request)
+        if user is not None and user.is_authenticated:
+            stick_to_primary(user.pk)
@@ -41,6 +41,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # После AuthenticationMiddleware: профилирование по заголовку
+    # доступно сотрудникам, в том числе по сессии.
+    'foodgram.instrumentation.InstrumentationMiddleware',
+    'foodgram.routers.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,6 +74,14 @@ CORS_ALLOWED_ORIGINS = [
 ]
 CORS_URLS_REGEX = r'^/api/.*$'
 
+# Соединения с БД: время жизни постоянного соединения (0 - новое
+# на каждый запрос, None - без ограничения) и интервал его проверки
+# (см. api.db). DB_POOL_MODE: 'direct' - прямое подключение к Postgres,
+# 'pgbouncer' - через PgBouncer в режиме пула транзакций.
+CONN_MAX_AGE = int(os.getenv('CONN_MAX_AGE', 60))
+DB_HEALTH_CHECK_INTERVAL = int(os.getenv('DB_HEALTH_CHECK_INTERVAL', 10))
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'direct')
+
 if DEBUG:
     DATABASES = {
         'default': {
@@ -77,6 +89,7 @@ if DEBUG:
             'NAME': BASE_DIR / 'db.sqlite3',
             'AUTOCOMMIT': True,
             'ATOMIC_REQUESTS': True,
+            'CONN_MAX_AGE': CONN_MAX_AGE,
         }
     }
 else:
@@ -89,9 +102,61 @@ else:
             'HOST': os.getenv('DB_HOST', 'db'),
             'PORT': os.getenv('DB_PORT', '5432'),
             'AUTOCOMMIT': True,
-            'ATOMIC_REQUESTS': True
+            'ATOMIC_REQUESTS': True,
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            # Серверные курсоры (QuerySet.iterator()) не работают через
+            # PgBouncer в режиме пула транзакций.
+            'DISABLE_SERVER_SIDE_CURSORS': DB_POOL_MODE == 'pgbouncer',
+        }
+    }
+
+# Реплики для чтения (см. foodgram.routers), через запятую: файлы SQLite
+# или адреса Postgres вида host[:port][/name]. Безопасные запросы читают
+# с реплик, кроме READ_YOUR_WRITES_WINDOW секунд после изменений
+# пользователя. В тестах реплики - зеркала основной БД.
+DB_REPLICAS = [
+    replica.strip() for replica in os.getenv('DB_REPLICAS', '').split(',')
+    if replica.strip()
+]
+for number, replica in enumerate(DB_REPLICAS, 1):
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        location = {'NAME': replica}
+    else:
+        address, _, name = replica.partition('/')
+        host, _, port = address.partition(':')
+        location = {
+            'HOST': host,
+            'PORT': port or DATABASES['default']['PORT'],
+            'NAME': name or DATABASES['default']['NAME'],
         }
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        **location,
+        'ATOMIC_REQUESTS': False,
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_ROUTERS = ['foodgram.routers.ReplicaRouter']
+READ_YOUR_WRITES_WINDOW = int(os.getenv('READ_YOUR_WRITES_WINDOW', 5))
+
+# Кеш общий для всех процессов gunicorn (Redis в docker-compose): через
+# него проходят сброс кешей и метка чтения с основной БД. LocMemCache
+# подходит только для одного процесса (см. gunicorn.conf.py).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+# Кеш ответов /api/recipes/ анонимным пользователям (см. api.cache):
+# время жизни, блокировка вычисления ответа и ожидание чужого результата.
+RESPONSE_CACHE_TIMEOUT = 5 * 60
+RESPONSE_CACHE_LOCK_TIMEOUT = 10
+RESPONSE_CACHE_WAIT = 1.0
+RESPONSE_CACHE_POLL_INTERVAL = 0.02
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -130,17 +195,79 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Обработка картинок рецептов (см. recipes.images): ширины и число
+# фоновых потоков. RECIPE_IMAGE_SYNC - обрабатывать сразу после коммита.
+RECIPE_IMAGE_WIDTHS = (320, 640, 1280)
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_SYNC = False
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 # MEDIA_ROOT = os.path.join(BASE_DIR, 'sent_emails/')
 
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# 'memory' - индекс ингредиентов в памяти процесса, 'db' - поиск в БД.
+INGREDIENT_SEARCH_BACKEND = os.getenv('INGREDIENT_SEARCH_BACKEND', 'memory')
+INGREDIENT_SEARCH_LIMIT = 50
+# Максимум результатов поиска рецептов индексом в памяти (не Postgres).
+RECIPE_SEARCH_LIMIT = 1000
+# Время хранения записей журнала изменений индекса "что приготовить"
+# (см. recipes.pantry) и максимум ингредиентов в запросе.
+PANTRY_INDEX_CHANGE_TIMEOUT = 24 * 60 * 60
+PANTRY_MAX_INGREDIENTS = 100
+# Время хранения в кеше избранного, корзины и подписок пользователя
+# (см. api.viewer_state); кеш обновляется сквозной записью.
+VIEWER_STATE_CACHE_TIMEOUT = 10 * 60
+# Шрифт TrueType с кириллицей для списка покупок в PDF (в образе
+# backend - пакет fonts-dejavu-core).
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+# Максимум id в пакетном запросе избранного, корзины и подписок
+# (см. api.batch).
+BATCH_MAX_SIZE = 500
+
+# Замеры запросов (см. foodgram.instrumentation): метрики Prometheus
+# на /metrics/ (пустой список адресов - без ограничений), порог
+# одинаковых SQL для предупреждения об N+1, заголовок профилирования
+# cProfile для сотрудников и доля запросов, профилируемых в лог.
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', '1') == '1'
+METRICS_ALLOWED_IPS = [
+    address for address in os.getenv(
+        'METRICS_ALLOWED_IPS', '127.0.0.1'
+    ).split(',') if address
+]
+N_PLUS_ONE_THRESHOLD = 5
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+
+# Режим сервера: 'wsgi' (gunicorn, синхронные воркеры) или 'asgi'
+# (gunicorn с воркерами uvicorn, см. gunicorn.conf.py). В режиме ASGI
+# нагруженные эндпоинты чтения асинхронные (см. api.async_views)
+# и выполняются в пуле из ASYNC_VIEW_THREADS потоков на процесс.
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+ASYNC_VIEWS = SERVER_MODE == 'asgi'
+ASYNC_VIEW_THREADS = int(os.getenv('ASYNC_VIEW_THREADS', 8))
+
+
+# Начиная с этой оценки числа строк (Postgres) пагинатор не выполняет
+# точный COUNT(*), а возвращает оценку планировщика. None - выключено.
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = (
+    int(os.getenv('PAGINATION_COUNT_ESTIMATE_THRESHOLD'))
+    if os.getenv('PAGINATION_COUNT_ESTIMATE_THRESHOLD') else None
+)
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'foodgram.instrumentation.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS':
         'rest_framework.pagination.PageNumberPagination',
         'PAGE_SIZE': 6,
@@ -0,0 +1,30 @@
+"""Настройки gunicorn.
+
+SERVER_MODE=wsgi - синхронные воркеры (или gthread при
+GUNICORN_THREADS > 1), SERVER_MODE=asgi - воркеры uvicorn, каждый
+обслуживает много соединений в цикле событий. Число процессов -
+WEB_CONCURRENCY.
+
+Сброс кешей (ответы, индексы в памяти, состояния пользователя, метка
+чтения с основной БД) проходит через кеш Django, поэтому несколько
+процессов по умолчанию запускаются только с общим кешем (Redis,
+CACHE_BACKEND); с кешем в памяти процесса (LocMemCache) - один.
+"""
+import multiprocessing
+import os
+
+LOCAL_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+
+bind = '0:8000'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+shared_cache = os.getenv('CACHE_BACKEND', LOCAL_CACHE) != LOCAL_CACHE
+
+if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    default_workers = multiprocessing.cpu_count()
+else:
+    threads = int(os.getenv('GUNICORN_THREADS', 1))
+    default_workers = multiprocessing.cpu_count() * 2 + 1
+workers = int(
+    os.getenv('WEB_CONCURRENCY', default_workers if shared_cache else 1)
+)
@@ -1,8 +1,48 @@
 from django.contrib import admin
-from django.db.models import Count
 
+from .counters import recount_related
 from .models import Ingredient, Recipe, RecipeIngredient, Tag, Favorite, \
     ShoppingCart
+from .pantry import pantry_index
+from .search import reindex_recipes
+from .shopping_list import change_cart, change_recipe, recipe_amounts
+
+
+class CounterAdminMixin:
+    """Пересчитывает счетчики (см. recipes.counters) после добавления,
+    изменения и удаления строк в админке.
+
+    Админка не блокирует строки пользователей, как API, поэтому
+    счетчики затронутых объектов пересчитываются заново, а не
+    изменяются на единицу.
+    """
+
+    def counted_objects(self, objects):
+        """Строки, по которым пересчитываются счетчики: [(модель, строки)]."""
+        return [(self.model, list(objects))]
+
+    @staticmethod
+    def recount_objects(groups):
+        for model, objects in groups:
+            if objects:
+                recount_related(model, objects)
+
+    def save_model(self, request, obj, form, change):
+        groups = self.counted_objects(
+            [self.model.objects.get(pk=obj.pk)] if change else []
+        )
+        super().save_model(request, obj, form, change)
+        self.recount_objects(groups + self.counted_objects([obj]))
+
+    def delete_model(self, request, obj):
+        groups = self.counted_objects([obj])
+        super().delete_model(request, obj)
+        self.recount_objects(groups)
+
+    def delete_queryset(self, request, queryset):
+        groups = self.counted_objects(queryset)
+        super().delete_queryset(request, queryset)
+        self.recount_objects(groups)
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -49,10 +89,10 @@ class TagAdmin(admin.ModelAdmin):
     list_per_page = 30
 
 
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(CounterAdminMixin, admin.ModelAdmin):
     list_display = (
         'id', 'author', 'name', 'cooking_time', 'pub_date',
-        'recipe_likes_counter'
+        'favorites_count', 'in_carts_count'
     )
     list_select_related = (
         'author',
@@ -73,22 +113,22 @@ class RecipeAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
     list_per_page = 30
 
-    def recipe_likes_counter(self, obj):
-        return obj.recipe_likes_counter
-
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        queryset = queryset.annotate(
-            recipe_likes_counter=Count(
-                'favorite_recipes', distinct=True
+    def save_related(self, request, form, formsets, change):
+        recipe_id = form.instance.pk
+        before = recipe_amounts([recipe_id]) if change else {}
+        super().save_related(request, form, formsets, change)
+        after = recipe_amounts([recipe_id])
+        change_recipe(recipe_id, {
+            ingredient_id: (
+                after.get(ingredient_id, 0) - before.get(ingredient_id, 0)
             )
-        )
-        return queryset
-
-    recipe_likes_counter.short_description = "Число добавлений в избранное"
+            for ingredient_id in before.keys() | after.keys()
+        })
+        reindex_recipes(Recipe.objects.filter(pk=recipe_id))
+        pantry_index.record_change(recipe_id)
 
 
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(CounterAdminMixin, admin.ModelAdmin):
     list_display = (
         'owner', 'recipe'
     )
@@ -100,7 +140,7 @@ class FavoriteAdmin(admin.ModelAdmin):
     )
 
 
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(CounterAdminMixin, admin.ModelAdmin):
     list_display = (
         'owner', 'recipe'
     )
@@ -111,6 +151,22 @@ class ShoppingCartAdmin(admin.ModelAdmin):
         'owner__first_name', 'owner__last_name'
     )
 
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = ShoppingCart.objects.get(pk=obj.pk)
+            change_cart(old.owner_id, removed=[old.recipe_id])
+        super().save_model(request, obj, form, change)
+        change_cart(obj.owner_id, [obj.recipe_id])
+
+    def delete_model(self, request, obj):
+        change_cart(obj.owner_id, removed=[obj.recipe_id])
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for cart in queryset:
+            change_cart(cart.owner_id, removed=[cart.recipe_id])
+        super().delete_queryset(request, queryset)
+
 
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
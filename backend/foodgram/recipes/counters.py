@@ -0,0 +1,76 @@
+from django.apps import apps as global_apps
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+# {поле счетчика: (модель, поле внешнего ключа на владельца счетчика)}
+RECIPE_COUNTERS = {
+    'favorites_count': ('recipes.Favorite', 'recipe'),
+    'in_carts_count': ('recipes.ShoppingCart', 'recipe'),
+}
+USER_COUNTERS = {
+    'recipes_count': ('recipes.Recipe', 'author'),
+    'followers_count': ('users.Follow', 'author'),
+}
+
+
+def update_counters(queryset, **deltas):
+    """Атомарно изменяет счетчики строк queryset на заданные величины.
+
+    Изменение выполняется одним UPDATE с выражениями F(), поэтому
+    конкурентные запросы не затирают значения друг друга.
+    """
+    return queryset.update(**{
+        field: Greatest(F(field) + delta, Value(0))
+        for field, delta in deltas.items()
+    })
+
+
+def count_subquery(model, field):
+    """Подзапрос числа строк model, ссылающихся полем field на OuterRef."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        Value(0)
+    )
+
+
+def recount(queryset, counters):
+    """Пересчитывает счетчики и исправляет только расходящиеся строки.
+
+    counters - RECIPE_COUNTERS или USER_COUNTERS.
+    Возвращает число исправленных строк.
+    """
+    actual = {
+        field: count_subquery(global_apps.get_model(label), fk_field)
+        for field, (label, fk_field) in counters.items()
+    }
+    drift = Q()
+    for field in counters:
+        drift |= ~Q(**{field: F(f'actual_{field}')})
+    drifted = queryset.annotate(**{
+        f'actual_{field}': expression for field, expression in actual.items()
+    }).filter(drift)
+    return queryset.model.objects.filter(
+        pk__in=drifted.values('pk')
+    ).update(**actual)
+
+
+def recount_related(model, objects):
+    """Пересчитывает счетчики объектов, на которые ссылаются objects.
+
+    Например, для строк Favorite пересчитываются счетчики их рецептов,
+    для Recipe - счетчики авторов.
+    """
+    for counters in (RECIPE_COUNTERS, USER_COUNTERS):
+        for label, fk_field in counters.values():
+            if global_apps.get_model(label) is not model:
+                continue
+            target = model._meta.get_field(fk_field).related_model
+            recount(target.objects.filter(pk__in={
+                getattr(obj, f'{fk_field}_id') for obj in objects
+            }), counters)
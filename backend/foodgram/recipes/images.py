@@ -0,0 +1,108 @@
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.dispatch import Signal
+from PIL import Image
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+EXTENSIONS = {
+    'webp': 'webp',
+    'jpeg': 'jpg',
+}
+
+# Отправляется после сохранения Recipe.image_variants (аргумент
+# recipe_id): запись идет через update(), без post_save.
+variants_built = Signal()
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-images'
+)
+
+
+def variant_name(image_name, width, image_format):
+    """Имя производного файла: recipes/<хеш оригинала>_<ширина>.<формат>.
+
+    Имя оригинала уже содержит хеш содержимого (см. api.fields),
+    поэтому имена производных файлов тоже неизменяемы.
+    """
+    stem, _ = posixpath.splitext(image_name)
+    return f'{stem}_{width}.{EXTENSIONS[image_format]}'
+
+
+def encode(image, image_format):
+    pil_format, options = FORMATS[image_format]
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def build_variants(recipe_id, image_name):
+    """Создает уменьшенные копии изображения рецепта во всех форматах.
+
+    Сохраняет словарь {формат: {ширина: путь}} в Recipe.image_variants,
+    если за время обработки изображение рецепта не сменилось,
+    и отправляет сигнал variants_built.
+    """
+    variants = {image_format: {} for image_format in FORMATS}
+    with default_storage.open(image_name) as file:
+        with Image.open(file) as original:
+            original.load()
+            widths = [
+                width for width in settings.RECIPE_IMAGE_WIDTHS
+                if width <= original.width
+            ] or [min(settings.RECIPE_IMAGE_WIDTHS)]
+            for width in widths:
+                image = original.copy()
+                image.thumbnail(
+                    (width, width * 4), Image.Resampling.LANCZOS
+                )
+                for image_format in FORMATS:
+                    name = variant_name(image_name, width, image_format)
+                    if not default_storage.exists(name):
+                        default_storage.save(name, encode(image, image_format))
+                    variants[image_format][str(width)] = name
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=image_name
+    ).update(image_variants=variants)
+    if updated:
+        variants_built.send(sender=Recipe, recipe_id=recipe_id)
+
+
+def run_build_variants(recipe_id, image_name):
+    try:
+        build_variants(recipe_id, image_name)
+    except Exception:
+        logger.exception(
+            'Ошибка обработки изображения %s рецепта %s', image_name, recipe_id
+        )
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(recipe):
+    """Ставит обработку изображения в фоновый пул после коммита."""
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    if settings.RECIPE_IMAGE_SYNC:
+        transaction.on_commit(
+            lambda: build_variants(recipe_id, image_name)
+        )
+    else:
+        transaction.on_commit(
+            lambda: executor.submit(run_build_variants, recipe_id, image_name)
+        )
@@ -0,0 +1,214 @@
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from recipes.counters import RECIPE_COUNTERS, USER_COUNTERS, recount
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.pantry import pantry_index
+from recipes.ranking import rebuild_ranking
+from recipes.search import reindex_recipes
+from recipes.shopping_list import rebuild
+from users.models import Follow, User
+from ._private import batched, raw_auto_now_add
+
+PASSWORD = 'benchmark-password'
+BATCH_SIZE: int = 2000
+# Даты рецептов и добавлений в избранное - за последние DAYS дней.
+DAYS: int = 60
+WORDS = (
+    'борщ', 'суп', 'салат', 'пирог', 'каша', 'омлет', 'паста', 'рагу',
+    'плов', 'блины', 'котлеты', 'запеканка', 'рис', 'гречка', 'курица',
+    'говядина', 'рыба', 'грибы', 'сыр', 'томаты', 'картофель', 'лук',
+    'морковь', 'капуста', 'перец', 'чеснок', 'яблоки', 'ягоды', 'мед',
+    'молоко', 'сметана', 'творог', 'яйца', 'мука', 'масло', 'зелень',
+)
+ADJECTIVES = (
+    'домашний', 'быстрый', 'летний', 'пряный', 'сытный', 'легкий',
+    'праздничный', 'острый', 'сливочный', 'постный', 'бабушкин',
+)
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F9A62B', '#2D9CDB')
+
+
+def weighted_sample(rng, population, cum_weights, count):
+    """count разных элементов population с вероятностью по весам."""
+    count = min(count, len(population))
+    chosen = set()
+    while len(chosen) < count:
+        chosen.update(rng.choices(
+            population, cum_weights=cum_weights, k=count - len(chosen)
+        ))
+    return list(chosen)
+
+
+def zipf_weights(count):
+    """Накопленные веса 1/k: немногие элементы популярнее остальных."""
+    return list(accumulate(1 / rank for rank in range(1, count + 1)))
+
+
+class Dataset:
+    """Синтетические данные заданного размера.
+
+    Генерация детерминирована (random.Random(seed)): при одинаковых
+    параметрах получаются одинаковые данные. Авторы рецептов,
+    ингредиенты и избранные рецепты выбираются по закону Ципфа,
+    даты распределены по последним DAYS дням. Строки вставляются
+    пакетами bulk_create, после чего пересчитываются счетчики,
+    рейтинг популярных рецептов и поисковые данные.
+    """
+
+    def __init__(self, seed=0, users=100, recipes=1000, ingredients=500,
+                 ingredients_per_recipe=8, tags=8, favorites=20, cart=5,
+                 follows=10):
+        self.rng = random.Random(seed)
+        self.now = timezone.now()
+        self.sizes = {
+            'users': users, 'recipes': recipes, 'ingredients': ingredients,
+            'ingredients_per_recipe': ingredients_per_recipe, 'tags': tags,
+            'favorites': favorites, 'cart': cart, 'follows': follows,
+        }
+
+    def past(self):
+        return self.now - timedelta(seconds=self.rng.randrange(DAYS * 86400))
+
+    def words(self, count):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count))
+
+    def create(self):
+        sizes = self.sizes
+        self.tags = self.create_tags(sizes['tags'])
+        self.ingredients = self.create_ingredients(sizes['ingredients'])
+        self.users = self.create_users(sizes['users'])
+        self.recipes = self.create_recipes(sizes['recipes'])
+        self.create_recipe_tags()
+        self.create_recipe_ingredients(sizes['ingredients_per_recipe'])
+        self.create_choices(Favorite, sizes['favorites'])
+        self.create_choices(ShoppingCart, sizes['cart'])
+        self.create_follows(sizes['follows'])
+        recount(Recipe.objects.all(), RECIPE_COUNTERS)
+        recount(User.objects.all(), USER_COUNTERS)
+        rebuild_ranking(7, DAYS, 100)
+        for owner_ids in batched(self.users, 1000):
+            rebuild(owner_ids)
+        reindex_recipes(Recipe.objects.all())
+        pantry_index.invalidate()
+        return self
+
+    def create_tags(self, count):
+        Tag.objects.bulk_create(
+            Tag(
+                name=f'тег {number}', slug=f'tag-{number}',
+                color=COLORS[number % len(COLORS)]
+            )
+            for number in range(count)
+        )
+        return list(Tag.objects.order_by('pk'))
+
+    def create_ingredients(self, count):
+        objects = (
+            Ingredient(
+                name=f'{self.rng.choice(WORDS)} {number}',
+                measurement_unit=self.rng.choice(UNITS)
+            )
+            for number in range(count)
+        )
+        for batch in batched(objects, BATCH_SIZE):
+            Ingredient.objects.bulk_create(batch)
+        return list(Ingredient.objects.order_by('pk').values_list(
+            'pk', flat=True
+        ))
+
+    def create_users(self, count):
+        # Хеш пароля вычисляется один раз: он одинаков у всех.
+        password = make_password(PASSWORD)
+        objects = (
+            User(
+                username=f'user{number}', email=f'user{number}@example.com',
+                first_name=self.rng.choice(ADJECTIVES).capitalize(),
+                last_name=self.rng.choice(WORDS).capitalize(),
+                password=password
+            )
+            for number in range(count)
+        )
+        for batch in batched(objects, BATCH_SIZE):
+            User.objects.bulk_create(batch)
+        return list(User.objects.order_by('pk').values_list('pk', flat=True))
+
+    def create_recipes(self, count):
+        authors = zipf_weights(len(self.users))
+        objects = (
+            Recipe(
+                author_id=self.rng.choices(self.users, cum_weights=authors)[0],
+                name=(f'{self.rng.choice(ADJECTIVES)} '
+                      f'{self.rng.choice(WORDS)} {number}'),
+                text=self.words(self.rng.randint(10, 60)),
+                image='recipes/benchmark.png',
+                cooking_time=self.rng.randint(5, 180),
+                pub_date=self.past()
+            )
+            for number in range(count)
+        )
+        with raw_auto_now_add(Recipe):
+            for batch in batched(objects, BATCH_SIZE):
+                Recipe.objects.bulk_create(batch)
+        return list(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        )
+
+    def create_recipe_tags(self):
+        RecipeTag = Recipe.tags.through
+        links = (
+            RecipeTag(recipe_id=recipe_id, tag_id=tag.pk)
+            for recipe_id in self.recipes
+            for tag in self.rng.sample(
+                self.tags, self.rng.randint(1, min(3, len(self.tags)))
+            )
+        )
+        for batch in batched(links, BATCH_SIZE):
+            RecipeTag.objects.bulk_create(batch)
+
+    def create_recipe_ingredients(self, average):
+        weights = zipf_weights(len(self.ingredients))
+        objects = (
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=self.rng.randint(1, 500)
+            )
+            for recipe_id in self.recipes
+            for ingredient_id in weighted_sample(
+                self.rng, self.ingredients, weights,
+                self.rng.randint(max(1, average // 2), average * 3 // 2 or 1)
+            )
+        )
+        for batch in batched(objects, BATCH_SIZE):
+            RecipeIngredient.objects.bulk_create(batch)
+
+    def create_choices(self, model, per_user):
+        weights = zipf_weights(len(self.recipes))
+        objects = (
+            model(owner_id=user_id, recipe_id=recipe_id, add_date=self.past())
+            for user_id in self.users
+            for recipe_id in weighted_sample(
+                self.rng, self.recipes, weights, per_user
+            )
+        )
+        with raw_auto_now_add(model):
+            for batch in batched(objects, BATCH_SIZE):
+                model.objects.bulk_create(batch)
+
+    def create_follows(self, per_user):
+        weights = zipf_weights(len(self.users))
+        objects = (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in self.users
+            for author_id in weighted_sample(
+                self.rng, self.users, weights, per_user + 1
+            )[:per_user]
+            if author_id != user_id
+        )
+        for batch in batched(objects, BATCH_SIZE):
+            Follow.objects.bulk_create(batch)
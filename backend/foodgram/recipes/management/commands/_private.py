@@ -0,0 +1,105 @@
+import base64
+import csv
+import io
+import json
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from PIL import Image
+
+JSON_CHUNK_SIZE: int = 1 << 16
+
+
+def batched(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не более size."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_csv(path, columns):
+    """Построчно читает csv-файл и отдает словари {колонка: значение}.
+
+    Колонки с именем None пропускаются.
+    """
+    with open(path, encoding='utf8') as file:
+        for row in csv.reader(file, delimiter=','):
+            yield {
+                column: value for column, value in zip(columns, row)
+                if column is not None
+            }
+
+
+def iter_json_array(path, chunk_size=JSON_CHUNK_SIZE):
+    """Потоково читает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf8') as file:
+        buffer = file.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise CommandError(f'Файл {path} не содержит JSON-массив')
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip()
+            if buffer.startswith(','):
+                buffer = buffer[1:].lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    raise CommandError(f'Некорректный JSON в файле {path}')
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+@contextmanager
+def raw_auto_now_add(model):
+    """Отключает auto_now_add, чтобы сохранить даты из фикстуры.
+
+    bulk_create, в отличие от loaddata, вызывает pre_save полей
+    и иначе перезаписал бы даты текущим временем.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def make_image():
+    """Картинка 8x8 PNG в виде data URI для Base64ImageField."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def use_test_mirrors():
+    """Переключает реплики (TEST MIRROR) на тестовую основную БД.
+
+    Как это делает тестовый раннер Django: после create_test_db
+    реплики продолжали бы указывать на рабочие БД.
+    """
+    primary = connections[DEFAULT_DB_ALIAS]
+    for alias in connections:
+        mirror = connections[alias].settings_dict['TEST'].get('MIRROR')
+        if alias != DEFAULT_DB_ALIAS and mirror == DEFAULT_DB_ALIAS:
+            connections[alias].close()
+            connections[alias].creation.set_as_test_mirror(
+                primary.settings_dict
+            )
@@ -0,0 +1,537 @@
+import json
+import math
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import ExitStack
+from itertools import cycle
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from users.models import Follow, User
+from ._dataset import PASSWORD, WORDS, Dataset
+from ._private import make_image, use_test_mirrors
+
+REPEAT: int = 20
+WARMUP: int = 3
+ALLOCATIONS: int = 3
+MAX_SLOWDOWN: float = 0.2
+MAX_ALLOCATION_GROWTH: float = 0.2
+PAGES: int = 5
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+# request(итерация) выполняет запрос; prepare(итерация), если задан,
+# готовит данные для запроса и в замеры не входит.
+Scenario = namedtuple(
+    'Scenario', ('name', 'expected', 'request', 'prepare'),
+    defaults=(None,)
+)
+
+
+def percentile(values, share):
+    """Процентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест API: все эндпоинты api/urls.py через '
+            'тестовый клиент на синтетических данных во временной '
+            'тестовой БД. Для каждого сценария измеряются p50/p95 '
+            'времени ответа, число SQL-запросов и память (tracemalloc). '
+            'Результат можно сохранить в JSON (--output) и сравнить '
+            'с предыдущим запуском (--compare)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8
+        )
+        parser.add_argument('--tags', type=int, default=8)
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Избранных рецептов у пользователя'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Рецептов в корзине у пользователя'
+        )
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Подписок у пользователя'
+        )
+        parser.add_argument('--repeat', type=int, default=REPEAT)
+        parser.add_argument('--warmup', type=int, default=WARMUP)
+        parser.add_argument(
+            '--only', nargs='+', default=None,
+            help='Выполнить только сценарии с этими именами'
+        )
+        parser.add_argument('--output', help='Файл для результатов (JSON)')
+        parser.add_argument(
+            '--compare', help='Файл с результатами предыдущего запуска'
+        )
+        parser.add_argument(
+            '--max-slowdown', type=float, default=MAX_SLOWDOWN,
+            help='Допустимый относительный рост p50'
+        )
+
+    def handle(self, *args, **options):
+        sizes = {
+            name: options[name] for name in (
+                'seed', 'users', 'recipes', 'ingredients',
+                'ingredients_per_recipe', 'tags', 'favorites', 'cart',
+                'follows',
+            )
+        }
+        if sizes['users'] < 2 or sizes['recipes'] < 1:
+            raise CommandError('Нужны хотя бы 2 пользователя и 1 рецепт')
+        self.iterations = (
+            options['warmup'] + options['repeat'] + ALLOCATIONS
+        )
+        old_name = connection.settings_dict['NAME']
+        # Отдельная тестовая БД: on_commit-обработчики выполняются
+        # как в работе, а рабочие данные не затрагиваются.
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        use_test_mirrors()
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(
+                        CACHES=BENCHMARK_CACHES, MEDIA_ROOT=media_root,
+                        RECIPE_IMAGE_SYNC=True, PROFILE_SAMPLE_RATE=0):
+                    self.stdout.write('Создание данных...')
+                    self.dataset = Dataset(**sizes).create()
+                    results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+                'warmup': options['warmup'],
+                'dataset': sizes,
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(report, options['compare'], options['max_slowdown'])
+
+    def run(self, options):
+        scenarios = self.get_scenarios()
+        if options['only']:
+            unknown = set(options['only']) - {
+                scenario.name for scenario in scenarios
+            }
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные сценарии: {", ".join(sorted(unknown))}'
+                )
+            scenarios = [
+                scenario for scenario in scenarios
+                if scenario.name in options['only']
+            ]
+        self.stdout.write(
+            f'{"сценарий":<34} {"p50, мс":>8} {"p95, мс":>8} '
+            f'{"SQL":>4} {"память, КБ":>10} {"ответ, Б":>9}'
+        )
+        results = {}
+        for scenario in scenarios:
+            result = self.measure(
+                scenario, options['warmup'], options['repeat']
+            )
+            results[scenario.name] = result
+            self.stdout.write(
+                f'{scenario.name:<34} {result["p50_ms"]:>8.2f} '
+                f'{result["p95_ms"]:>8.2f} {result["queries"]:>4} '
+                f'{result["allocated_peak_kb"]:>10.1f} '
+                f'{result["response_bytes"]:>9}'
+            )
+        return results
+
+    def call(self, scenario, iteration):
+        response = scenario.request(iteration)
+        content = (
+            b''.join(response.streaming_content) if response.streaming
+            else response.content
+        )
+        if response.status_code != scenario.expected:
+            raise CommandError(
+                f'{scenario.name}: ответ {response.status_code} '
+                f'вместо {scenario.expected}: '
+                f'{content[:200]!r}'
+            )
+        return content
+
+    def measure(self, scenario, warmup, repeat):
+        prepare = scenario.prepare or (lambda iteration: None)
+        for iteration in range(warmup):
+            prepare(iteration)
+            self.call(scenario, iteration)
+        timings, queries, sizes = [], [], []
+        for iteration in range(warmup, warmup + repeat):
+            prepare(iteration)
+            with ExitStack() as stack:
+                # Все соединения: безопасные запросы читают с реплик.
+                captured = [
+                    stack.enter_context(CaptureQueriesContext(db))
+                    for db in connections.all()
+                ]
+                started = time.perf_counter()
+                content = self.call(scenario, iteration)
+                timings.append(time.perf_counter() - started)
+            queries.append(sum(map(len, captured)))
+            sizes.append(len(content))
+        # Память - отдельными вызовами: tracemalloc замедляет код
+        # и исказил бы время ответа.
+        peaks = []
+        tracemalloc.start()
+        try:
+            for iteration in range(warmup + repeat, self.iterations):
+                prepare(iteration)
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                self.call(scenario, iteration)
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+        return {
+            'p50_ms': round(statistics.median(timings) * 1000, 3),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+            'mean_ms': round(statistics.mean(timings) * 1000, 3),
+            'queries': int(statistics.median(queries)),
+            'queries_max': max(queries),
+            'allocated_peak_kb': round(statistics.median(peaks) / 1024, 1),
+            'response_bytes': int(statistics.median(sizes)),
+        }
+
+    def client(self, user_id=None):
+        client = APIClient()
+        if user_id is not None:
+            client.force_authenticate(User.objects.get(pk=user_id))
+        return client
+
+    def unused(self, model, field, owner_field, owner_id, candidates,
+               exclude=()):
+        """Первые self.iterations из candidates, не связанных с владельцем.
+
+        Нужны сценариям добавления (избранное, подписки): каждая
+        итерация добавляет новый объект, а парный сценарий удаления
+        удаляет те же объекты.
+        """
+        used = set(model.objects.filter(
+            **{owner_field: owner_id}
+        ).values_list(field, flat=True))
+        result = [
+            pk for pk in candidates if pk not in used and pk not in exclude
+        ][:self.iterations]
+        if len(result) < self.iterations:
+            raise CommandError(
+                f'Недостаточно данных для сценариев {model.__name__}: '
+                'увеличьте --users/--recipes'
+            )
+        return result
+
+    def get_scenarios(self):
+        """Список сценариев Scenario.
+
+        Сценарии выполняются по порядку; сценарии изменения данных
+        идут парами (создание и удаление тех же объектов), чтобы
+        следующие сценарии видели исходные данные.
+        """
+        dataset = self.dataset
+        me = dataset.users[0]
+        email = User.objects.get(pk=dataset.users[1]).email
+        anon, client = self.client(), self.client(me)
+        recipes = cycle(dataset.recipes)
+        pages = [page % PAGES + 1 for page in range(self.iterations)]
+        own_recipes = list(
+            Recipe.objects.filter(author=me).values_list('pk', flat=True)
+        ) or dataset.recipes
+        pantry = list(
+            RecipeIngredient.objects.filter(
+                recipe_id=own_recipes[0]
+            ).values_list('ingredient_id', flat=True)
+        )
+        favorites = self.unused(
+            Favorite, 'recipe_id', 'owner_id', me, dataset.recipes
+        )
+        cart = self.unused(
+            ShoppingCart, 'recipe_id', 'owner_id', me, dataset.recipes
+        )
+        authors = self.unused(
+            Follow, 'author_id', 'user_id', me, dataset.users, exclude={me}
+        )
+        image = make_image()
+        created, tokens = [], []
+        passwords = [PASSWORD]
+
+        def call(client, method, url):
+            """Запрос method по адресу url(итерация) без тела."""
+            return lambda iteration: getattr(client, method)(url(iteration))
+
+        def batch(url, ids, field):
+            """Пакетный сценарий field ("add" или "remove") всех ids.
+
+            Перед каждой итерацией связи возвращаются в исходное
+            состояние обратным пакетным запросом.
+            """
+            other = 'remove' if field == 'add' else 'add'
+            return (
+                lambda iteration: client.post(
+                    url, {field: ids}, format='json'
+                ),
+                lambda iteration: client.post(
+                    url, {other: ids}, format='json'
+                ),
+            )
+
+        def recipe_payload(iteration):
+            return {
+                'name': f'benchmark {iteration}', 'text': 'benchmark',
+                'cooking_time': 10, 'image': image,
+                'tags': [tag.pk for tag in dataset.tags[:2]],
+                'ingredients': [
+                    {'id': pk, 'amount': 10}
+                    for pk in dataset.ingredients[
+                        :dataset.sizes['ingredients_per_recipe']
+                    ]
+                ],
+            }
+
+        def create_recipe(iteration):
+            response = client.post(
+                '/api/recipes/', recipe_payload(iteration), format='json'
+            )
+            created.append(response.json().get('id'))
+            return response
+
+        def update_recipe(iteration):
+            payload = recipe_payload(iteration)
+            payload['name'] = f'benchmark updated {iteration}'
+            return client.patch(
+                f'/api/recipes/{created[iteration]}/', payload,
+                format='json'
+            )
+
+        def create_token(iteration):
+            # Выход удаляет токен, а вход возвращает существующий,
+            # поэтому перед каждым выходом токен создается заново.
+            tokens.append(
+                Token.objects.get_or_create(user_id=dataset.users[1])[0].key
+            )
+
+        def logout(iteration):
+            token_client = APIClient()
+            token_client.credentials(
+                HTTP_AUTHORIZATION=f'Token {tokens[-1]}'
+            )
+            return token_client.post('/api/auth/token/logout/')
+
+        def set_password(iteration):
+            passwords.append(f'Benchmark-{iteration}-password')
+            return client.post('/api/users/set_password/', {
+                'current_password': passwords[-2],
+                'new_password': passwords[-1],
+            }, format='json')
+
+        tag_slugs = '&'.join(f'tags={tag.slug}' for tag in dataset.tags[:2])
+        pantry = ','.join(map(str, pantry))
+        return [
+            Scenario('users-list', 200, call(
+                client, 'get', lambda i: f'/api/users/?page={pages[i]}'
+            )),
+            Scenario('users-detail', 200, call(
+                client, 'get', lambda i: f'/api/users/{me}/'
+            )),
+            Scenario('users-me', 200, call(
+                client, 'get', lambda i: '/api/users/me/'
+            )),
+            Scenario('users-subscriptions', 200, call(
+                client, 'get',
+                lambda i: '/api/users/subscriptions/?recipes_limit=3'
+            )),
+            Scenario('users-create', 201, lambda i: anon.post('/api/users/', {
+                'email': f'benchmark{i}@example.com',
+                'username': f'benchmark{i}', 'first_name': 'Benchmark',
+                'last_name': 'Benchmark', 'password': PASSWORD,
+            }, format='json')),
+            Scenario('users-set-password', 204, set_password),
+            Scenario('auth-token-login', 200, lambda i: anon.post(
+                '/api/auth/token/login/',
+                {'email': email, 'password': PASSWORD}, format='json'
+            )),
+            Scenario('auth-token-logout', 204, logout, create_token),
+            Scenario('users-subscribe-post', 201, call(
+                client, 'post', lambda i: f'/api/users/{authors[i]}/subscribe/'
+            )),
+            Scenario('users-subscribe-delete', 204, call(
+                client, 'delete',
+                lambda i: f'/api/users/{authors[i]}/subscribe/'
+            )),
+            Scenario('users-subscribe-batch-add', 200, *batch(
+                '/api/users/subscribe/batch/', authors, 'add'
+            )),
+            Scenario('users-subscribe-batch-remove', 200, *batch(
+                '/api/users/subscribe/batch/', authors, 'remove'
+            )),
+            Scenario('tags-list', 200, call(
+                anon, 'get', lambda i: '/api/tags/'
+            )),
+            Scenario('tags-detail', 200, call(
+                anon, 'get', lambda i: f'/api/tags/{dataset.tags[0].pk}/'
+            )),
+            Scenario('ingredients-list', 200, call(
+                anon, 'get',
+                lambda i: f'/api/ingredients/?name={WORDS[i % 10][:3]}'
+            )),
+            Scenario('ingredients-detail', 200, call(
+                anon, 'get',
+                lambda i: f'/api/ingredients/{dataset.ingredients[0]}/'
+            )),
+            Scenario('recipes-list-anonymous', 200, call(
+                anon, 'get', lambda i: f'/api/recipes/?page={pages[i]}'
+            )),
+            Scenario('recipes-list', 200, call(
+                client, 'get', lambda i: f'/api/recipes/?page={pages[i]}'
+            )),
+            Scenario('recipes-list-tags', 200, call(
+                client, 'get', lambda i: f'/api/recipes/?{tag_slugs}'
+            )),
+            Scenario('recipes-list-author', 200, call(
+                client, 'get', lambda i: f'/api/recipes/?author={me}'
+            )),
+            Scenario('recipes-list-favorited', 200, call(
+                client, 'get', lambda i: '/api/recipes/?is_favorited=1'
+            )),
+            Scenario('recipes-list-in-cart', 200, call(
+                client, 'get', lambda i: '/api/recipes/?is_in_shopping_cart=1'
+            )),
+            Scenario('recipes-list-search', 200, call(
+                client, 'get',
+                lambda i: f'/api/recipes/?search={WORDS[i % 10]}'
+            )),
+            Scenario('recipes-detail-anonymous', 200, call(
+                anon, 'get', lambda i: f'/api/recipes/{next(recipes)}/'
+            )),
+            Scenario('recipes-detail', 200, call(
+                client, 'get', lambda i: f'/api/recipes/{next(recipes)}/'
+            )),
+            Scenario('recipes-feed', 200, call(
+                client, 'get', lambda i: '/api/recipes/feed/'
+            )),
+            Scenario('recipes-popular', 200, call(
+                client, 'get', lambda i: '/api/recipes/popular/'
+            )),
+            Scenario('recipes-what-to-cook', 200, call(
+                client, 'get',
+                lambda i: f'/api/recipes/what_to_cook/?ingredients={pantry}'
+            )),
+            Scenario('recipes-download-shopping-cart', 200, call(
+                client, 'get',
+                lambda i: '/api/recipes/download_shopping_cart/'
+            )),
+            Scenario('recipes-download-shopping-cart-csv', 200, call(
+                client, 'get',
+                lambda i: '/api/recipes/download_shopping_cart/?format=csv'
+            )),
+            Scenario('recipes-favorite-post', 201, call(
+                client, 'post',
+                lambda i: f'/api/recipes/{favorites[i]}/favorite/'
+            )),
+            Scenario('recipes-favorite-delete', 204, call(
+                client, 'delete',
+                lambda i: f'/api/recipes/{favorites[i]}/favorite/'
+            )),
+            Scenario('recipes-shopping-cart-post', 201, call(
+                client, 'post',
+                lambda i: f'/api/recipes/{cart[i]}/shopping_cart/'
+            )),
+            Scenario('recipes-shopping-cart-delete', 204, call(
+                client, 'delete',
+                lambda i: f'/api/recipes/{cart[i]}/shopping_cart/'
+            )),
+            Scenario('recipes-favorite-batch-add', 200, *batch(
+                '/api/recipes/favorite/batch/', favorites, 'add'
+            )),
+            Scenario('recipes-favorite-batch-remove', 200, *batch(
+                '/api/recipes/favorite/batch/', favorites, 'remove'
+            )),
+            Scenario('recipes-shopping-cart-batch-add', 200, *batch(
+                '/api/recipes/shopping_cart/batch/', cart, 'add'
+            )),
+            Scenario('recipes-shopping-cart-batch-remove', 200, *batch(
+                '/api/recipes/shopping_cart/batch/', cart, 'remove'
+            )),
+            Scenario('recipes-create', 201, create_recipe),
+            Scenario('recipes-partial-update', 200, update_recipe),
+            Scenario('recipes-destroy', 204, call(
+                client, 'delete', lambda i: f'/api/recipes/{created[i]}/'
+            )),
+        ]
+
+    def compare(self, report, path, max_slowdown):
+        """Сравнивает результаты с файлом path; при регрессии - ошибка.
+
+        Регрессией считается рост p50 больше чем на max_slowdown,
+        рост числа SQL-запросов и рост памяти больше чем
+        на MAX_ALLOCATION_GROWTH.
+        """
+        with open(path, encoding='utf8') as file:
+            baseline = json.load(file)
+        if baseline['meta']['dataset'] != report['meta']['dataset']:
+            self.stdout.write(self.style.WARNING(
+                'Параметры данных отличаются от сравниваемого запуска'
+            ))
+        regressions = []
+        for name, result in report['results'].items():
+            before = baseline['results'].get(name)
+            if before is None:
+                continue
+            if result['p50_ms'] > before['p50_ms'] * (1 + max_slowdown):
+                regressions.append(
+                    f'{name}: p50 {before["p50_ms"]:.2f} -> '
+                    f'{result["p50_ms"]:.2f} мс'
+                )
+            if result['queries'] > before['queries']:
+                regressions.append(
+                    f'{name}: запросов {before["queries"]} -> '
+                    f'{result["queries"]}'
+                )
+            if (result['allocated_peak_kb'] > before['allocated_peak_kb']
+                    * (1 + MAX_ALLOCATION_GROWTH)):
+                regressions.append(
+                    f'{name}: память {before["allocated_peak_kb"]} -> '
+                    f'{result["allocated_peak_kb"]} КБ'
+                )
+        if regressions:
+            raise CommandError(
+                'Регрессии производительности:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Регрессий относительно {path} нет'
+        ))
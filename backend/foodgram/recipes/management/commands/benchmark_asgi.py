@@ -0,0 +1,306 @@
+import asyncio
+import importlib
+import io
+import os
+import queue
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.urls import clear_url_caches
+from rest_framework.authtoken.models import Token
+
+from ._dataset import Dataset
+from ._private import use_test_mirrors
+from .benchmark_api import BENCHMARK_CACHES, percentile
+
+REQUESTS: int = 400
+CLIENTS: int = 50
+DB_LATENCY: float = 0.002
+CLIENT_DELAY: float = 0.05
+
+
+def use_async_views(enabled):
+    """Пересобирает маршруты API с асинхронными представлениями или без.
+
+    Маршруты читают ASYNC_VIEWS при импорте, поэтому модули urls
+    перезагружаются.
+    """
+    with override_settings(ASYNC_VIEWS=enabled):
+        clear_url_caches()
+        importlib.reload(importlib.import_module('api.urls'))
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+
+
+class Command(BaseCommand):
+    help = ('Пропускная способность одного процесса-воркера под '
+            'нагрузкой медленных клиентов: WSGI (синхронный воркер '
+            'gunicorn), ASGI с синхронными представлениями и ASGI '
+            'с асинхронными представлениями (см. api.async_views). '
+            'Запросы к нагруженным эндпоинтам чтения выполняются '
+            'обработчиками Django напрямую, без сети; задержка клиента '
+            'и сетевая задержка БД моделируются паузами')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=REQUESTS)
+        parser.add_argument(
+            '--clients', type=int, default=CLIENTS,
+            help='Одновременных клиентов'
+        )
+        parser.add_argument(
+            '--client-delay', type=float, default=CLIENT_DELAY,
+            help='Время передачи ответа медленному клиенту, с'
+        )
+        parser.add_argument(
+            '--db-latency', type=float, default=DB_LATENCY,
+            help='Задержка каждого SQL-запроса, с'
+        )
+        parser.add_argument(
+            '--wsgi-threads', type=int, default=1,
+            help='Потоков синхронного воркера (gthread)'
+        )
+        parser.add_argument(
+            '--asgi-threads', type=int, default=settings.ASYNC_VIEW_THREADS,
+            help='Потоков пула асинхронных представлений'
+        )
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=100)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # Файл, а не БД в памяти: с ней работают несколько потоков.
+                connection.settings_dict['TEST']['NAME'] = os.path.join(
+                    directory, 'benchmark.sqlite3'
+                )
+            connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False
+            )
+            use_test_mirrors()
+            try:
+                with override_settings(
+                        CACHES=BENCHMARK_CACHES, MEDIA_ROOT=directory,
+                        PROFILE_SAMPLE_RATE=0,
+                        ASYNC_VIEW_THREADS=options['asgi_threads']):
+                    self.run(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                use_async_views(settings.ASYNC_VIEWS)
+
+    def run(self, options):
+        self.stdout.write('Создание данных...')
+        dataset = Dataset(
+            users=options['users'], recipes=options['recipes']
+        ).create()
+        user_id = dataset.users[0]
+        token = Token.objects.create(user_id=user_id).key
+        recipes = dataset.recipes
+        paths = [
+            ('/api/recipes/', f'page={number % 5 + 1}')
+            for number in range(5)
+        ] + [
+            (f'/api/recipes/{recipes[number % len(recipes)]}/', '')
+            for number in range(5)
+        ] + [
+            ('/api/tags/', ''),
+            ('/api/ingredients/', urlencode({'name': 'са'})),
+            ('/api/users/subscriptions/', 'recipes_limit=3'),
+        ]
+        self.paths = [
+            (path, query, token) for path, query in paths
+        ]
+        latency = options['db_latency']
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            if slow_query not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow_query)
+
+        connection_created.connect(add_latency, dispatch_uid='benchmark')
+        try:
+            results = {
+                'WSGI': self.run_wsgi(options),
+                'ASGI, синхронные представления': self.run_asgi(
+                    options, async_views=False
+                ),
+                'ASGI, асинхронные представления': self.run_asgi(
+                    options, async_views=True
+                ),
+            }
+        finally:
+            connection_created.disconnect(dispatch_uid='benchmark')
+        self.stdout.write(
+            f'{"режим":<32} {"запросов/с":>10} {"p50, мс":>8} '
+            f'{"p95, мс":>8}'
+        )
+        for name, (throughput, timings) in results.items():
+            self.stdout.write(
+                f'{name:<32} {throughput:>10.1f} '
+                f'{statistics.median(timings) * 1000:>8.1f} '
+                f'{percentile(timings, 0.95) * 1000:>8.1f}'
+            )
+
+    def environ(self, path, query, token):
+        return {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_AUTHORIZATION': f'Token {token}',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'http',
+            'wsgi.version': (1, 0),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+
+    def scope(self, path, query, token):
+        return {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [
+                (b'host', b'localhost'),
+                (b'authorization', f'Token {token}'.encode()),
+            ],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+
+    def run_wsgi(self, options):
+        """Синхронный воркер: поток занят запросом и передачей ответа.
+
+        Запросы клиентов ждут в очереди (как в очереди accept сокета)
+        свободного потока воркера, поэтому одновременно обслуживается
+        не больше --wsgi-threads запросов.
+        """
+        use_async_views(False)
+        handler = WSGIHandler()
+        numbers = count()
+        lock = threading.Lock()
+        requests = queue.Queue()
+        timings, errors = [], []
+
+        def start_response(status, headers, exc_info=None):
+            assert status.startswith('200'), status
+
+        def worker():
+            while True:
+                item = requests.get()
+                if item is None:
+                    return
+                number, done = item
+                try:
+                    response = handler(
+                        self.environ(*self.paths[number % len(self.paths)]),
+                        start_response
+                    )
+                    try:
+                        b''.join(response)
+                        time.sleep(options['client_delay'])
+                    finally:
+                        response.close()
+                except Exception as error:
+                    errors.append(error)
+                finally:
+                    done.set()
+
+        def client():
+            while True:
+                with lock:
+                    number = next(numbers)
+                if number >= options['requests']:
+                    return
+                started = time.perf_counter()
+                done = threading.Event()
+                requests.put((number, done))
+                done.wait()
+                timings.append(time.perf_counter() - started)
+
+        workers = [
+            threading.Thread(target=worker)
+            for _ in range(options['wsgi_threads'])
+        ]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        with ThreadPoolExecutor(options['clients']) as pool:
+            futures = [pool.submit(client) for _ in range(options['clients'])]
+        elapsed = time.perf_counter() - started
+        for thread in workers:
+            requests.put(None)
+        for thread in workers:
+            thread.join()
+        for future in futures:
+            future.result()
+        if errors:
+            raise errors[0]
+        return options['requests'] / elapsed, timings
+
+    def run_asgi(self, options, async_views):
+        """Воркер ASGI: медленная передача ответа не занимает потоки."""
+        use_async_views(async_views)
+        handler = ASGIHandler()
+        numbers = count()
+        timings = []
+
+        async def request(path, query, token):
+            received = False
+
+            async def receive():
+                nonlocal received
+                if received:
+                    await asyncio.Event().wait()
+                received = True
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    assert message['status'] == 200, message['status']
+                elif not message.get('more_body'):
+                    await asyncio.sleep(options['client_delay'])
+
+            await handler(self.scope(path, query, token), receive, send)
+
+        async def client():
+            for number in numbers:
+                if number >= options['requests']:
+                    return
+                started = time.perf_counter()
+                await request(*self.paths[number % len(self.paths)])
+                timings.append(time.perf_counter() - started)
+
+        async def main():
+            await asyncio.gather(
+                *(client() for _ in range(options['clients']))
+            )
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return options['requests'] / (time.perf_counter() - started), timings
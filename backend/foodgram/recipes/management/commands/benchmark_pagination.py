@@ -0,0 +1,85 @@
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from api.paginator import KeysetPagination
+from recipes.models import Recipe
+from users.models import User
+from ._private import batched
+from .benchmark_api import BENCHMARK_CACHES
+
+RECIPES: int = 60000
+PAGE_SIZE: int = 6
+DEEP_PAGE: int = 10000
+REPEAT: int = 20
+
+
+class Command(BaseCommand):
+    help = ('Сравнение времени ответа /api/recipes/ для первой и глубокой '
+            'страницы в режимах page и cursor. Данные создаются '
+            'во временной транзакции и откатываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=RECIPES)
+        parser.add_argument('--page', type=int, default=DEEP_PAGE)
+        parser.add_argument('--repeat', type=int, default=REPEAT)
+
+    def handle(self, *args, **options):
+        # Отдельный кеш процесса: кеш ответов анонимным пользователям
+        # очищается перед каждым запросом, иначе замерялись бы попадания.
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            with transaction.atomic():
+                self.create_recipes(options['recipes'])
+                self.run(options['page'], options['repeat'])
+                transaction.set_rollback(True)
+
+    def create_recipes(self, count):
+        author = User.objects.create(
+            username='benchmark', email='benchmark@example.com'
+        )
+        objects = (
+            Recipe(
+                author=author, name=f'benchmark {number}', text='benchmark',
+                image='recipes/benchmark.png', cooking_time=1
+            )
+            for number in range(count)
+        )
+        for batch in batched(objects, 1000):
+            Recipe.objects.bulk_create(batch)
+
+    def measure(self, url, repeat):
+        client = Client()
+        timings = []
+        for _ in range(repeat):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.content
+        return statistics.median(timings) * 1000, len(queries)
+
+    def run(self, deep_page, repeat):
+        offset = (deep_page - 1) * PAGE_SIZE
+        last_before = Recipe.objects.order_by(
+            *KeysetPagination.ordering
+        )[offset - 1]
+        cursor = KeysetPagination().encode_cursor(last_before)
+        urls = {
+            'page, 1': f'/api/recipes/?limit={PAGE_SIZE}',
+            f'page, {deep_page}':
+                f'/api/recipes/?limit={PAGE_SIZE}&page={deep_page}',
+            'cursor, 1': f'/api/recipes/?limit={PAGE_SIZE}&pagination=cursor',
+            f'cursor, {deep_page}':
+                f'/api/recipes/?limit={PAGE_SIZE}&cursor={cursor}',
+        }
+        for name, url in urls.items():
+            median, queries = self.measure(url, repeat)
+            self.stdout.write(
+                f'{name:>14}: медиана {median:.2f} мс, запросов {queries}'
+            )
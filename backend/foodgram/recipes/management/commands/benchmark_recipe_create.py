@@ -0,0 +1,82 @@
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Tag
+from users.models import User
+from ._private import make_image
+
+INGREDIENT_COUNTS = (1, 10, 30, 100)
+REPEAT: int = 10
+
+
+class Command(BaseCommand):
+    help = ('Время создания рецепта через POST /api/recipes/ в зависимости '
+            'от числа ингредиентов. Данные создаются во временной '
+            'транзакции и откатываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients', type=int, nargs='+', default=INGREDIENT_COUNTS
+        )
+        parser.add_argument('--repeat', type=int, default=REPEAT)
+
+    def handle(self, *args, **options):
+        # Уменьшенные копии картинки строятся после коммита, которого
+        # здесь не будет; файлы картинок пишутся во временный каталог.
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                with transaction.atomic():
+                    self.run(options['ingredients'], options['repeat'])
+                    transaction.set_rollback(True)
+
+    def run(self, counts, repeat):
+        author = User.objects.create(
+            username='benchmark', email='benchmark@example.com'
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'benchmark {number}', color=f'#00000{number}',
+                slug=f'benchmark-{number}'
+            )
+            for number in range(3)
+        ]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'benchmark {number}', measurement_unit='г')
+            for number in range(max(counts))
+        )
+        ingredients = list(
+            Ingredient.objects.filter(name__startswith='benchmark ')
+        )
+        client = APIClient()
+        client.force_authenticate(author)
+        image = make_image()
+        for count in counts:
+            payload = {
+                'text': 'benchmark', 'cooking_time': 1,
+                'image': image, 'tags': [tag.pk for tag in tags],
+                'ingredients': [
+                    {'id': ingredient.pk, 'amount': 1}
+                    for ingredient in ingredients[:count]
+                ],
+            }
+            timings = []
+            for number in range(repeat):
+                payload['name'] = f'benchmark {count} {number}'
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.post(
+                        '/api/recipes/', payload, format='json'
+                    )
+                    timings.append(time.perf_counter() - started)
+                assert response.status_code == 201, response.content
+            self.stdout.write(
+                f'{count:>5} ингредиентов: медиана '
+                f'{statistics.median(timings) * 1000:.2f} мс, '
+                f'запросов {len(queries)}'
+            )
@@ -0,0 +1,141 @@
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart)
+from recipes.shopping_list import rebuild
+from users.models import User
+from ._private import batched
+
+RECIPES: int = 150
+INGREDIENTS: int = 500
+INGREDIENTS_PER_RECIPE: int = 12
+FORMATS = ('txt', 'csv', 'json', 'pdf')
+REPEAT: int = 10
+# Цель по p95 времени выгрузки списка покупок, мс.
+MAX_MS: float = 500
+
+
+class Command(BaseCommand):
+    help = ('Время и память выгрузки списка покупок большой корзины '
+            '(GET /api/recipes/download_shopping_cart/) во всех форматах. '
+            'Завершается ошибкой, если p95 превышает --max-ms. Данные '
+            'создаются во временной транзакции и откатываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=RECIPES)
+        parser.add_argument('--ingredients', type=int, default=INGREDIENTS)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int,
+            default=INGREDIENTS_PER_RECIPE
+        )
+        parser.add_argument(
+            '--formats', nargs='+', choices=FORMATS, default=FORMATS
+        )
+        parser.add_argument('--repeat', type=int, default=REPEAT)
+        parser.add_argument('--max-ms', type=float, default=MAX_MS)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self.create_cart(
+                options['recipes'], options['ingredients'],
+                options['ingredients_per_recipe'], random.Random(
+                    options['seed']
+                )
+            )
+            slow = self.run(
+                user, options['formats'], options['repeat'],
+                options['max_ms']
+            )
+            transaction.set_rollback(True)
+        if slow:
+            raise CommandError(
+                f'p95 выше {options["max_ms"]:.0f} мс: {", ".join(slow)}'
+            )
+
+    def create_cart(self, recipes, ingredients, per_recipe, rng):
+        user = User.objects.create(
+            username='benchmark', email='benchmark@example.com'
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'benchmark {number}', measurement_unit='г')
+            for number in range(ingredients)
+        )
+        ingredient_ids = list(
+            Ingredient.objects.filter(
+                name__startswith='benchmark '
+            ).values_list('pk', flat=True)
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=user, name=f'benchmark {number}', text='benchmark',
+                image='recipes/benchmark.png', cooking_time=1
+            )
+            for number in range(recipes)
+        )
+        recipe_ids = list(
+            Recipe.objects.filter(author=user).values_list('pk', flat=True)
+        )
+        links = (
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids, min(per_recipe, len(ingredient_ids))
+            )
+        )
+        for batch in batched(links, 5000):
+            RecipeIngredient.objects.bulk_create(batch)
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(owner=user, recipe_id=recipe_id)
+            for recipe_id in recipe_ids
+        )
+        rebuild([user.pk])
+        return user
+
+    def download(self, client, file_format):
+        response = client.get(
+            f'/api/recipes/download_shopping_cart/?format={file_format}'
+        )
+        if response.status_code != 200:
+            raise CommandError(
+                f'{file_format}: ответ {response.status_code}'
+            )
+        return sum(len(chunk) for chunk in response.streaming_content)
+
+    def run(self, user, formats, repeat, max_ms):
+        client = APIClient()
+        client.force_authenticate(user)
+        slow = []
+        for file_format in formats:
+            self.download(client, file_format)
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                size = self.download(client, file_format)
+                timings.append((time.perf_counter() - started) * 1000)
+            with CaptureQueriesContext(connection) as queries:
+                tracemalloc.start()
+                self.download(client, file_format)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            p50 = statistics.median(timings)
+            p95 = sorted(timings)[max(int(len(timings) * 0.95) - 1, 0)]
+            self.stdout.write(
+                f'{file_format:>5}: p50 {p50:.1f} мс, p95 {p95:.1f} мс, '
+                f'{size} байт, пик памяти {peak / 1024:.0f} КБ, '
+                f'запросов {len(queries)}'
+            )
+            if p95 > max_ms:
+                slow.append(file_format)
+        return slow
@@ -0,0 +1,90 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Recipe, Tag
+from users.models import User
+from ._private import batched
+
+RECIPES: int = 100000
+TAGS: int = 8
+TAGS_PER_RECIPE: int = 2
+PAGE_SIZE: int = 6
+REPEAT: int = 10
+
+
+class Command(BaseCommand):
+    help = ('Сравнение фильтра по тегам: JOIN + DISTINCT и подзапросы '
+            'EXISTS (любой из тегов и все теги). Измеряется первая '
+            'страница с подсчетом числа записей. Данные создаются '
+            'во временной транзакции и откатываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=RECIPES)
+        parser.add_argument('--repeat', type=int, default=REPEAT)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            slugs = self.create_recipes(options['recipes'])
+            self.run(slugs[:2], options['repeat'])
+            transaction.set_rollback(True)
+
+    def create_recipes(self, count):
+        author = User.objects.create(
+            username='benchmark', email='benchmark@example.com'
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'benchmark {number}', color=f'#0000{number:02}',
+                slug=f'benchmark-{number}'
+            )
+            for number in range(TAGS)
+        ]
+        objects = (
+            Recipe(
+                author=author, name=f'benchmark {number}', text='benchmark',
+                image='recipes/benchmark.png', cooking_time=1
+            )
+            for number in range(count)
+        )
+        for batch in batched(objects, 1000):
+            Recipe.objects.bulk_create(batch)
+        RecipeTag = Recipe.tags.through
+        links = (
+            RecipeTag(recipe_id=recipe_id, tag_id=tag.pk)
+            for recipe_id in Recipe.objects.filter(
+                author=author
+            ).values_list('pk', flat=True).iterator()
+            for tag in random.sample(tags, TAGS_PER_RECIPE)
+        )
+        for batch in batched(links, 5000):
+            RecipeTag.objects.bulk_create(batch)
+        return [tag.slug for tag in tags]
+
+    def measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                queryset.count()
+                list(queryset.order_by('-pub_date', '-id')[:PAGE_SIZE])
+                timings.append(time.perf_counter() - started)
+        return statistics.median(timings) * 1000, len(queries)
+
+    def run(self, slugs, repeat):
+        variants = {
+            'JOIN + DISTINCT': Recipe.objects.filter(
+                tags__slug__in=slugs
+            ).distinct(),
+            'EXISTS, любой': Recipe.objects.with_tags(slugs),
+            'EXISTS, все': Recipe.objects.with_tags(slugs, match_all=True),
+        }
+        for name, queryset in variants.items():
+            median, queries = self.measure(queryset, repeat)
+            self.stdout.write(
+                f'{name:>16}: медиана {median:.2f} мс, запросов {queries}'
+            )
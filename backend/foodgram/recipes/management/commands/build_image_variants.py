@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Создание уменьшенных копий изображений рецептов, у которых '
+            'их нет (например, фоновая обработка прервана перезапуском '
+            'воркера). Предназначена для периодического запуска (cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Обработать не больше N рецептов'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.filter(
+            image_variants={}
+        ).exclude(image='').order_by('pk').values_list('pk', 'image')
+        if options['limit'] is not None:
+            recipes = recipes[:options['limit']]
+        built = failed = 0
+        for recipe_id, image_name in list(recipes):
+            try:
+                build_variants(recipe_id, image_name)
+            except OSError as error:
+                failed += 1
+                self.stderr.write(
+                    f'Рецепт {recipe_id}, {image_name}: {error}'
+                )
+            else:
+                built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {built}, ошибок: {failed}'
+        ))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingCart, ShoppingListItem
+from recipes.shopping_list import find_drift, rebuild
+from ._private import batched
+
+BATCH_SIZE: int = 500
+
+
+class Command(BaseCommand):
+    help = ('Проверка списков покупок (ShoppingListItem): суммы '
+            'ингредиентов сравниваются с пересчетом по корзинам. '
+            'С --fix расходящиеся списки пересчитываются заново')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Пересчитать расходящиеся списки'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        owner_ids = sorted(
+            set(ShoppingCart.objects.values_list('owner_id', flat=True))
+            | set(ShoppingListItem.objects.values_list('owner_id', flat=True))
+        )
+        drifted = {}
+        for batch in batched(owner_ids, options['batch_size']):
+            drift = find_drift(batch)
+            if drift and options['fix']:
+                rebuild(list(drift))
+            drifted.update(drift)
+        for owner_id, rows in sorted(drifted.items()):
+            self.stdout.write(
+                f'Пользователь {owner_id}: неверных строк {rows}'
+            )
+        summary = (
+            f'Проверено списков: {len(owner_ids)}, '
+            f'расходится: {len(drifted)}'
+        )
+        if drifted and not options['fix']:
+            raise CommandError(f'{summary}. Исправление: --fix')
+        self.stdout.write(self.style.SUCCESS(
+            f'{summary}, исправлено: {len(drifted)}' if drifted else summary
+        ))
@@ -1,52 +1,222 @@
-import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import django
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
 
-from recipes.models import Ingredient, Tag
-from users.models import User
+from recipes.counters import RECIPE_COUNTERS, USER_COUNTERS, recount
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.pantry import pantry_index
+from recipes.search import reindex_recipes
+from recipes.shopping_list import rebuild
+from users.models import Follow, User
+from ._private import batched, iter_csv, iter_json_array, raw_auto_now_add
 
+BATCH_SIZE: int = 1000
 
 FILES = {
     Ingredient: (
-        'ingredients.csv', (
-            'name', 'measurement_unit', 'None', 'None', 'None'
+        'ingredients', (
+            'name', 'measurement_unit'
         )
     ),
     Tag: (
-        'tags.csv', (
-            'name', 'color', 'slug', 'None', 'None'
+        'tags', (
+            'name', 'color', 'slug'
         )
     ),
     User: (
-        'users.csv', (
+        'users', (
             'username', 'email', 'first_name', 'last_name', 'password'
         )
     ),
 }
 
+FIXTURE_MODELS = (
+    User, Tag, Ingredient, Recipe, RecipeIngredient, Favorite, ShoppingCart,
+    Follow,
+)
+
 
 class Command(BaseCommand):
-    help = 'Импорт данных из csv-файлов'
-    path_parent = Path(settings.BASE_DIR).parent
+    help = 'Импорт данных из csv/json-файлов или фикстуры dumpdata'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', choices=('csv', 'json'), default='csv',
+            help='Формат файлов из recipes/data (по умолчанию csv)'
+        )
+        parser.add_argument(
+            '--fixture',
+            help='Путь к фикстуре dumpdata, например ../../infra/dump.json'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help=f'Размер пакета bulk_create (по умолчанию {BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число процессов для хеширования паролей'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Выполнить импорт в транзакции и откатить изменения'
+        )
 
     def handle(self, *args, **options):
-        for entity, file in FILES.items():
-            file_path = f"{settings.BASE_DIR}/recipes/data/{file[0]}"
-            with open(file_path, encoding="utf8") as f:
-                for row in csv.reader(f, delimiter=','):
-                    name = row[0]
-                    attrs = dict(zip(file[1], row))
-                    print(f'Добавление объекта "{name}" в БД')
-                    entity.objects.create(**attrs)
-                    if entity == User:
-                        username = attrs.get('username')
-                        password = attrs.get('password')
-                        u = User.objects.get(username=username)
-                        u.set_password(password)
-                        u.save()
-
-        for entity in FILES:
-            result = entity.objects.count()
-            print(f'Добавлено {result} новых объекта класса {entity} в БД')
+        self.batch_size = options['batch_size']
+        self.workers = options['workers']
+        if self.batch_size < 1 or self.workers < 1:
+            raise CommandError(
+                'Размер пакета и число процессов должны быть больше нуля'
+            )
+        with transaction.atomic():
+            if options['fixture']:
+                self.import_fixture(Path(options['fixture']))
+            else:
+                self.import_files(options['format'])
+            if options['dry_run']:
+                transaction.set_rollback(True)
+                self.stdout.write(self.style.WARNING(
+                    'Пробный запуск: изменения не сохранены'
+                ))
+
+    def bulk_import(self, model, objects):
+        """Сохраняет объекты пакетами, пропуская уже существующие."""
+        started = time.monotonic()
+        count_before = model.objects.count()
+        processed = 0
+        for batch in batched(objects, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            processed += len(batch)
+        added = model.objects.count() - count_before
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{model._meta.verbose_name_plural}: обработано {processed}, '
+            f'добавлено {added} за {elapsed:.2f} с '
+            f'({processed / max(elapsed, 1e-6):.0f} объектов/с)'
+        ))
+
+    def import_files(self, file_format):
+        data_dir = Path(settings.BASE_DIR) / 'recipes' / 'data'
+        for model, (name, columns) in FILES.items():
+            path = data_dir / f'{name}.{file_format}'
+            if not path.exists():
+                self.stdout.write(self.style.WARNING(
+                    f'Файл {path} не найден, пропуск'
+                ))
+                continue
+            if file_format == 'csv':
+                rows = iter_csv(path, columns)
+            else:
+                rows = iter_json_array(path)
+            prepare = getattr(self, f'prepare_{model._meta.model_name}')
+            self.bulk_import(model, prepare(rows))
+
+    def prepare_ingredient(self, rows):
+        # У ингредиентов нет уникального ограничения в БД,
+        # поэтому повторы отсеиваются по паре (название, единица).
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        for row in rows:
+            key = (row['name'], row['measurement_unit'])
+            if key in existing:
+                continue
+            existing.add(key)
+            yield Ingredient(**row)
+
+    def prepare_tag(self, rows):
+        for row in rows:
+            yield Tag(**row)
+
+    def prepare_user(self, rows):
+        existing = set(User.objects.values_list('username', flat=True))
+        rows = (row for row in rows if row['username'] not in existing)
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=django.setup
+            )
+        try:
+            for batch in batched(rows, self.batch_size):
+                passwords = [row.pop('password') for row in batch]
+                if executor is None:
+                    hashed = map(make_password, passwords)
+                else:
+                    hashed = executor.map(
+                        make_password, passwords,
+                        chunksize=max(len(passwords) // self.workers, 1)
+                    )
+                for row, password in zip(batch, hashed):
+                    yield User(password=password, **row)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def import_fixture(self, path):
+        """Импорт фикстуры с сохранением первичных ключей.
+
+        Файл читается потоково отдельным проходом для каждой модели,
+        чтобы связанные объекты создавались после тех, на кого ссылаются.
+        """
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+        models = set(FIXTURE_MODELS)
+        reset_models = []
+        for model in FIXTURE_MODELS:
+            label = model._meta.label_lower
+            with raw_auto_now_add(model):
+                self.bulk_import(model, (
+                    self.build_object(model, item)
+                    for item in iter_json_array(path)
+                    if item['model'] == label
+                ))
+            reset_models.append(model)
+            for field in model._meta.many_to_many:
+                through = field.remote_field.through
+                if (not through._meta.auto_created
+                        or field.related_model not in models):
+                    continue
+                self.bulk_import(through, (
+                    through(**{
+                        f'{field.m2m_field_name()}_id': item['pk'],
+                        f'{field.m2m_reverse_field_name()}_id': related_pk,
+                    })
+                    for item in iter_json_array(path)
+                    if item['model'] == label
+                    for related_pk in item['fields'].get(field.name, ())
+                ))
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), reset_models):
+                cursor.execute(sql)
+        recount(Recipe.objects.all(), RECIPE_COUNTERS)
+        recount(User.objects.all(), USER_COUNTERS)
+        reindex_recipes(Recipe.objects.all())
+        # Корзины импортируются bulk_create без сигналов, поэтому списки
+        # покупок их владельцев пересчитываются заново.
+        owner_ids = ShoppingCart.objects.order_by('owner_id').values_list(
+            'owner_id', flat=True
+        ).distinct()
+        for batch in batched(list(owner_ids), self.batch_size):
+            rebuild(batch)
+        transaction.on_commit(pantry_index.invalidate)
+
+    @staticmethod
+    def build_object(model, item):
+        obj = model(pk=item['pk'])
+        for name, value in item['fields'].items():
+            field = model._meta.get_field(name)
+            if field.many_to_many:
+                continue
+            if not field.is_relation:
+                value = field.to_python(value)
+            setattr(obj, field.attname, value)
+        return obj
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from recipes.ranking import rebuild_ranking
+
+HALF_LIFE_DAYS: int = 7
+WINDOW_DAYS: int = 60
+LIMIT: int = 100
+
+
+class Command(BaseCommand):
+    help = ('Расчет рейтинга популярных рецептов. '
+            'Предназначена для периодического запуска (cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--half-life', type=float, default=HALF_LIFE_DAYS,
+            help='Период полураспада веса добавления, в днях'
+        )
+        parser.add_argument(
+            '--window', type=int, default=WINDOW_DAYS,
+            help='Учитываются добавления за последние N дней'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=LIMIT,
+            help='Число рецептов в рейтинге'
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_ranking(
+            options['half_life'], options['window'], options['limit']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг пересчитан: {count} рецептов'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import RECIPE_COUNTERS, USER_COUNTERS, recount
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков рецептов и пользователей'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipes = recount(Recipe.objects.all(), RECIPE_COUNTERS)
+            users = recount(User.objects.all(), USER_COUNTERS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счетчиков: рецептов {recipes}, '
+            f'пользователей {users}'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import get_response_stats
+
+
+class Command(BaseCommand):
+    help = 'Статистика кеша ответов /api/recipes/ анонимным пользователям'
+
+    def handle(self, *args, **options):
+        stats = get_response_stats()
+        served = stats['hit'] + stats['coalesced']
+        total = served + stats['miss']
+        for event, value in stats.items():
+            self.stdout.write(f'{event:>10}: {value}')
+        if total:
+            self.stdout.write(f'{"hit ratio":>10}: {served / total:.1%}')
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# Индексы для поиска ингредиентов средствами БД
+# (INGREDIENT_SEARCH_BACKEND='db'). Создаются только в Postgres:
+# первый обслуживает istartswith (UPPER(name) LIKE 'X%'),
+# второй (pg_trgm) - icontains (UPPER(name) LIKE '%X%').
+CREATE_SQL = (
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_like '
+    'ON recipes_ingredient (UPPER(name::text) varchar_pattern_ops);',
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm;',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops);',
+)
+DROP_SQL = (
+    'DROP INDEX IF EXISTS recipes_ingredient_name_upper_trgm;',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_upper_like;',
+)
+
+
+def run_postgres_sql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_Tags_Indredients_Recipes_Favorites'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_postgres_sql(CREATE_SQL),
+            run_postgres_sql(DROP_SQL),
+        ),
+    ]
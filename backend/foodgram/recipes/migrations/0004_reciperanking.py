@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('position', models.PositiveIntegerField(unique=True, verbose_name='Позиция')),
+                ('score', models.FloatField(verbose_name='Рейтинг')),
+                ('computed_at', models.DateTimeField(verbose_name='Дата расчета')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинг рецептов',
+                'ordering': ['position'],
+            },
+        ),
+    ]
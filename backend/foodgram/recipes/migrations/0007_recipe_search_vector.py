@@ -0,0 +1,62 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:43
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Поисковый вектор существующих рецептов: название (вес A), названия
+# ингредиентов (B) и описание (C) в русской и английской конфигурациях,
+# как в recipes.search.search_vector_expression на момент миграции.
+UPDATE_VECTOR_SQL = """
+UPDATE recipes_recipe AS recipe SET search_vector = (
+    setweight(to_tsvector('russian'::regconfig, COALESCE(recipe.name, '')), 'A')
+    || setweight(to_tsvector('english'::regconfig, COALESCE(recipe.name, '')), 'A')
+    || setweight(to_tsvector('russian'::regconfig, COALESCE(names.value, '')), 'B')
+    || setweight(to_tsvector('english'::regconfig, COALESCE(names.value, '')), 'B')
+    || setweight(to_tsvector('russian'::regconfig, COALESCE(recipe.text, '')), 'C')
+    || setweight(to_tsvector('english'::regconfig, COALESCE(recipe.text, '')), 'C')
+)
+FROM (
+    SELECT recipe.id AS recipe_id, string_agg(ingredient.name, ' ') AS value
+    FROM recipes_recipe AS recipe
+    LEFT JOIN recipes_recipeingredient AS item ON item.recipe_id = recipe.id
+    LEFT JOIN recipes_ingredient AS ingredient
+        ON ingredient.id = item.ingredient_id
+    GROUP BY recipe.id
+) AS names
+WHERE names.recipe_id = recipe.id;
+"""
+# GIN-индекс поискового вектора; создается только в Postgres,
+# в других СУБД поиск выполняется индексом в памяти.
+CREATE_INDEX_SQL = (
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_gin '
+    'ON recipes_recipe USING gin (search_vector);'
+)
+DROP_INDEX_SQL = 'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin;'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(UPDATE_VECTOR_SQL)
+    schema_editor.execute(CREATE_INDEX_SQL)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+# Составной индекс (tag_id, recipe_id) таблицы связи рецептов и тегов:
+# подзапросы EXISTS фильтра по тегам (RecipeQuerySet.with_tags)
+# выполняются по нему без чтения таблицы. Обратный порядок
+# (recipe_id, tag_id) уже покрыт ограничением уникальности.
+CREATE_SQL = (
+    'CREATE INDEX recipes_recipe_tags_tag_recipe_idx '
+    'ON recipes_recipe_tags (tag_id, recipe_id);'
+)
+DROP_SQL = 'DROP INDEX recipes_recipe_tags_tag_recipe_idx;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SQL, DROP_SQL),
+    ]
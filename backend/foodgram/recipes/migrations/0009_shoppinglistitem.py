@@ -0,0 +1,63 @@
+# Generated by Django 3.2.16 on 2026-10-18 21:13
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def fill_shopping_lists(apps, schema_editor):
+    """Суммы ингредиентов рецептов из корзин каждого владельца."""
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    owner_ids = sorted(set(
+        ShoppingCart.objects.values_list('owner_id', flat=True)
+    ))
+    for start in range(0, len(owner_ids), BATCH_SIZE):
+        rows = RecipeIngredient.objects.filter(
+            recipe__shoppingcart_recipes__owner_id__in=owner_ids[
+                start:start + BATCH_SIZE
+            ]
+        ).values_list(
+            'recipe__shoppingcart_recipes__owner_id', 'ingredient_id'
+        ).annotate(
+            total=Sum('amount')
+        ).order_by()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                owner_id=owner_id, ingredient_id=ingredient_id, amount=amount
+            )
+            for owner_id, ingredient_id, amount in rows
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_tags_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to=settings.AUTH_USER_MODEL, verbose_name='Владелец списка покупок')),
+            ],
+            options={
+                'verbose_name': 'Строка списка покупок',
+                'verbose_name_plural': 'Строки списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('owner', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from colorfield.fields import ColorField
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 
@@ -48,6 +49,66 @@ class Ingredient(models.Model):
         return f'{self.name} - {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self):
+        """Подгружает связанные объекты, необходимые для вывода рецептов.
+
+        Автор, теги и ингредиенты загружаются пакетно, чтобы число
+        запросов не зависело от количества рецептов на странице.
+        """
+        return self.prefetch_related(
+            'author',
+            'tags',
+            models.Prefetch(
+                'ingredients_recipes',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
+
+    def limited_per_author(self, limit):
+        """Оставляет не более limit последних рецептов каждого автора.
+
+        Ограничение выполняется на стороне БД коррелированным
+        подзапросом, поэтому подходит для Prefetch по авторам.
+        """
+        if not limit:
+            return self
+        return self.filter(
+            pk__in=models.Subquery(
+                Recipe.objects.filter(
+                    author=models.OuterRef('author')
+                ).order_by('-pub_date').values('pk')[:limit]
+            )
+        )
+
+    def with_tags(self, slugs, match_all=False):
+        """Рецепты с любым (или, при match_all, каждым) из тегов slugs.
+
+        Условие строится подзапросами EXISTS по таблице связи
+        рецептов и тегов вместо JOIN, поэтому строки рецептов
+        не размножаются и DISTINCT не нужен.
+        """
+        RecipeTag = Recipe.tags.through
+        if not match_all:
+            return self.filter(models.Exists(
+                RecipeTag.objects.filter(
+                    recipe=models.OuterRef('pk'),
+                    tag__in=Tag.objects.filter(slug__in=slugs).values('pk')
+                )
+            ))
+        queryset = self
+        for slug in set(slugs):
+            queryset = queryset.filter(models.Exists(
+                RecipeTag.objects.filter(
+                    recipe=models.OuterRef('pk'), tag__slug=slug
+                )
+            ))
+        return queryset
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -68,6 +129,15 @@ class Recipe(models.Model):
     image = models.ImageField(
         upload_to='recipes/',
         verbose_name='Картинка')
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии картинки')
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор')
     cooking_time = models.PositiveSmallIntegerField(
         default=1,
         validators=[MinValueValidator(1)],
@@ -81,11 +151,27 @@ class Recipe(models.Model):
         Tag,
         related_name='recipes',
         verbose_name='Теги')
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число добавлений в избранное')
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число добавлений в список покупок')
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_id_idx'),
+        ]
 
     def __str__(self):
         return f'{self.name}: {self.text[:LENGTH]}'
@@ -161,3 +247,54 @@ class ShoppingCart(FavoriteBaseModel):
     class Meta(FavoriteBaseModel.Meta):
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Список покупок'
+
+
+class ShoppingListItem(models.Model):
+    # Сумма ингредиента по рецептам из корзины владельца, поддерживается
+    # инкрементально (см. recipes.shopping_list).
+    owner = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Владелец списка покупок')
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент')
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списков покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'ingredient'],
+                                    name='unique_shopping_list_item')]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.amount}'
+
+
+class RecipeRanking(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking',
+        verbose_name='Рецепт')
+    position = models.PositiveIntegerField(
+        unique=True,
+        verbose_name='Позиция')
+    score = models.FloatField(
+        verbose_name='Рейтинг')
+    computed_at = models.DateTimeField(
+        verbose_name='Дата расчета')
+
+    class Meta:
+        ordering = ['position']
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинг рецептов'
+
+    def __str__(self):
+        return f'{self.position}. {self.recipe_id}: {self.score:.2f}'
@@ -0,0 +1,153 @@
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from foodgram.routers import use_primary
+from .versions import get_version, next_version
+
+VERSION_CACHE_KEY = 'pantry_index:version'
+CHANGE_CACHE_KEY = 'pantry_index:change:{version}'
+# При большем отставании дешевле загрузить индекс заново.
+MAX_CATCH_UP: int = 1000
+
+
+class PantryIndex:
+    """Инвертированный индекс "ингредиент -> рецепты" в памяти процесса.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов
+    (array), для каждого рецепта - множество его ингредиентов.
+    Подбор рецептов по продуктам пользователя сводится к подсчету
+    вхождений id в массивах выбранных ингредиентов.
+
+    Индекс обновляется инкрементально: при изменении рецепта
+    (см. "record_change") в кеш записывается новая версия и id
+    рецепта. Каждый процесс при обращении к индексу догоняет версию,
+    перечитывая из БД только изменившиеся рецепты; если часть журнала
+    изменений уже вытеснена из кеша, индекс загружается заново.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._postings = {}
+        self._recipes = {}
+
+    def _read(self, recipe_ids=None):
+        RecipeIngredient = global_apps.get_model(
+            'recipes', 'RecipeIngredient'
+        )
+        queryset = RecipeIngredient.objects.order_by(
+            'ingredient_id', 'recipe_id'
+        )
+        if recipe_ids is not None:
+            queryset = queryset.filter(recipe_id__in=recipe_ids)
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in queryset.values_list(
+                'recipe_id', 'ingredient_id').iterator():
+            recipes[recipe_id].add(ingredient_id)
+        return recipes
+
+    def _load(self):
+        recipes = self._read()
+        postings = defaultdict(lambda: array('q'))
+        for recipe_id in sorted(recipes):
+            for ingredient_id in recipes[recipe_id]:
+                postings[ingredient_id].append(recipe_id)
+        self._postings = dict(postings)
+        self._recipes = dict(recipes)
+
+    def _remove(self, recipe_id):
+        for ingredient_id in self._recipes.pop(recipe_id, ()):
+            recipe_ids = self._postings[ingredient_id]
+            index = bisect_left(recipe_ids, recipe_id)
+            if index < len(recipe_ids) and recipe_ids[index] == recipe_id:
+                recipe_ids.pop(index)
+
+    def _apply(self, recipe_ids):
+        recipes = self._read(recipe_ids)
+        for recipe_id in recipe_ids:
+            self._remove(recipe_id)
+            ingredient_ids = recipes.get(recipe_id)
+            if not ingredient_ids:
+                continue
+            self._recipes[recipe_id] = ingredient_ids
+            for ingredient_id in ingredient_ids:
+                insort(
+                    self._postings.setdefault(ingredient_id, array('q')),
+                    recipe_id
+                )
+
+    def _catch_up(self, version):
+        if (self._version is None or version < self._version
+                or version - self._version > MAX_CATCH_UP):
+            self._load()
+            return
+        keys = [
+            CHANGE_CACHE_KEY.format(version=number)
+            for number in range(self._version + 1, version + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) < len(keys):
+            self._load()
+            return
+        self._apply(set(changes.values()))
+
+    def _ensure_loaded(self):
+        version = get_version(VERSION_CACHE_KEY)
+        if self._version == version:
+            return
+        with self._lock:
+            if self._version != version:
+                with use_primary():
+                    self._catch_up(version)
+                self._version = version
+
+    def match(self, ingredient_ids, match_all=False):
+        """Рецепты с ингредиентами из ingredient_ids.
+
+        Возвращает список (id рецепта, совпало, всего ингредиентов)
+        по убыванию доли совпавших ингредиентов рецепта (coverage).
+        При match_all остаются только рецепты со всеми ingredient_ids.
+        """
+        self._ensure_loaded()
+        postings = self._postings
+        ingredient_ids = set(ingredient_ids)
+        matched = Counter()
+        for ingredient_id in ingredient_ids:
+            matched.update(postings.get(ingredient_id, ()))
+        recipes = self._recipes
+        result = [
+            (recipe_id, count, len(recipes[recipe_id]))
+            for recipe_id, count in matched.items()
+            if not match_all or count == len(ingredient_ids)
+        ]
+        result.sort(key=lambda item: (-item[1] / item[2], -item[1], -item[0]))
+        return result
+
+    def record_change(self, recipe_id):
+        """Отмечает изменение ингредиентов рецепта после коммита."""
+        transaction.on_commit(lambda: self._publish(recipe_id))
+
+    def _publish(self, recipe_id):
+        version = next_version(VERSION_CACHE_KEY)
+        cache.set(
+            CHANGE_CACHE_KEY.format(version=version),
+            recipe_id, settings.PANTRY_INDEX_CHANGE_TIMEOUT
+        )
+
+    def invalidate(self):
+        """Полная перезагрузка индекса во всех процессах.
+
+        Новая версия не попадает в журнал изменений, поэтому процессы
+        не смогут ее догнать и загрузят индекс заново.
+        """
+        next_version(VERSION_CACHE_KEY)
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,79 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from foodgram.routers import use_primary
+
+from .models import Favorite, RecipeRanking, ShoppingCart
+
+POPULAR_CACHE_KEY = 'recipes:popular'
+# Вклад добавления в избранное и в список покупок.
+WEIGHTS = {
+    Favorite: 1.0,
+    ShoppingCart: 0.5,
+}
+
+
+def compute_scores(half_life_days, window_days):
+    """Рейтинг рецептов с экспоненциальным затуханием по времени.
+
+    Каждое добавление весит WEIGHTS[model] * 0.5 ** (возраст / half_life).
+    Добавления агрегируются в БД по дням, поэтому в память попадает
+    не больше (рецептов * window_days) строк.
+    """
+    now = timezone.now()
+    today = now.date()
+    since = now - timedelta(days=window_days)
+    scores = defaultdict(float)
+    for model, weight in WEIGHTS.items():
+        buckets = model.objects.filter(
+            add_date__gte=since
+        ).annotate(
+            day=TruncDate('add_date')
+        ).values('recipe_id', 'day').annotate(
+            total=Count('pk')
+        ).order_by().values_list('recipe_id', 'day', 'total')
+        for recipe_id, day, total in buckets.iterator():
+            age = (today - day).days
+            scores[recipe_id] += weight * total * 0.5 ** (
+                age / half_life_days
+            )
+    return scores
+
+
+def rebuild_ranking(half_life_days, window_days, limit):
+    """Перестраивает таблицу RecipeRanking и сбрасывает кеш ленты."""
+    scores = compute_scores(half_life_days, window_days)
+    top = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+    computed_at = timezone.now()
+    with transaction.atomic():
+        RecipeRanking.objects.all().delete()
+        RecipeRanking.objects.bulk_create(
+            RecipeRanking(
+                recipe_id=recipe_id,
+                position=position,
+                score=score,
+                computed_at=computed_at
+            )
+            for position, (recipe_id, score) in enumerate(
+                top[:limit], start=1
+            )
+        )
+        transaction.on_commit(lambda: cache.delete(POPULAR_CACHE_KEY))
+    return min(len(top), limit)
+
+
+def get_popular_ids():
+    """Id рецептов ленты в порядке рейтинга (из кеша или таблицы)."""
+    def load():
+        with use_primary():
+            return list(
+                RecipeRanking.objects.values_list('recipe_id', flat=True)
+            )
+
+    return cache.get_or_set(POPULAR_CACHE_KEY, load, None)
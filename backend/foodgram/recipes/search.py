@@ -0,0 +1,219 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections, transaction
+from django.db.models import (Case, F, FloatField, OuterRef, Subquery, Value,
+                              When)
+
+from foodgram.routers import use_primary
+from .versions import get_version, next_version
+
+# Конфигурации текстового поиска Postgres: вектор и запрос строятся
+# в каждой из них, чтобы находились и русские, и английские слова.
+SEARCH_CONFIGS = ('russian', 'english')
+# Веса полей: название, ингредиенты, описание.
+SEARCH_WEIGHTS = {
+    'name': 'A',
+    'ingredient_names': 'B',
+    'text': 'C',
+}
+# Те же веса для индекса в памяти.
+INDEX_WEIGHTS = {
+    'name': 1.0,
+    'ingredient_names': 0.4,
+    'text': 0.1,
+}
+VERSION_CACHE_KEY = 'recipe_index:version'
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold())
+
+
+def is_postgres(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def search_vector_expression():
+    """Выражение tsvector рецепта: название, ингредиенты и описание."""
+    RecipeIngredient = global_apps.get_model('recipes', 'RecipeIngredient')
+    sources = {
+        'name': F('name'),
+        'ingredient_names': Subquery(
+            RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                names=StringAgg('ingredient__name', ' ')
+            ).values('names')
+        ),
+        'text': F('text'),
+    }
+    vector = None
+    for field, source in sources.items():
+        for config in SEARCH_CONFIGS:
+            part = SearchVector(
+                source, config=config, weight=SEARCH_WEIGHTS[field]
+            )
+            vector = part if vector is None else vector + part
+    return vector
+
+
+def update_search_vector(queryset):
+    """Пересчитывает Recipe.search_vector строк queryset одним UPDATE.
+
+    Вне Postgres поле не используется (поиск выполняет индекс в памяти,
+    см. "search_recipes"), и функция ничего не делает.
+    """
+    if not is_postgres(queryset):
+        return 0
+    return queryset.update(search_vector=search_vector_expression())
+
+
+def search_query(text):
+    query = None
+    for config in SEARCH_CONFIGS:
+        part = SearchQuery(text, config=config)
+        query = part if query is None else query | part
+    return query
+
+
+def search_recipes_db(queryset, text):
+    """Рецепты queryset, подходящие под text, с рангом search_rank.
+
+    Условие search_vector @@ query обслуживается GIN-индексом.
+    """
+    query = search_query(text)
+    return queryset.filter(
+        search_vector=query
+    ).annotate(
+        search_rank=SearchRank(F('search_vector'), query)
+    )
+
+
+class RecipeIndex:
+    """Инвертированный индекс рецептов в памяти процесса.
+
+    Используется вместо tsvector на СУБД, отличных от Postgres
+    (SQLite в разработке и тестах). Слово запроса совпадает со всеми
+    словами индекса, начинающимися с него (словарь отсортирован,
+    поиск - бинарный), рецепт должен содержать все слова запроса.
+    Ранг - сумма весов полей, в которых встретились слова.
+    Индекс перестраивается, когда меняется версия в кеше
+    (см. "invalidate").
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._words = []
+        self._postings = {}
+
+    def _load(self):
+        Recipe = global_apps.get_model('recipes', 'Recipe')
+        RecipeIngredient = global_apps.get_model('recipes', 'RecipeIngredient')
+        postings = defaultdict(lambda: defaultdict(float))
+
+        def add(recipe_id, field, text):
+            for word in tokenize(text):
+                postings[word][recipe_id] += INDEX_WEIGHTS[field]
+
+        for pk, name, text in Recipe.objects.values_list(
+                'id', 'name', 'text').order_by().iterator():
+            add(pk, 'name', name)
+            add(pk, 'text', text)
+        for recipe_id, name in RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient__name').order_by().iterator():
+            add(recipe_id, 'ingredient_names', name)
+        self._postings = {
+            word: dict(recipes) for word, recipes in postings.items()
+        }
+        self._words = sorted(self._postings)
+
+    def _ensure_loaded(self):
+        version = get_version(VERSION_CACHE_KEY)
+        if self._version == version:
+            return
+        with self._lock:
+            if self._version != version:
+                with use_primary():
+                    self._load()
+                self._version = version
+
+    def _match(self, prefix):
+        words = self._words
+        scores = defaultdict(float)
+        index = bisect_left(words, prefix)
+        while index < len(words) and words[index].startswith(prefix):
+            for recipe_id, score in self._postings[words[index]].items():
+                scores[recipe_id] += score
+            index += 1
+        return scores
+
+    def search(self, text, limit=None):
+        """Список пар (id рецепта, ранг) по убыванию ранга."""
+        self._ensure_loaded()
+        result = None
+        for word in dict.fromkeys(tokenize(text)):
+            scores = self._match(word)
+            if result is None:
+                result = scores
+            else:
+                result = {
+                    recipe_id: score + scores[recipe_id]
+                    for recipe_id, score in result.items()
+                    if recipe_id in scores
+                }
+            if not result:
+                return []
+        ranked = sorted(
+            (result or {}).items(), key=lambda item: (-item[1], -item[0])
+        )
+        return ranked if limit is None else ranked[:limit]
+
+    def invalidate(self):
+        next_version(VERSION_CACHE_KEY)
+
+
+recipe_index = RecipeIndex()
+
+
+def search_recipes(queryset, text):
+    """Рецепты queryset, подходящие под text, с аннотацией search_rank.
+
+    В Postgres поиск выполняется по tsvector, в других СУБД -
+    по индексу в памяти (не более RECIPE_SEARCH_LIMIT результатов).
+    """
+    if is_postgres(queryset):
+        return search_recipes_db(queryset, text)
+    ranked = recipe_index.search(text, settings.RECIPE_SEARCH_LIMIT)
+    return queryset.filter(
+        pk__in=[recipe_id for recipe_id, _ in ranked]
+    ).annotate(
+        search_rank=Case(
+            *(When(pk=recipe_id, then=Value(score))
+              for recipe_id, score in ranked),
+            default=Value(0.0),
+            output_field=FloatField()
+        )
+    )
+
+
+def reindex_recipes(queryset):
+    """Обновляет поисковые данные рецептов после изменения.
+
+    В Postgres пересчитывается search_vector строк queryset,
+    в других СУБД после коммита сбрасывается индекс в памяти
+    (иначе другой процесс может перечитать еще старые данные).
+    """
+    if is_postgres(queryset):
+        update_search_vector(queryset)
+    else:
+        transaction.on_commit(recipe_index.invalidate)
@@ -0,0 +1,179 @@
+from collections import defaultdict
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Sum
+
+
+def recipe_amounts(recipe_ids):
+    """Суммы ингредиентов рецептов: {id ингредиента: количество}."""
+    RecipeIngredient = global_apps.get_model('recipes', 'RecipeIngredient')
+    return dict(
+        RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id').annotate(
+            total=Sum('amount')
+        ).order_by()
+    )
+
+
+def lock_owners(owner_ids):
+    """Блокирует строки владельцев списков (SELECT FOR UPDATE).
+
+    Строки блокируются в порядке id, поэтому конкурентные изменения
+    списков одних пользователей выполняются по очереди, без взаимных
+    блокировок и без двойной вставки одной строки.
+    """
+    User = global_apps.get_model('users', 'User')
+    list(
+        User.objects.select_for_update().filter(
+            pk__in=owner_ids
+        ).order_by('pk').values_list('pk', flat=True)
+    )
+
+
+@transaction.atomic(savepoint=False)
+def apply_changes(changes):
+    """Применяет к спискам покупок изменения количества.
+
+    changes - {(id владельца, id ингредиента): разница}. Строки
+    с нулевым количеством удаляются.
+    """
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    ShoppingListItem = global_apps.get_model('recipes', 'ShoppingListItem')
+    owner_ids = {owner_id for owner_id, _ in changes}
+    lock_owners(owner_ids)
+    items = {
+        (item.owner_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.filter(
+            owner_id__in=owner_ids,
+            ingredient_id__in={ingredient_id for _, ingredient_id in changes}
+        )
+    }
+    created, changed, removed = [], [], []
+    for (owner_id, ingredient_id), delta in changes.items():
+        item = items.get((owner_id, ingredient_id))
+        if item is None:
+            if delta > 0:
+                created.append(ShoppingListItem(
+                    owner_id=owner_id, ingredient_id=ingredient_id,
+                    amount=delta
+                ))
+        elif item.amount + delta > 0:
+            item.amount += delta
+            changed.append(item)
+        else:
+            removed.append(item.pk)
+    if removed:
+        ShoppingListItem.objects.filter(pk__in=removed).delete()
+    if changed:
+        ShoppingListItem.objects.bulk_update(changed, ['amount'])
+    if created:
+        ShoppingListItem.objects.bulk_create(created)
+
+
+def change_cart(owner_id, added=(), removed=()):
+    """Переносит изменение корзины в список покупок владельца.
+
+    Ингредиенты рецептов added прибавляются, removed - вычитаются;
+    количества читаются одним запросом.
+    """
+    signs = dict.fromkeys(added, 1)
+    signs.update(dict.fromkeys(removed, -1))
+    if not signs:
+        return
+    RecipeIngredient = global_apps.get_model('recipes', 'RecipeIngredient')
+    changes = defaultdict(int)
+    for recipe_id, ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id__in=signs).values_list(
+            'recipe_id', 'ingredient_id', 'amount'):
+        changes[(owner_id, ingredient_id)] += signs[recipe_id] * amount
+    apply_changes(changes)
+
+
+def change_recipe(recipe_id, deltas):
+    """Переносит изменение ингредиентов рецепта в списки покупок
+    всех, у кого рецепт в корзине.
+
+    deltas - {id ингредиента: разница количества}.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    ShoppingCart = global_apps.get_model('recipes', 'ShoppingCart')
+    owner_ids = ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('owner_id', flat=True)
+    apply_changes({
+        (owner_id, ingredient_id): delta
+        for owner_id in owner_ids
+        for ingredient_id, delta in deltas.items()
+    })
+
+
+def remove_recipe(recipe_id):
+    """Вычитает удаляемый рецепт из списков покупок."""
+    change_recipe(recipe_id, {
+        ingredient_id: -amount
+        for ingredient_id, amount in recipe_amounts([recipe_id]).items()
+    })
+
+
+def expected_amounts(owner_ids):
+    """Списки покупок, посчитанные заново по корзинам владельцев."""
+    RecipeIngredient = global_apps.get_model('recipes', 'RecipeIngredient')
+    rows = RecipeIngredient.objects.filter(
+        recipe__shoppingcart_recipes__owner_id__in=owner_ids
+    ).values_list(
+        'recipe__shoppingcart_recipes__owner_id', 'ingredient_id'
+    ).annotate(
+        total=Sum('amount')
+    ).order_by()
+    return {
+        (owner_id, ingredient_id): amount
+        for owner_id, ingredient_id, amount in rows
+    }
+
+
+def stored_amounts(owner_ids):
+    """Списки покупок владельцев из таблицы ShoppingListItem."""
+    ShoppingListItem = global_apps.get_model('recipes', 'ShoppingListItem')
+    rows = ShoppingListItem.objects.filter(
+        owner_id__in=owner_ids
+    ).values_list('owner_id', 'ingredient_id', 'amount')
+    return {
+        (owner_id, ingredient_id): amount
+        for owner_id, ingredient_id, amount in rows
+    }
+
+
+def find_drift(owner_ids):
+    """Расхождения списков покупок с корзинами.
+
+    Возвращает {id владельца: число неверных строк}.
+    """
+    expected = expected_amounts(owner_ids)
+    stored = stored_amounts(owner_ids)
+    drifted = defaultdict(int)
+    for key in expected.keys() | stored.keys():
+        if expected.get(key) != stored.get(key):
+            drifted[key[0]] += 1
+    return dict(drifted)
+
+
+@transaction.atomic
+def rebuild(owner_ids):
+    """Пересчитывает списки покупок владельцев заново по корзинам."""
+    ShoppingListItem = global_apps.get_model('recipes', 'ShoppingListItem')
+    lock_owners(owner_ids)
+    ShoppingListItem.objects.filter(owner_id__in=owner_ids).delete()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            owner_id=owner_id, ingredient_id=ingredient_id, amount=amount
+        )
+        for (owner_id, ingredient_id), amount in expected_amounts(
+            owner_ids
+        ).items()
+    )
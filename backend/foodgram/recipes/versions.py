@@ -0,0 +1,28 @@
+import random
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """Версия данных в кеше (целое число, см. "next_version").
+
+    Отсутствующая версия (ключ еще не создан или вытеснен) создается
+    со случайного значения, а не с нуля: иначе после вытеснения
+    версия могла бы снова дойти до значения, при котором процесс
+    загрузил уже устаревшие данные.
+    """
+    version = cache.get(key)
+    if version is None:
+        version = random.getrandbits(48)
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def next_version(key):
+    """Увеличивает версию данных в кеше и возвращает новую."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        get_version(key)
+        return cache.incr(key)
@@ -0,0 +1,109 @@
+import sqlite3
+
+import pytest
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.shopping_list import rebuild
+from users.models import Follow, User
+
+RECIPES: int = 8
+REPLICA = 'replica1'
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Кеш ответов и состояний пользователя не переходит между тестами."""
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        first_name=username, last_name=username, password='Password123!'
+    )
+
+
+@pytest.fixture
+def user(db):
+    return create_user('user')
+
+
+@pytest.fixture
+def authors(db):
+    return [create_user(f'author{number}') for number in range(3)]
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def anon_client():
+    return APIClient()
+
+
+@pytest.fixture
+def recipes(user, authors):
+    """Рецепты авторов с тегами и ингредиентами; часть из них
+    в избранном и корзине пользователя, на авторов он подписан."""
+    tags = [
+        Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+        for number in range(3)
+    ]
+    ingredients = [
+        Ingredient.objects.create(name=f'Продукт {number}',
+                                  measurement_unit='г')
+        for number in range(5)
+    ]
+    recipes = []
+    for number in range(RECIPES):
+        recipe = Recipe.objects.create(
+            author=authors[number % len(authors)], name=f'Рецепт {number}',
+            text='Описание', image='recipes/images/recipe.png',
+            cooking_time=10
+        )
+        recipe.tags.set(tags[:number % len(tags) + 1])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=number + 1)
+            for ingredient in ingredients[:number % len(ingredients) + 1]
+        )
+        recipes.append(recipe)
+    for recipe in recipes[::2]:
+        Favorite.objects.create(owner=user, recipe=recipe)
+        ShoppingCart.objects.create(owner=user, recipe=recipe)
+    rebuild([user.pk])
+    for author in authors:
+        Follow.objects.create(user=user, author=author)
+    return recipes
+
+
+@pytest.fixture
+def replica(transactional_db, tmp_path):
+    """Реплика - вторая БД SQLite; sync() копирует в нее основную БД."""
+    path = str(tmp_path / 'replica.sqlite3')
+    connections.databases[REPLICA] = {
+        **connections.databases[DEFAULT_DB_ALIAS],
+        'NAME': path, 'ATOMIC_REQUESTS': False, 'TEST': {},
+    }
+
+    def sync():
+        primary = connections[DEFAULT_DB_ALIAS]
+        primary.ensure_connection()
+        target = sqlite3.connect(path)
+        primary.connection.backup(target)
+        target.close()
+
+    yield sync
+    connections[REPLICA].close()
+    del connections[REPLICA]
+    del connections.databases[REPLICA]
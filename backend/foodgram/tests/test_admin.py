@@ -0,0 +1,55 @@
+import pytest
+from django.contrib import admin
+from django.test import RequestFactory
+
+from recipes.counters import RECIPE_COUNTERS, USER_COUNTERS, recount
+from recipes.models import Favorite, Recipe
+from users.models import Follow, User
+
+
+def no_drift():
+    """Счетчики совпадают с пересчетом (recount ничего не исправил)."""
+    return (recount(Recipe.objects.all(), RECIPE_COUNTERS) == 0
+            and recount(User.objects.all(), USER_COUNTERS) == 0)
+
+
+@pytest.fixture
+def admin_request(user):
+    request = RequestFactory().post('/admin/')
+    request.user = user
+    return request
+
+
+@pytest.mark.django_db
+def test_admin_keeps_counters(recipes, authors, user, admin_request):
+    recount(Recipe.objects.all(), RECIPE_COUNTERS)
+    recount(User.objects.all(), USER_COUNTERS)
+    favorite_admin = admin.site._registry[Favorite]
+    favorite = Favorite(owner=authors[0], recipe=recipes[1])
+    favorite_admin.save_model(admin_request, favorite, None, False)
+    assert no_drift()
+
+    favorite.recipe = recipes[3]
+    favorite_admin.save_model(admin_request, favorite, None, True)
+    assert no_drift()
+
+    favorite_admin.delete_queryset(
+        admin_request, Favorite.objects.filter(recipe=recipes[3])
+    )
+    assert no_drift()
+
+    follow_admin = admin.site._registry[Follow]
+    follow_admin.save_model(
+        admin_request, Follow(user=authors[0], author=authors[1]), None, False
+    )
+    assert no_drift()
+
+    recipe_admin = admin.site._registry[Recipe]
+    recipe_admin.delete_model(admin_request, recipes[0])
+    assert no_drift()
+
+    # Вместе с пользователем удаляются его подписки, избранное
+    # и корзина.
+    admin.site._registry[User].delete_model(admin_request, user)
+    assert no_drift()
+    assert User.objects.get(pk=authors[2].pk).followers_count == 0
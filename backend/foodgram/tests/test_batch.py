@@ -0,0 +1,131 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api import batch
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.shopping_list import recipe_amounts, stored_amounts
+from users.models import Follow
+from .conftest import create_user
+
+
+@pytest.mark.django_db
+def test_batch_remove_then_single_delete(user, user_client, recipes,
+                                         django_capture_on_commit_callbacks):
+    recipe = recipes[0]
+    Recipe.objects.filter(pk=recipe.pk).update(favorites_count=1)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = user_client.post(
+            '/api/recipes/favorite/batch/', {'remove': [recipe.pk]},
+            format='json'
+        )
+    assert response.status_code == 200
+    assert response.json()['remove'] == [
+        {'id': recipe.pk, 'result': 'removed'}
+    ]
+    response = user_client.delete(f'/api/recipes/{recipe.pk}/favorite/')
+    assert response.status_code == 400
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 0
+    assert not Favorite.objects.filter(owner=user, recipe=recipe).exists()
+    response = user_client.get(f'/api/recipes/{recipe.pk}/')
+    assert not response.json()['is_favorited']
+
+
+@pytest.mark.django_db
+def test_batch_add_results(user, user_client, recipes,
+                           django_capture_on_commit_callbacks):
+    new, favorited = recipes[1], recipes[0]
+    with django_capture_on_commit_callbacks(execute=True):
+        response = user_client.post('/api/recipes/favorite/batch/', {
+            'add': [new.pk, favorited.pk, 99999, 'x', new.pk],
+            'remove': [recipes[3].pk],
+        }, format='json')
+    assert response.status_code == 200
+    assert response.json() == {
+        'add': [
+            {'id': new.pk, 'result': 'added'},
+            {'id': favorited.pk, 'result': 'exists'},
+            {'id': 99999, 'result': 'not_found'},
+            {'id': 'x', 'result': 'invalid'},
+            {'id': new.pk, 'result': 'duplicate'},
+        ],
+        'remove': [{'id': recipes[3].pk, 'result': 'absent'}],
+    }
+    new.refresh_from_db()
+    assert new.favorites_count == 1
+    assert user_client.get(f'/api/recipes/{new.pk}/').json()['is_favorited']
+
+
+@pytest.mark.django_db
+def test_batch_subscribe_results(user, user_client, authors):
+    other = create_user('other')
+    response = user_client.post('/api/users/subscribe/batch/', {
+        'add': [user.pk, authors[0].pk, other.pk],
+    }, format='json')
+    assert response.status_code == 200
+    assert response.json()['add'] == [
+        {'id': user.pk, 'result': 'self'},
+        {'id': authors[0].pk, 'result': 'added'},
+        {'id': other.pk, 'result': 'added'},
+    ]
+    response = user_client.post('/api/users/subscribe/batch/', {
+        'add': [authors[0].pk],
+    }, format='json')
+    assert response.json()['add'] == [
+        {'id': authors[0].pk, 'result': 'exists'}
+    ]
+    assert Follow.objects.filter(user=user).count() == 2
+
+
+@pytest.mark.django_db
+def test_batch_query_count_is_constant(user_client, recipes):
+    def count_queries(add, remove):
+        with CaptureQueriesContext(connection) as queries:
+            response = user_client.post('/api/recipes/favorite/batch/', {
+                'add': [recipe.pk for recipe in add],
+                'remove': [recipe.pk for recipe in remove],
+            }, format='json')
+        assert response.status_code == 200
+        return len(queries)
+
+    small = count_queries(recipes[1:2], recipes[0:1])
+    large = count_queries(recipes[3::2], recipes[2::2])
+    assert small == large
+
+
+@pytest.mark.django_db
+def test_batch_add_skips_concurrent_rows(user, user_client, recipes,
+                                         monkeypatch):
+    """Связь, вставленная в обход блокировки (например, в админке)
+    между проверкой и вставкой, не учитывается в счетчиках
+    и списке покупок."""
+    raced, new = recipes[1], recipes[3]
+    insert_links = batch.insert_links
+
+    def racing_insert(model, user_field, object_field, owner, object_ids):
+        ShoppingCart.objects.create(owner=user, recipe=raced)
+        return insert_links(
+            model, user_field, object_field, owner, object_ids
+        )
+
+    monkeypatch.setattr(batch, 'insert_links', racing_insert)
+    before = stored_amounts([user.pk])
+    response = user_client.post('/api/recipes/shopping_cart/batch/', {
+        'add': [raced.pk, new.pk],
+    }, format='json')
+    assert response.json()['add'] == [
+        {'id': raced.pk, 'result': 'exists'},
+        {'id': new.pk, 'result': 'added'},
+    ]
+    raced.refresh_from_db()
+    new.refresh_from_db()
+    assert (raced.in_carts_count, new.in_carts_count) == (0, 1)
+    changes = {
+        ingredient_id: amount - before.get((user.pk, ingredient_id), 0)
+        for (_, ingredient_id), amount in stored_amounts([user.pk]).items()
+    }
+    assert {key: value for key, value in changes.items() if value} == {
+        ingredient_id: amount
+        for ingredient_id, amount in recipe_amounts([new.pk]).items()
+    }
@@ -0,0 +1,110 @@
+import io
+
+import pytest
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from api.cache import (INGREDIENTS_CACHE_KEY, RECIPE_LIST_VERSION_KEY,
+                       TAGS_CACHE_KEY, get_versions)
+from api.ingredient_search import VERSION_CACHE_KEY
+from recipes.images import build_variants
+from recipes.models import Ingredient, Tag
+from recipes.versions import get_version
+
+
+def test_missing_version_is_not_reused():
+    """Версия, созданная после вытеснения ключа, не совпадает
+    с прежней, и старые ответы не читаются."""
+    first = get_versions([RECIPE_LIST_VERSION_KEY])
+    cache.delete(RECIPE_LIST_VERSION_KEY)
+    second = get_versions([RECIPE_LIST_VERSION_KEY])
+    assert first[RECIPE_LIST_VERSION_KEY] != '0'
+    assert first != second
+    assert get_versions([RECIPE_LIST_VERSION_KEY]) == second
+
+
+@pytest.mark.django_db
+def test_variants_invalidate_cached_recipe(
+        anon_client, recipes, settings, tmp_path,
+        django_capture_on_commit_callbacks):
+    settings.MEDIA_ROOT = str(tmp_path)
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 300)).save(buffer, 'PNG')
+    recipe = recipes[0]
+    default_storage.save(recipe.image.name, ContentFile(buffer.getvalue()))
+    url = f'/api/recipes/{recipe.pk}/'
+    assert anon_client.get(url).json()['image_srcset'] == {}
+    assert anon_client.get(url)['X-Cache'] == 'HIT'
+
+    with django_capture_on_commit_callbacks(execute=True):
+        build_variants(recipe.pk, recipe.image.name)
+
+    response = anon_client.get(url)
+    assert response['X-Cache'] == 'MISS'
+    assert set(response.json()['image_srcset']) == {'webp', 'jpeg'}
+
+
+@pytest.mark.django_db
+def test_tag_list_is_fresh_after_commit(
+        anon_client, django_capture_on_commit_callbacks):
+    """Список, закешированный запросом до коммита, сбрасывается
+    после коммита."""
+    Tag.objects.create(name='Завтрак', slug='breakfast')
+    anon_client.get('/api/tags/')
+    stale = cache.get(TAGS_CACHE_KEY)
+    with django_capture_on_commit_callbacks(execute=True):
+        Tag.objects.create(name='Ужин', slug='dinner')
+        # Параллельный запрос, прочитавший БД до коммита.
+        cache.set(TAGS_CACHE_KEY, stale)
+    slugs = [tag['slug'] for tag in anon_client.get('/api/tags/').json()]
+    assert slugs == ['breakfast', 'dinner']
+
+
+@pytest.mark.django_db
+def test_ingredient_index_is_fresh_after_commit(
+        anon_client, django_capture_on_commit_callbacks):
+    Ingredient.objects.create(name='Соль', measurement_unit='г')
+    anon_client.get('/api/ingredients/')
+    stale = cache.get(INGREDIENTS_CACHE_KEY)
+    version = get_version(VERSION_CACHE_KEY)
+    with django_capture_on_commit_callbacks(execute=True):
+        Ingredient.objects.create(name='Сахар', measurement_unit='г')
+        cache.set(INGREDIENTS_CACHE_KEY, stale)
+        # Индекс, загруженный до коммита, не получает новую версию.
+        assert get_version(VERSION_CACHE_KEY) == version
+    names = [
+        item['name'] for item in anon_client.get('/api/ingredients/').json()
+    ]
+    assert names == ['Сахар', 'Соль']
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url, create', [
+    ('/api/tags/', lambda number: Tag.objects.create(
+        name=f'Тег {number}', slug=f'tag{number}'
+    )),
+    ('/api/ingredients/', lambda number: Ingredient.objects.create(
+        name=f'Продукт {number}', measurement_unit='г'
+    )),
+])
+def test_list_etag(anon_client, django_capture_on_commit_callbacks,
+                   url, create):
+    create(1)
+    response = anon_client.get(url)
+    etag = response['ETag']
+    assert response.status_code == 200
+    assert etag.startswith('"')
+
+    response = anon_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response['ETag'] == etag
+    assert not response.content
+
+    with django_capture_on_commit_callbacks(execute=True):
+        create(2)
+    response = anon_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    assert len(response.json()) == 2
@@ -0,0 +1,44 @@
+from functools import wraps
+
+import pytest
+from django.db import connection
+
+from api.views import RecipesViewSet
+from recipes.models import Recipe
+
+
+@pytest.fixture
+def atomic_states(monkeypatch):
+    """Была ли открыта транзакция при вызове действий вьюсета."""
+    states = {}
+
+    def spy(action):
+        original = getattr(RecipesViewSet, action)
+
+        @wraps(original)
+        def wrapper(self, request, *args, **kwargs):
+            states[action] = connection.in_atomic_block
+            return original(self, request, *args, **kwargs)
+
+        return wrapper
+
+    for action in ('retrieve', 'favorite', 'partial_update', 'destroy'):
+        monkeypatch.setattr(RecipesViewSet, action, spy(action))
+    return states
+
+
+@pytest.mark.django_db(transaction=True)
+def test_only_unsafe_methods_are_atomic(user_client, user, atomic_states):
+    recipe = Recipe.objects.create(
+        author=user, name='Рецепт', text='Описание',
+        image='recipes/images/recipe.png', cooking_time=10
+    )
+    url = f'/api/recipes/{recipe.pk}/'
+    assert user_client.get(url).status_code == 200
+    assert user_client.post(f'{url}favorite/').status_code == 201
+    user_client.patch(url, {'cooking_time': 5}, format='json')
+    assert user_client.delete(url).status_code == 204
+    assert atomic_states == {
+        'retrieve': False, 'favorite': True,
+        'partial_update': True, 'destroy': True,
+    }
@@ -0,0 +1,61 @@
+import io
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from PIL import Image
+
+from recipes.images import schedule_variants
+from recipes.models import Recipe
+
+
+@pytest.fixture
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.RECIPE_IMAGE_SYNC = True
+
+
+def save_image(name):
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 300)).save(buffer, 'PNG')
+    default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def variant_names(recipe):
+    recipe.refresh_from_db()
+    return [
+        name
+        for widths in recipe.image_variants.values()
+        for name in widths.values()
+    ]
+
+
+@pytest.mark.django_db
+def test_variants_are_built_after_commit(
+        media, recipes, django_capture_on_commit_callbacks):
+    recipe = recipes[0]
+    save_image(recipe.image.name)
+    with django_capture_on_commit_callbacks(execute=True):
+        schedule_variants(recipe)
+        assert variant_names(recipe) == []
+    names = variant_names(recipe)
+    assert set(recipe.image_variants) == {'webp', 'jpeg'}
+    assert all(default_storage.exists(name) for name in names)
+
+
+@pytest.mark.django_db
+def test_backfill_builds_missing_variants(media, recipes):
+    """Рецепты без копий (задача потеряна) обрабатываются командой;
+    рецепт без файла не мешает остальным."""
+    save_image(recipes[0].image.name)
+    Recipe.objects.filter(pk=recipes[1].pk).update(image='recipes/lost.png')
+    Recipe.objects.exclude(
+        pk__in=[recipes[0].pk, recipes[1].pk]
+    ).update(image_variants={'webp': {'320': 'recipes/done.webp'}})
+    output, errors = io.StringIO(), io.StringIO()
+    call_command('build_image_variants', stdout=output, stderr=errors)
+    assert 'Обработано изображений: 1, ошибок: 1' in output.getvalue()
+    assert 'recipes/lost.png' in errors.getvalue()
+    assert variant_names(recipes[0])
+    assert variant_names(recipes[1]) == []
@@ -0,0 +1,81 @@
+import io
+
+import pytest
+from django.core.management import call_command
+
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from recipes.shopping_list import find_drift
+from users.models import Follow, User
+
+MODELS = (Ingredient, Tag, User)
+
+
+@pytest.fixture(autouse=True)
+def fast_hasher(settings):
+    settings.PASSWORD_HASHERS = [
+        'django.contrib.auth.hashers.MD5PasswordHasher'
+    ]
+
+
+def import_data(*args):
+    output = io.StringIO()
+    call_command('import_data', *args, stdout=output)
+    return output.getvalue()
+
+
+def counts():
+    return {model: model.objects.count() for model in MODELS}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('file_format', ('csv', 'json'))
+def test_rerun_adds_nothing(file_format):
+    import_data('--format', file_format)
+    imported = counts()
+    assert imported[Ingredient] > 0
+
+    output = import_data('--format', file_format)
+    assert counts() == imported
+    assert output.count('добавлено ') > 0
+    assert output.count('добавлено 0 ') == output.count('добавлено ')
+
+
+@pytest.mark.django_db
+def test_dry_run_writes_nothing():
+    output = import_data('--dry-run')
+    assert 'Пробный запуск' in output
+    assert counts() == dict.fromkeys(MODELS, 0)
+
+
+@pytest.mark.django_db
+def test_fixture_import(recipes, user, tmp_path):
+    path = tmp_path / 'dump.json'
+    call_command(
+        'dumpdata', 'users.User', 'users.Follow', 'recipes.Tag',
+        'recipes.Ingredient', 'recipes.Recipe', 'recipes.RecipeIngredient',
+        'recipes.Favorite', 'recipes.ShoppingCart', output=str(path)
+    )
+    favorites = set(Favorite.objects.values_list('owner_id', 'recipe_id'))
+    User.objects.all().delete()
+    Tag.objects.all().delete()
+    Ingredient.objects.all().delete()
+    assert not Recipe.objects.exists()
+
+    import_data('--fixture', str(path))
+    assert set(Recipe.objects.values_list('pk', flat=True)) == {
+        recipe.pk for recipe in recipes
+    }
+    assert set(
+        Favorite.objects.values_list('owner_id', 'recipe_id')
+    ) == favorites
+    assert Follow.objects.filter(user=user).count() == 3
+    recipe = Recipe.objects.get(pk=recipes[0].pk)
+    assert recipe.favorites_count == 1
+    assert recipe.tags.count() == 1
+    assert ShoppingCart.objects.exists()
+    assert ShoppingListItem.objects.exists()
+    assert find_drift([user.pk]) == {}
+
+    import_data('--fixture', str(path))
+    assert Recipe.objects.count() == len(recipes)
@@ -0,0 +1,53 @@
+import pytest
+
+from api.ingredient_search import IngredientIndex
+from recipes.models import Ingredient
+
+
+@pytest.fixture
+def index(db):
+    Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit='г')
+        for name in ('Сахарная пудра', 'Ванильный сахар', 'сахар',
+                     'Соль', 'Тростниковый Сахар')
+    )
+    return IngredientIndex()
+
+
+def names(items):
+    return [item['name'] for item in items]
+
+
+def test_prefix_matches_come_first(index):
+    assert names(index.search('сах')) == [
+        'сахар', 'Сахарная пудра', 'Ванильный сахар', 'Тростниковый Сахар'
+    ]
+
+
+def test_search_is_case_insensitive(index):
+    assert names(index.search('САХАР')) == names(index.search('сахар'))
+    assert names(index.search('СоЛ')) == ['Соль']
+
+
+def test_limit(index):
+    assert names(index.search('сах', limit=1)) == ['сахар']
+    assert names(index.search('сах', limit=3)) == [
+        'сахар', 'Сахарная пудра', 'Ванильный сахар'
+    ]
+
+
+def test_rebuilt_after_invalidation(index):
+    assert names(index.search('мед')) == []
+    # bulk_create не отправляет сигналов: индекс не сброшен.
+    Ingredient.objects.bulk_create([
+        Ingredient(name='Мед', measurement_unit='г')
+    ])
+    assert names(index.search('мед')) == []
+    index.invalidate()
+    assert names(index.search('мед')) == ['Мед']
+
+
+@pytest.mark.django_db
+def test_api_limit(anon_client, index):
+    response = anon_client.get('/api/ingredients/?name=сах&limit=2')
+    assert names(response.json()) == ['сахар', 'Сахарная пудра']
@@ -0,0 +1,53 @@
+import re
+
+import pytest
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .conftest import create_user
+
+SERVER_TIMING_RE = re.compile(
+    r'db;dur=[\d.]+;desc="(\d+) queries", view;dur=[\d.]+, '
+    r'render;dur=[\d.]+, total;dur=[\d.]+'
+)
+
+
+def token_client(user):
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}'
+    )
+    return client
+
+
+@pytest.mark.django_db
+def test_server_timing(user_client, recipes):
+    response = user_client.get('/api/recipes/')
+    match = SERVER_TIMING_RE.fullmatch(response['Server-Timing'])
+    assert match
+    assert int(match.group(1)) > 0
+
+
+@pytest.mark.django_db
+def test_metrics_allowed_ips(client, anon_client, settings):
+    anon_client.get('/api/tags/')
+    response = client.get('/metrics/', REMOTE_ADDR='127.0.0.1')
+    assert response.status_code == 200
+    assert 'foodgram_requests_total{' in response.content.decode()
+    settings.METRICS_ALLOWED_IPS = ['10.0.0.1']
+    assert client.get('/metrics/').status_code == 403
+
+
+@pytest.mark.django_db
+def test_profile_is_staff_only(user):
+    response = token_client(user).get('/api/tags/', HTTP_X_PROFILE='1')
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/json'
+
+    staff = create_user('staff')
+    staff.is_staff = True
+    staff.save()
+    response = token_client(staff).get('/api/tags/', HTTP_X_PROFILE='1')
+    assert response['Content-Type'].startswith('text/plain')
+    assert 'function calls' in response.content.decode()
+    assert SERVER_TIMING_RE.fullmatch(response['Server-Timing'])
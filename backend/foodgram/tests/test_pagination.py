@@ -0,0 +1,92 @@
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from recipes.models import Recipe
+from .conftest import RECIPES, create_user
+
+LIMIT: int = 3
+
+
+@pytest.fixture
+def ranked(recipes):
+    call_command('rank_recipes')
+    return recipes
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('params', ('pagination=cursor', 'cursor=abc'))
+def test_popular_ignores_cursor_mode(anon_client, ranked, params):
+    """Список id из рейтинга разбивается на страницы, а не курсором."""
+    response = anon_client.get(
+        f'/api/recipes/popular/?{params}&limit={LIMIT}'
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert 0 < data['count'] <= RECIPES
+    assert len(data['results']) == min(LIMIT, data['count'])
+
+
+@pytest.mark.django_db
+def test_what_to_cook_ignores_cursor_mode(anon_client, recipes):
+    ingredients = ','.join(
+        str(item.ingredient_id)
+        for item in recipes[-1].ingredients_recipes.all()[:2]
+    )
+    response = anon_client.get(
+        f'/api/recipes/what_to_cook/?ingredients={ingredients}'
+        f'&pagination=cursor&limit={LIMIT}'
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data['count'] > 0
+    assert len(data['results']) == min(LIMIT, data['count'])
+
+
+@pytest.mark.django_db
+def test_recipe_list_cursor_mode(anon_client, recipes):
+    response = anon_client.get(
+        f'/api/recipes/?pagination=cursor&limit={LIMIT}'
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert 'count' not in data
+    assert len(data['results']) == LIMIT
+    assert data['next']
+
+
+@pytest.fixture
+def feed_recipes(recipes):
+    """Рецепты подписок с одинаковой датой и рецепт чужого автора."""
+    stranger = create_user('stranger')
+    Recipe.objects.create(
+        author=stranger, name='Чужой рецепт', text='Описание',
+        image='recipes/images/recipe.png', cooking_time=5
+    )
+    Recipe.objects.update(pub_date=timezone.now())
+    return recipes
+
+
+@pytest.mark.django_db
+def test_feed_cursor_continuity(user_client, feed_recipes):
+    url, ids = f'/api/recipes/feed/?limit={LIMIT}', []
+    while url:
+        response = user_client.get(url)
+        assert response.status_code == 200
+        ids.extend(recipe['id'] for recipe in response.json()['results'])
+        url = response.json()['next']
+    assert ids == sorted(
+        (recipe.pk for recipe in feed_recipes), reverse=True
+    )
+
+
+@pytest.mark.django_db
+def test_feed_rejects_tampered_cursor(user_client, feed_recipes):
+    response = user_client.get(f'/api/recipes/feed/?limit={LIMIT}')
+    cursor = parse_qs(urlparse(response.json()['next']).query)['cursor'][0]
+    value, signature = cursor.rsplit(':', 1)
+    tampered = f'{value}:{signature[::-1]}'
+    response = user_client.get(f'/api/recipes/feed/?cursor={tampered}')
+    assert response.status_code == 404
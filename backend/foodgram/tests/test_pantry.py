@@ -0,0 +1,128 @@
+import pytest
+from django.core.cache import cache
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from recipes.pantry import CHANGE_CACHE_KEY, VERSION_CACHE_KEY, PantryIndex
+from recipes.versions import get_version
+
+
+@pytest.fixture
+def ingredients(db):
+    return [
+        Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in ('Мука', 'Яйцо', 'Молоко')
+    ]
+
+
+@pytest.fixture
+def pantry(user, ingredients):
+    """Рецепты с ингредиентами {мука, яйцо}, {мука}, {мука, яйцо,
+    молоко}."""
+    recipes = []
+    for number, count in enumerate((2, 1, 3)):
+        recipe = Recipe.objects.create(
+            author=user, name=f'Рецепт {number}', text='Описание',
+            image='recipe.png', cooking_time=10
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients[:count]
+        )
+        recipes.append(recipe)
+    return recipes
+
+
+def ids(*objects):
+    return [obj.pk for obj in objects]
+
+
+def test_match_orders_by_coverage(pantry, ingredients):
+    first, second, third = pantry
+    flour, egg, _ = ingredients
+    assert PantryIndex().match(ids(flour, egg)) == [
+        (first.pk, 2, 2), (second.pk, 1, 1), (third.pk, 2, 3)
+    ]
+
+
+def test_match_all(pantry, ingredients):
+    first, _, third = pantry
+    flour, egg, _ = ingredients
+    result = PantryIndex().match(ids(flour, egg), match_all=True)
+    assert [recipe_id for recipe_id, _, _ in result] == ids(first, third)
+
+
+def test_catch_up_reads_only_changed_recipes(
+        pantry, ingredients, monkeypatch,
+        django_capture_on_commit_callbacks):
+    first, second, third = pantry
+    flour, egg, milk = ingredients
+    index = PantryIndex()
+    index.match(ids(flour))
+
+    def reload():
+        raise AssertionError('Индекс загружен заново')
+
+    monkeypatch.setattr(index, '_load', reload)
+    with django_capture_on_commit_callbacks(execute=True):
+        RecipeIngredient.objects.create(
+            recipe=second, ingredient=milk, amount=1
+        )
+        index.record_change(second.pk)
+    assert index.match(ids(milk)) == [(second.pk, 1, 2), (third.pk, 1, 3)]
+
+    # Удаление рецепта попадает в журнал через сигнал post_delete.
+    with django_capture_on_commit_callbacks(execute=True):
+        third.delete()
+    assert index.match(ids(milk)) == [(second.pk, 1, 2)]
+    assert index.match(ids(flour, egg), match_all=True) == [
+        (first.pk, 2, 2)
+    ]
+
+
+def test_lost_change_reloads_index(pantry, ingredients, monkeypatch,
+                                   django_capture_on_commit_callbacks):
+    first, *_ = pantry
+    flour, _, milk = ingredients
+    index = PantryIndex()
+    index.match(ids(flour))
+    loads = []
+    load = index._load
+
+    def counted_load():
+        loads.append(True)
+        load()
+
+    monkeypatch.setattr(index, '_load', counted_load)
+    with django_capture_on_commit_callbacks(execute=True):
+        RecipeIngredient.objects.create(
+            recipe=first, ingredient=milk, amount=1
+        )
+        index.record_change(first.pk)
+    cache.delete(CHANGE_CACHE_KEY.format(
+        version=get_version(VERSION_CACHE_KEY)
+    ))
+    assert first.pk in [
+        recipe_id for recipe_id, _, _ in index.match(ids(milk))
+    ]
+    assert loads == [True]
+
+
+@pytest.mark.django_db
+def test_what_to_cook(anon_client, pantry, ingredients):
+    first, second, third = pantry
+    flour, egg, _ = ingredients
+    response = anon_client.get(
+        f'/api/recipes/what_to_cook/?ingredients={flour.pk},{egg.pk}'
+    )
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert [recipe['id'] for recipe in results] == ids(first, second, third)
+    assert [recipe['missing_count'] for recipe in results] == [0, 0, 1]
+
+    response = anon_client.get(
+        f'/api/recipes/what_to_cook/?ingredients={flour.pk}'
+        f'&ingredients={egg.pk}&match=all'
+    )
+    assert [
+        recipe['id'] for recipe in response.json()['results']
+    ] == ids(first, third)
@@ -0,0 +1,54 @@
+import pytest
+
+from .conftest import RECIPES
+
+# Число запросов к БД не должно зависеть от количества объектов
+# на странице: связанные объекты загружаются пакетно, признаки
+# пользователя вычисляются в SQL.
+RECIPE_LIST_QUERIES: int = 8
+RECIPE_DETAIL_QUERIES: int = 7
+SUBSCRIPTIONS_QUERIES: int = 6
+
+
+@pytest.mark.django_db
+def test_recipe_list_queries(user_client, recipes,
+                             django_assert_max_num_queries):
+    with django_assert_max_num_queries(RECIPE_LIST_QUERIES):
+        response = user_client.get(f'/api/recipes/?limit={RECIPES}')
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert len(results) == RECIPES
+    assert any(recipe['is_favorited'] for recipe in results)
+    assert any(recipe['is_in_shopping_cart'] for recipe in results)
+    assert all(recipe['author']['is_subscribed'] for recipe in results)
+
+
+@pytest.mark.django_db
+def test_recipe_list_anonymous_queries(anon_client, recipes,
+                                       django_assert_max_num_queries):
+    with django_assert_max_num_queries(RECIPE_LIST_QUERIES):
+        response = anon_client.get(f'/api/recipes/?limit={RECIPES}')
+    assert response.status_code == 200
+    assert len(response.json()['results']) == RECIPES
+
+
+@pytest.mark.django_db
+def test_recipe_detail_queries(user_client, recipes,
+                               django_assert_max_num_queries):
+    with django_assert_max_num_queries(RECIPE_DETAIL_QUERIES):
+        response = user_client.get(f'/api/recipes/{recipes[0].pk}/')
+    assert response.status_code == 200
+    assert response.json()['is_favorited']
+
+
+@pytest.mark.django_db
+def test_subscriptions_queries(user_client, authors, recipes,
+                               django_assert_max_num_queries):
+    with django_assert_max_num_queries(SUBSCRIPTIONS_QUERIES):
+        response = user_client.get(
+            f'/api/users/subscriptions/?limit={len(authors)}&recipes_limit=2'
+        )
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert len(results) == len(authors)
+    assert all(len(author['recipes']) <= 2 for author in results)
@@ -0,0 +1,154 @@
+import base64
+import io
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from api.validators import MAX_AMOUNT
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+
+def make_image(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+@pytest.fixture
+def payload(db):
+    tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+    ingredient = Ingredient.objects.create(name='Яйцо', measurement_unit='шт')
+    return {
+        'name': 'Омлет', 'text': 'Взбить и пожарить', 'cooking_time': 10,
+        'tags': [tag.pk], 'ingredients': [{'id': ingredient.pk, 'amount': 2}],
+        'image': make_image('red'),
+    }
+
+
+@pytest.mark.django_db
+def test_same_image_is_not_replaced(user_client, payload, settings,
+                                    tmp_path):
+    """Та же картинка не перезаписывается, даже если хранилище
+    добавило к имени файла суффикс."""
+    settings.MEDIA_ROOT = str(tmp_path)
+    response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == 201
+    payload['name'] = 'Омлет с сыром'
+    response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == 201
+    recipe = Recipe.objects.get(pk=response.json()['id'])
+    name = recipe.image.name
+    Recipe.objects.filter(pk=recipe.pk).update(
+        image_variants={'webp': {'8': 'recipes/images/variant.webp'}}
+    )
+
+    response = user_client.patch(
+        f'/api/recipes/{recipe.pk}/', payload, format='json'
+    )
+    assert response.status_code == 200
+    recipe.refresh_from_db()
+    assert recipe.image.name == name
+    assert recipe.image_variants
+
+    payload['image'] = make_image('blue')
+    response = user_client.patch(
+        f'/api/recipes/{recipe.pk}/', payload, format='json'
+    )
+    recipe.refresh_from_db()
+    assert recipe.image.name != name
+    assert recipe.image_variants == {}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('amount', [2.7, '1.5', 0, 40000, 'два'])
+def test_invalid_amount_is_rejected(user_client, payload, amount):
+    """Дробное количество не округляется, а отклоняется как и строка
+    с дробным числом; количество больше MAX_AMOUNT не доходит до БД."""
+    ingredient_id = payload['ingredients'][0]['id']
+    payload['ingredients'] = [{'id': ingredient_id, 'amount': amount}]
+    response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == 400
+    assert not Recipe.objects.exists()
+    assert {
+        'code': 'invalid_amount',
+        'message': 'Количество ингредиента должно быть целым числом '
+                   f'от 1 до {MAX_AMOUNT}',
+        'ids': [ingredient_id],
+    } in response.json()['ingredients']
+
+
+@pytest.fixture
+def recipe_with_ingredients(user_client, payload, settings, tmp_path):
+    """Рецепт с ингредиентами "Мука": 2, "Соль": 3, "Сахар": 4."""
+    settings.MEDIA_ROOT = str(tmp_path)
+    ingredients = [
+        Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in ('Мука', 'Соль', 'Сахар', 'Масло')
+    ]
+    payload['ingredients'] = [
+        {'id': ingredient.pk, 'amount': amount}
+        for ingredient, amount in zip(ingredients, (2, 3, 4))
+    ]
+    response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == 201
+    del payload['image']
+    return Recipe.objects.get(pk=response.json()['id']), ingredients
+
+
+def recipe_items(recipe):
+    return {
+        item.ingredient_id: (item.pk, item.amount)
+        for item in RecipeIngredient.objects.filter(recipe=recipe)
+    }
+
+
+@pytest.mark.django_db
+def test_update_changes_only_ingredient_diff(user_client, payload,
+                                             recipe_with_ingredients):
+    recipe, (flour, salt, sugar, butter) = recipe_with_ingredients
+    before = recipe_items(recipe)
+    payload['ingredients'] = [
+        {'id': flour.pk, 'amount': 2},
+        {'id': salt.pk, 'amount': 5},
+        {'id': butter.pk, 'amount': 1},
+    ]
+    response = user_client.patch(
+        f'/api/recipes/{recipe.pk}/', payload, format='json'
+    )
+    assert response.status_code == 200
+    after = recipe_items(recipe)
+    assert set(after) == {flour.pk, salt.pk, butter.pk}
+    # Неизменная строка и строка с новым количеством не пересоздаются.
+    assert after[flour.pk] == before[flour.pk]
+    assert after[salt.pk] == (before[salt.pk][0], 5)
+    assert after[butter.pk][1] == 1
+
+
+@pytest.mark.django_db
+def test_unchanged_update_writes_nothing(user_client, payload,
+                                         recipe_with_ingredients):
+    recipe, _ = recipe_with_ingredients
+    with CaptureQueriesContext(connection) as queries:
+        response = user_client.patch(
+            f'/api/recipes/{recipe.pk}/', payload, format='json'
+        )
+    assert response.status_code == 200
+    writes = [
+        query['sql'] for query in queries
+        if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+    ]
+    assert writes == []
+
+
+@pytest.mark.django_db
+def test_error_ids_keep_client_types(user_client, payload):
+    payload['tags'] = [payload['tags'][0], 999, 'x']
+    response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == 400
+    assert response.json() == {'tags': [
+        {'code': 'invalid', 'message': 'Теги: неверные id', 'ids': ['x']},
+        {'code': 'missing', 'message': 'Теги не найдены', 'ids': [999]},
+    ]}
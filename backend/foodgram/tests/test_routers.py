@@ -0,0 +1,49 @@
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import RequestFactory
+
+from foodgram.routers import RequestRouting, current, use_primary
+from recipes.models import Recipe
+from .conftest import REPLICA
+
+
+@pytest.fixture
+def recipe(replica, recipes):
+    """Рецепт, название которого на реплике еще старое."""
+    recipe = recipes[1]
+    replica()
+    Recipe.objects.filter(pk=recipe.pk).update(name='Новое название')
+    return recipe
+
+
+def get_name(client, recipe):
+    response = client.get(f'/api/recipes/{recipe.pk}/')
+    assert response.status_code == 200
+    return response.json()['name']
+
+
+def test_reads_go_to_replica_until_own_write(user_client, recipe):
+    assert get_name(user_client, recipe) == recipe.name
+
+    response = user_client.post(f'/api/recipes/{recipe.pk}/favorite/')
+    assert response.status_code == 201
+    # После своего изменения пользователь читает с основной БД.
+    assert get_name(user_client, recipe) == 'Новое название'
+
+    # Окно READ_YOUR_WRITES_WINDOW истекло.
+    cache.clear()
+    assert get_name(user_client, recipe) == recipe.name
+
+
+def test_use_primary_overrides_routing(recipe):
+    request = RequestFactory().get('/api/recipes/')
+    request.user = AnonymousUser()
+    token = current.set(RequestRouting(request, [REPLICA]))
+    try:
+        assert Recipe.objects.get(pk=recipe.pk).name == recipe.name
+        with use_primary():
+            name = Recipe.objects.get(pk=recipe.pk).name
+        assert name == 'Новое название'
+    finally:
+        current.reset(token)
@@ -0,0 +1,93 @@
+import pytest
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            Tag)
+from .conftest import create_user
+
+
+@pytest.fixture
+def soup(db):
+    return Tag.objects.create(name='Супы', slug='soup')
+
+
+@pytest.fixture
+def found(user, soup):
+    """Рецепты со словом "борщ" в названии, ингредиенте и описании
+    (по убыванию ранга) и рецепт без него."""
+    other = create_user('other')
+    ingredient = Ingredient.objects.create(
+        name='Борщевой набор', measurement_unit='г'
+    )
+    by_name = Recipe.objects.create(
+        author=user, name='Борщ красный', text='Суп', image='recipe.png',
+        cooking_time=60
+    )
+    by_ingredient = Recipe.objects.create(
+        author=user, name='Суп дня', text='Из набора', image='recipe.png',
+        cooking_time=30
+    )
+    RecipeIngredient.objects.create(
+        recipe=by_ingredient, ingredient=ingredient, amount=1
+    )
+    by_text = Recipe.objects.create(
+        author=other, name='Щи', text='Почти как борщ', image='recipe.png',
+        cooking_time=40
+    )
+    other_recipe = Recipe.objects.create(
+        author=user, name='Каша', text='Овсянка', image='recipe.png',
+        cooking_time=10
+    )
+    by_name.tags.set([soup])
+    by_text.tags.set([soup])
+    other_recipe.tags.set([soup])
+    Favorite.objects.create(owner=user, recipe=by_ingredient)
+    return by_name, by_ingredient, by_text, other_recipe
+
+
+def search(client, query):
+    response = client.get(f'/api/recipes/?search=борщ{query}')
+    assert response.status_code == 200
+    return [recipe['id'] for recipe in response.json()['results']]
+
+
+def ids(*recipes):
+    return [recipe.pk for recipe in recipes]
+
+
+@pytest.mark.django_db
+def test_results_are_ranked(user_client, found):
+    by_name, by_ingredient, by_text, _ = found
+    assert search(user_client, '') == ids(by_name, by_ingredient, by_text)
+
+
+@pytest.mark.django_db
+def test_search_with_filters(user_client, user, found):
+    by_name, by_ingredient, by_text, _ = found
+    assert search(user_client, '&tags=soup') == ids(by_name, by_text)
+    assert search(user_client, f'&author={user.pk}') == ids(
+        by_name, by_ingredient
+    )
+    assert search(user_client, '&is_favorited=1') == ids(by_ingredient)
+
+
+@pytest.mark.django_db
+def test_search_limit(user_client, found, settings):
+    settings.RECIPE_SEARCH_LIMIT = 2
+    by_name, by_ingredient, _, _ = found
+    assert search(user_client, '') == ids(by_name, by_ingredient)
+
+
+@pytest.mark.django_db
+def test_reindex_after_update(user_client, found, soup,
+                              django_capture_on_commit_callbacks):
+    *_, recipe = found
+    assert recipe.pk not in search(user_client, '')
+    ingredient = Ingredient.objects.create(name='Свекла',
+                                           measurement_unit='г')
+    with django_capture_on_commit_callbacks(execute=True):
+        response = user_client.patch(f'/api/recipes/{recipe.pk}/', {
+            'name': 'Борщ зеленый', 'tags': [soup.pk],
+            'ingredients': [{'id': ingredient.pk, 'amount': 1}],
+        }, format='json')
+    assert response.status_code == 200
+    assert recipe.pk in search(user_client, '')[:2]
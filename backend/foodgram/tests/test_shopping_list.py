@@ -0,0 +1,36 @@
+import pytest
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+def content(response):
+    return b''.join(response.streaming_content)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('file_format', ('txt', 'csv', 'json', 'pdf'))
+def test_download_requires_authentication(anon_client, file_format):
+    response = anon_client.get(f'{URL}?format={file_format}')
+    assert response.status_code == 401
+    assert b'detail' in response.content
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('file_format, media_type', (
+    ('txt', 'text/plain; charset=utf-8'),
+    ('csv', 'text/csv; charset=utf-8'),
+    ('json', 'application/json; charset=utf-8'),
+    ('pdf', 'application/pdf'),
+))
+def test_download_formats(user_client, recipes, file_format, media_type):
+    response = user_client.get(f'{URL}?format={file_format}')
+    assert response.status_code == 200
+    assert response['Content-Type'] == media_type
+    assert response['Content-Disposition'] == (
+        f'attachment; filename=shopping_cart.{file_format}'
+    )
+    body = content(response)
+    if file_format == 'pdf':
+        assert body.startswith(b'%PDF')
+    else:
+        assert 'Продукт 0'.encode() in body
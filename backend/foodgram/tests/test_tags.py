@@ -0,0 +1,38 @@
+import pytest
+
+from recipes.models import Recipe
+
+
+def numbers(queryset, recipes):
+    """Номера рецептов фикстуры recipes (с повторами, если они есть)."""
+    pks = [recipe.pk for recipe in recipes]
+    return sorted(
+        pks.index(pk) for pk in queryset.values_list('pk', flat=True)
+    )
+
+
+# В фикстуре recipes рецепт номер n имеет теги tag0..tag(n % 3).
+@pytest.mark.django_db
+@pytest.mark.parametrize('slugs, match_all, expected', [
+    (['tag1', 'tag2'], False, [1, 2, 4, 5, 7]),
+    (['tag1', 'tag2'], True, [2, 5]),
+    (['tag2', 'tag2'], False, [2, 5]),
+    (['tag2', 'tag2'], True, [2, 5]),
+    (['tag2', 'unknown'], False, [2, 5]),
+    (['tag2', 'unknown'], True, []),
+    (['unknown'], False, []),
+])
+def test_with_tags(recipes, slugs, match_all, expected):
+    queryset = Recipe.objects.with_tags(slugs, match_all=match_all)
+    assert numbers(queryset, recipes) == expected
+    assert 'DISTINCT' not in str(queryset.query)
+
+
+@pytest.mark.django_db
+def test_tags_filter_has_no_duplicates(anon_client, recipes):
+    response = anon_client.get(
+        '/api/recipes/?tags=tag0&tags=tag1&tags=tag2&limit=100'
+    )
+    ids = [recipe['id'] for recipe in response.json()['results']]
+    assert response.json()['count'] == len(recipes)
+    assert sorted(ids) == sorted(recipe.pk for recipe in recipes)
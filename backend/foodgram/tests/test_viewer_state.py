@@ -0,0 +1,57 @@
+import pytest
+from django.core.cache import cache
+from django.test import RequestFactory
+
+from api.viewer_state import ViewerState, get_cache_key
+from foodgram.routers import RequestRouting, current
+from recipes.models import Favorite
+from .conftest import REPLICA
+
+
+@pytest.mark.django_db
+def test_change_during_load_is_not_lost(user, recipes, monkeypatch,
+                                        django_capture_on_commit_callbacks):
+    """Изменение, зафиксированное между чтением БД и записью в кеш,
+    видно следующему запросу."""
+    recipe = recipes[1]
+    key = get_cache_key(user.pk, 'favorites')
+    cache_set = cache.set
+
+    def set_after_change(cache_key, *args, **kwargs):
+        if cache_key == key:
+            monkeypatch.undo()
+            with django_capture_on_commit_callbacks(execute=True):
+                Favorite.objects.create(owner=user, recipe=recipe)
+        cache_set(cache_key, *args, **kwargs)
+
+    monkeypatch.setattr(cache, 'set', set_after_change)
+    assert not ViewerState(user).is_favorited(recipe.pk)
+    assert ViewerState(user).is_favorited(recipe.pk)
+
+
+@pytest.mark.django_db
+def test_write_through_updates_cached_state(
+        user, recipes, django_assert_num_queries,
+        django_capture_on_commit_callbacks):
+    recipe = recipes[1]
+    ViewerState(user).ids('favorites')
+    with django_capture_on_commit_callbacks(execute=True):
+        Favorite.objects.create(owner=user, recipe=recipe)
+    with django_assert_num_queries(0):
+        assert ViewerState(user).is_favorited(recipe.pk)
+
+
+def test_load_reads_primary(replica, user, recipes):
+    """Состояние загружается с основной БД, даже если запрос
+    читает с отстающей реплики."""
+    replica()
+    recipe = recipes[1]
+    Favorite.objects.create(owner=user, recipe=recipe)
+    request = RequestFactory().get('/api/recipes/')
+    request.user = user
+    token = current.set(RequestRouting(request, [REPLICA]))
+    try:
+        assert not Favorite.objects.filter(recipe=recipe).exists()
+        assert ViewerState(user).is_favorited(recipe.pk)
+    finally:
+        current.reset(token)
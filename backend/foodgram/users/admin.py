@@ -2,12 +2,15 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
 
+from recipes.admin import CounterAdminMixin
+from recipes.models import Favorite, ShoppingCart
 from .models import User, Follow
 
 
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(CounterAdminMixin, UserAdmin):
     list_display = (
-        'id', 'username', 'email', 'first_name', 'last_name', 'is_staff'
+        'id', 'username', 'email', 'first_name', 'last_name', 'is_staff',
+        'recipes_count', 'followers_count'
     )
     list_filter = (
         'email', 'username'
@@ -21,8 +24,18 @@ class CustomUserAdmin(UserAdmin):
     empty_value_display = '-пусто-'
     list_per_page = 30
 
+    def counted_objects(self, objects):
+        # Подписки, избранное и корзины пользователя удаляются каскадно
+        # вместе с ним; рецепты автора - тоже, их счетчики не нужны.
+        users = [user.pk for user in objects]
+        return [
+            (Follow, list(Follow.objects.filter(user__in=users))),
+            (Favorite, list(Favorite.objects.filter(owner__in=users))),
+            (ShoppingCart, list(ShoppingCart.objects.filter(owner__in=users))),
+        ]
 
-class FollowAdmin(admin.ModelAdmin):
+
+class FollowAdmin(CounterAdminMixin, admin.ModelAdmin):
     list_display = (
         'user', 'author'
     )